@@ -1,26 +1,104 @@
 from typing import List, Tuple, Dict, Optional
 
+import numpy as np
+
 from utils import ActionSpecification, AgentStatus, Cards
+from state import GameState, HIDDEN, VISIBLE, COINS, VIEW, VIEW_OWNER, EMPTY
+from state import HAND_CARDS
+from history import EventLog
+
+CARDS = list(Cards)
+# the cards of every packed hand, see state.HAND_CARDS, and None for the codes of
+# card values no card has
+HANDS = [
+    tuple(CARDS[card] for card in cards) if max(cards, default=0) < len(CARDS) else None
+    for cards in HAND_CARDS
+]
 
 
 class Agent:
+    """
+    a player of a game. The cards and coins live in the game's GameState record,
+    which the properties below read and write, and the history is rendered from the
+    game's event log. The cards are returned as tuples, since changing them in
+    place would not reach the record; assign a new list instead.
+    """
+
+    __slots__ = (
+        "game",
+        "events",
+        "index",
+        "name",
+        "is_bot",
+        "current_actions",
+        "status",
+        "observation",
+    )
+
     def __init__(
         self,
-        hidden_cards: List[Cards],
-        coins: int = 2,
+        game: GameState,
+        events: EventLog,
+        index: int,
         name: Optional[str] = None,
         is_bot: bool = True,
         status: Optional[AgentStatus] = None,
     ) -> None:
-        self.hidden_cards = hidden_cards
-        self.coins = coins
+        self.game = game
+        self.events = events
+        self.index = index
         self.name = name
         self.is_bot = is_bot
         self.current_actions: List[ActionSpecification] = []
         self.status = status
-        self.visible_cards = []
-        self.observation: Optional[List[int]] = None
+        self.observation: Optional[np.ndarray] = None
+
+    @property
+    def history(self) -> str:
+        """
+        the history of the game as seen by this player
+        """
+        return self.events.render(self.index)
+
+    @property
+    def hidden_cards(self) -> Tuple[Cards, ...]:
+        return HANDS[self.game.data[self.game.player(self.index) + HIDDEN]]
+
+    @hidden_cards.setter
+    def hidden_cards(self, cards: List[Cards]):
+        offset = self.game.player(self.index) + HIDDEN
+        self.game.set_hand(offset, [card.value for card in cards])
+
+    @property
+    def visible_cards(self) -> Tuple[Cards, ...]:
+        return HANDS[self.game.data[self.game.player(self.index) + VISIBLE]]
+
+    @visible_cards.setter
+    def visible_cards(self, cards: List[Cards]):
+        offset = self.game.player(self.index) + VISIBLE
+        self.game.set_hand(offset, [card.value for card in cards])
+
+    @property
+    def coins(self) -> int:
+        return self.game.data[self.game.player(self.index) + COINS]
+
+    @coins.setter
+    def coins(self, coins: int):
+        self.game.data[self.game.player(self.index) + COINS] = coins
+        self.game.version += 1
 
-        self.ambassador_center_view: Optional[List[Cards]] = None
-        self.history = ""
+    @property
+    def ambassador_center_view(self) -> Optional[Tuple[Cards, ...]]:
+        if self.game.data[VIEW_OWNER] != self.index:
+            return None
+        return HANDS[self.game.data[VIEW]]
 
+    @ambassador_center_view.setter
+    def ambassador_center_view(self, cards: Optional[List[Cards]]):
+        if cards is None:
+            if self.game.data[VIEW_OWNER] == self.index:
+                self.game.data[VIEW_OWNER] = EMPTY
+                self.game.set_hand(VIEW, [])
+        else:
+            self.game.data[VIEW_OWNER] = self.index
+            self.game.set_hand(VIEW, [card.value for card in cards])
@@ -0,0 +1,252 @@
+"""
+Benchmarks of the Coup environment: micro benchmarks of snapshot and restore, and a
+suite of whole games measuring steps/s, games/s, mean game length and peak memory of
+raw_env and the env() wrapper stack, for 2 to 6 players, random and scripted
+policies and verbose on and off.
+
+Run with `python benchmark.py --output results.json`.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+import copy
+
+import numpy as np
+
+import env as coup
+from env import raw_env
+from selfplay import Policy, random_policy, scripted_policy
+
+POLICIES = {"random": random_policy, "scripted": scripted_policy}
+# a search loop snapshots and restores once per simulation, so both should stay in
+# single digit microseconds
+SNAPSHOT_TARGET_US = 10.0
+
+
+def play_random(env: raw_env, steps: int, seed: int = 0):
+    """
+    plays up to steps random actions, stopping early if the game ends
+    """
+    rng = random.Random(seed)
+    for _ in range(steps):
+        if env.done:
+            return
+        agent = env.players[int(env.agent_selection)]
+        env.step(rng.randrange(len(agent.current_actions)))
+
+
+def bench_snapshot(player_count: int = 2, number: int = 100000) -> dict:
+    """
+    measures raw_env.snapshot and raw_env.restore against copy.deepcopy of the env,
+    in microseconds per call, from a position a few turns into a game. The full
+    snapshot copies the random generator's state of 625 ints and misses
+    SNAPSHOT_TARGET_US, which is why searches snapshot with rng=False.
+    """
+    env = raw_env(player_count=player_count)
+    env.reset(seed=0)
+    play_random(env, 20)
+
+    snapshot = env.snapshot()
+    snapshot_without_rng = env.snapshot(rng=False)
+    results = {
+        "snapshot": timeit.timeit(env.snapshot, number=number) / number * 1e6,
+        "snapshot_without_rng": timeit.timeit(
+            lambda: env.snapshot(rng=False), number=number
+        )
+        / number
+        * 1e6,
+        "restore": timeit.timeit(lambda: env.restore(snapshot), number=number)
+        / number
+        * 1e6,
+        "restore_without_rng": timeit.timeit(
+            lambda: env.restore(snapshot_without_rng), number=number
+        )
+        / number
+        * 1e6,
+    }
+    deepcopy_number = max(number // 100, 1)
+    results["deepcopy"] = (
+        timeit.timeit(lambda: copy.deepcopy(env), number=deepcopy_number)
+        / deepcopy_number
+        * 1e6
+    )
+    return results
+
+
+def bench_reset(player_count: int = 2, number: int = 20000) -> dict:
+    """
+    measures raw_env.reset against raw_env.reset_in_place, in microseconds per call
+    """
+    env = raw_env(player_count=player_count)
+    env.reset(seed=0)
+    return {
+        "reset": timeit.timeit(env.reset, number=number) / number * 1e6,
+        "reset_in_place": timeit.timeit(env.reset_in_place, number=number)
+        / number
+        * 1e6,
+    }
+
+
+def play_games(
+    env, policy: Policy, games: int, seed: int, max_steps: int = 1000
+) -> dict:
+    """
+    plays games through env (a raw_env or a wrapped one) the way a training loop
+    would, calling last() before every step, and counts the steps, finished and
+    truncated games and games that raised
+    """
+    raw = env.unwrapped
+    rng = random.Random(seed)
+    env.reset(seed=seed)
+    steps = finished = truncated = errors = 0
+    for _ in range(games):
+        if finished + truncated + errors:
+            env.reset()
+        try:
+            for _ in range(max_steps):
+                if raw.done:
+                    break
+                env.last()
+                env.step(policy(raw, rng))
+                steps += 1
+            if raw.done:
+                finished += 1
+            else:
+                truncated += 1
+        except Exception:
+            errors += 1
+    return {
+        "steps": steps,
+        "finished": finished,
+        "truncated": truncated,
+        "errors": errors,
+    }
+
+
+def bench_games(
+    player_count: int = 2,
+    policy: str = "random",
+    verbose: bool = False,
+    wrapped: bool = False,
+    games: int = 200,
+    memory_games: int = 5,
+    seed: int = 0,
+    fast: bool = False,
+) -> dict:
+    """
+    measures whole games of one configuration. Verbose output goes to os.devnull, so
+    the formatting is measured but not the terminal. Peak memory is traced over a
+    separate run of memory_games games, as tracing slows the game down.
+    """
+
+    def make():
+        kwargs = dict(
+            player_count=player_count, verbose=verbose, fixed_actions=True, fast=fast
+        )
+        if wrapped:
+            return coup.env(**kwargs)
+        return raw_env(**kwargs)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        env = make()
+        start = time.perf_counter()
+        counts = play_games(env, POLICIES[policy], games, seed)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        play_games(make(), POLICIES[policy], memory_games, seed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    played = counts["finished"] + counts["truncated"]
+    return {
+        "player_count": player_count,
+        "policy": policy,
+        "verbose": verbose,
+        "wrapped": wrapped,
+        "fast": fast,
+        "games": games,
+        **counts,
+        "seconds": elapsed,
+        "steps_per_second": counts["steps"] / elapsed,
+        "games_per_second": played / elapsed,
+        "mean_game_length": counts["steps"] / played if played else None,
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+def run_suite(games: int = 200, seed: int = 0) -> dict:
+    """
+    runs bench_snapshot, bench_reset and bench_games over every player count,
+    policy, verbose setting and wrapper, with the machine and versions they ran on
+    """
+    results = []
+    for player_count in range(2, 7):
+        for policy in POLICIES:
+            for verbose in [False, True]:
+                for wrapped in [False, True]:
+                    results.append(
+                        bench_games(
+                            player_count, policy, verbose, wrapped, games, seed=seed
+                        )
+                    )
+            # the fast mode only matters when the steps are not printed
+            for wrapped in [False, True]:
+                results.append(
+                    bench_games(
+                        player_count,
+                        policy,
+                        False,
+                        wrapped,
+                        games,
+                        seed=seed,
+                        fast=True,
+                    )
+                )
+    return {
+        "machine": {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+        },
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "snapshot": bench_snapshot(),
+        "reset": bench_reset(),
+        "games": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default=None, help="file to write the JSON to")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    suite = run_suite(args.games, args.seed)
+    for name, microseconds in suite["snapshot"].items():
+        missed = name != "deepcopy" and microseconds >= SNAPSHOT_TARGET_US
+        note = f" (misses the {SNAPSHOT_TARGET_US:.0f} us target)" if missed else ""
+        print(f"{name}: {microseconds:.2f} us{note}")
+    for name, microseconds in suite["reset"].items():
+        print(f"{name}: {microseconds:.2f} us")
+    for r in suite["games"]:
+        print(
+            f"{r['player_count']}p {r['policy']:8} verbose={r['verbose']!s:5} "
+            f"wrapped={r['wrapped']!s:5} fast={r['fast']!s:5} "
+            f"{r['steps_per_second']:9.0f} steps/s "
+            f"{r['games_per_second']:7.0f} games/s {r['peak_memory_kib']:7.0f} KiB "
+            f"errors={r['errors']} truncated={r['truncated']}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(suite, f, indent=2)
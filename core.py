@@ -0,0 +1,921 @@
+"""
+The integer core of the Coup engine.
+
+CoupCore plays a game stored in a GameState record using nothing but ints: seats
+are player indices, and statuses, actions and cards are the values of AgentStatus,
+Action and Cards. raw_env wraps it and converts to and from the string agent ids
+and enums of the pettingzoo API at its boundary.
+"""
+import functools
+import random
+from typing import Callable, Dict, List, Tuple
+
+import state
+from state import EMPTY, GameState
+from history import Event, EventLog, event_to_string
+import history
+from utils import (
+    ACTION_TO_CARD,
+    IS_FULLY_SPECIFIED,
+    SPECIFY_OPPONENT,
+    Action,
+    AgentStatus,
+    Cards,
+    action_columns,
+    map_combinations,
+)
+
+# statuses
+TURN = AgentStatus.TURN.value
+STOLEN = AgentStatus.STOLEN.value
+ASSASSINATED = AgentStatus.ASSASSINATED.value
+CAN_CHALLENGE = AgentStatus.CAN_CHALLENGE.value
+CAN_BLOCK_FOREIGN_AID = AgentStatus.CAN_BLOCK_FOREIGN_AID.value
+LOSE_INFLUENCE = AgentStatus.LOSE_INFLUENCE.value
+AMBASSADOR_EXCHANGE = AgentStatus.AMBASSADOR_EXCHANGE.value
+
+# actions
+AMBASSADOR = Action.AMBASSADOR.value
+ASSASSIN = Action.ASSASSIN.value
+CAPTAIN = Action.CAPTAIN.value
+DUKE = Action.DUKE.value
+INCOME = Action.INCOME.value
+FOREIGN_AID = Action.FOREIGN_AID.value
+COUP = Action.COUP.value
+CHALLENGE = Action.CHALLENGE.value
+NO_CHALLENGE = Action.NO_CHALLENGE.value
+BLOCK_FOREIGN_AID = Action.BLOCK_FOREIGN_AID.value
+LET_FOREIGN_AID = Action.LET_FOREIGN_AID.value
+BLOCK_STEAL_WITH_AMBASSADOR = Action.BLOCK_STEAL_WITH_AMBASSADOR.value
+BLOCK_STEAL_WITH_CAPTAIN = Action.BLOCK_STEAL_WITH_CAPTAIN.value
+LET_STEAL = Action.LET_STEAL.value
+BLOCK_ASSASSINATION = Action.BLOCK_ASSASSINATION.value
+LET_ASSASSINATION = Action.LET_ASSASSINATION.value
+LOSE_INFLUENCE_ACTION = Action.LOSE_INFLUENCE.value
+AMBASSADOR_EXCHANGE_3 = Action.AMBASSADOR_EXCHANGE_3.value
+AMBASSADOR_EXCHANGE_4 = Action.AMBASSADOR_EXCHANGE_4.value
+
+# cards
+CONTESSA_CARD = Cards.CONTESSA.value
+DUKE_CARD = Cards.DUKE.value
+
+# card claimed by each action, indexed by action (EMPTY if it claims nothing)
+CLAIMED_CARD = [
+    ACTION_TO_CARD[action].value if action in ACTION_TO_CARD else EMPTY
+    for action in Action
+]
+# whether each action takes no target, indexed by action
+FULLY_SPECIFIED = [IS_FULLY_SPECIFIED.get(action, False) for action in Action]
+
+STEAL_BLOCKS = (BLOCK_STEAL_WITH_AMBASSADOR, BLOCK_STEAL_WITH_CAPTAIN)
+# blocks are only answered by the turn agent
+BLOCKS = STEAL_BLOCKS + (BLOCK_ASSASSINATION,)
+
+CLAIM_KINDS = {
+    CAPTAIN: history.CLAIM_STEAL,
+    BLOCK_STEAL_WITH_AMBASSADOR: history.CLAIM_BLOCK_STEAL,
+    BLOCK_STEAL_WITH_CAPTAIN: history.CLAIM_BLOCK_STEAL,
+}
+
+# CoupCore.step dispatches on the status and the action played to these handlers
+STEP_HANDLERS: Dict[Tuple[int, int], str] = {
+    (TURN, INCOME): "_step_income",
+    (TURN, FOREIGN_AID): "_step_foreign_aid",
+    (TURN, COUP): "_step_coup",
+    (TURN, DUKE): "_step_claim",
+    (TURN, ASSASSIN): "_step_claim",
+    (TURN, CAPTAIN): "_step_claim",
+    (TURN, AMBASSADOR): "_step_claim",
+    (CAN_BLOCK_FOREIGN_AID, BLOCK_FOREIGN_AID): "_step_foreign_aid_reaction",
+    (CAN_BLOCK_FOREIGN_AID, LET_FOREIGN_AID): "_step_foreign_aid_reaction",
+    (CAN_CHALLENGE, CHALLENGE): "_step_challenge_reaction",
+    (CAN_CHALLENGE, NO_CHALLENGE): "_step_challenge_reaction",
+    (ASSASSINATED, BLOCK_ASSASSINATION): "_step_claim",
+    (ASSASSINATED, LET_ASSASSINATION): "_step_let_assassination",
+    (STOLEN, BLOCK_STEAL_WITH_AMBASSADOR): "_step_claim",
+    (STOLEN, BLOCK_STEAL_WITH_CAPTAIN): "_step_claim",
+    (STOLEN, LET_STEAL): "_step_let_steal",
+    (LOSE_INFLUENCE, LOSE_INFLUENCE_ACTION): "_step_lose_influence",
+    (AMBASSADOR_EXCHANGE, AMBASSADOR_EXCHANGE_3): "_step_ambassador_exchange",
+    (AMBASSADOR_EXCHANGE, AMBASSADOR_EXCHANGE_4): "_step_ambassador_exchange",
+}
+
+# what happens when no one challenges a claim
+UNCHALLENGED = {
+    DUKE: "_unchallenged_duke",
+    ASSASSIN: "_unchallenged_assassin",
+    CAPTAIN: "_unchallenged_captain",
+    AMBASSADOR: "_unchallenged_ambassador",
+    BLOCK_ASSASSINATION: "_end_turn",
+    BLOCK_STEAL_WITH_AMBASSADOR: "_end_turn",
+    BLOCK_STEAL_WITH_CAPTAIN: "_end_turn",
+}
+
+# the actions offered in each status, in the order of raw_env's current_actions
+TURN_ACTIONS = [INCOME, FOREIGN_AID, AMBASSADOR, CAPTAIN, DUKE, ASSASSIN]
+REACTIONS = {
+    STOLEN: [BLOCK_STEAL_WITH_AMBASSADOR, BLOCK_STEAL_WITH_CAPTAIN, LET_STEAL],
+    ASSASSINATED: [BLOCK_ASSASSINATION, LET_ASSASSINATION],
+    LOSE_INFLUENCE: [LOSE_INFLUENCE_ACTION],
+    CAN_CHALLENGE: [CHALLENGE, NO_CHALLENGE],
+    CAN_BLOCK_FOREIGN_AID: [BLOCK_FOREIGN_AID, LET_FOREIGN_AID],
+}
+SPECIFIES_OPPONENT = [SPECIFY_OPPONENT.get(action, False) for action in Action]
+
+AMBASSADOR_MAPPINGS = {
+    AMBASSADOR_EXCHANGE_3: map_combinations(3, 1),
+    AMBASSADOR_EXCHANGE_4: map_combinations(4, 2),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def exchange_targets(hidden: int, view: int) -> Tuple[int, ...]:
+    """
+    returns, for each target of the exchange of the hidden and view hands, the
+    first target that keeps the same cards. Keep-choices that differ only in which
+    of two equal cards they keep lead to the same game, so only the targets that
+    are their own canonical target are offered.
+    """
+    cards = state.HAND_CARDS[hidden] + state.HAND_CARDS[view]
+    if state.HAND_SIZE[hidden] == 2:
+        mapping = AMBASSADOR_MAPPINGS[AMBASSADOR_EXCHANGE_4]
+    else:
+        mapping = AMBASSADOR_MAPPINGS[AMBASSADOR_EXCHANGE_3]
+    first: Dict[Tuple[int, ...], int] = {}
+    for target, keep in enumerate(mapping):
+        first.setdefault(tuple(sorted(cards[index] for index in keep)), target)
+    return tuple(
+        first[tuple(sorted(cards[index] for index in keep))] for keep in mapping
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def seat_tables(
+    player_count: int,
+) -> Tuple[List[List[int]], List[List[Tuple[int, ...]]]]:
+    """
+    returns the next alive seat after each seat and the alive seats other than
+    each seat in seat order, both indexed by the TERMINATIONS bitmask and then by
+    seat. The next seat is EMPTY when no other seat is alive.
+    """
+    next_alive = []
+    opponents = []
+    for terminations in range(1 << player_count):
+        alive = [i for i in range(player_count) if not terminations >> i & 1]
+        row = []
+        for seat in range(player_count):
+            later = [i for i in alive if i > seat] + [i for i in alive if i < seat]
+            row.append(later[0] if later else EMPTY)
+        next_alive.append(row)
+        opponents.append(
+            [tuple(i for i in alive if i != seat) for seat in range(player_count)]
+        )
+    return next_alive, opponents
+
+
+class CoupCore:
+    """
+    Plays the game in a GameState record. Moves are (action, target) ints, with
+    target EMPTY for actions that take none; step() assumes the move is legal, so
+    checking it is up to the caller. Every event is appended to events and every
+    random draw comes from rng.
+
+    A claim or a foreign aid is answered by every alive player other than the turn
+    agent in ascending seat order, and a block by the turn agent alone. The seats
+    still to answer are queued in the RESPONDERS bitmask when the window opens, and
+    the window is resolved as soon as the queue is empty.
+    """
+
+    __slots__ = (
+        "player_count",
+        "game",
+        "data",
+        "events",
+        "rng",
+        "verbose",
+        "handlers",
+        "columns",
+        "next_seats",
+        "opponents",
+        "templates",
+        "blank",
+    )
+
+    def __init__(
+        self,
+        player_count: int,
+        rng: random.Random,
+        verbose: bool = False,
+    ):
+        self.player_count = player_count
+        self.rng = rng
+        self.verbose = verbose
+        self.game = GameState(player_count)
+        self.data = self.game.data
+        # the record of a game before the deal, copied by new_game
+        self.blank = self.data[:]
+        self.events = EventLog()
+        # the fixed action indices of each action, see utils.action_columns
+        columns = action_columns(player_count)
+        self.columns = [columns[action] for action in Action]
+        self.next_seats, self.opponents = seat_tables(player_count)
+        # legal actions by decision context, see legal_actions
+        self.templates: Dict[Tuple[int, ...], Tuple[int, ...]] = {}
+        self.handlers: Dict[Tuple[int, int], Callable[[int, int, int], None]] = {}
+        self.reset_handlers()
+
+    def reset_handlers(self):
+        self.handlers = {
+            key: getattr(self, name) for key, name in STEP_HANDLERS.items()
+        }
+
+    def new_game(self, in_place: bool = False):
+        """
+        deals a new game into a fresh record and event log, or with in_place into
+        the current ones, which anything holding them then sees. Both make the same
+        draws.
+        """
+        if in_place:
+            self.data[:] = self.blank
+            self.game.version += 1
+            self.events.clear()
+        else:
+            self.game = GameState(self.player_count, self.blank[:])
+            self.data = self.game.data
+            self.events = EventLog()
+        data = self.data
+
+        # three of each card
+        for card in range(state.CARD_KINDS):
+            data[state.DECK + card] = 3
+        data[state.DECK_SIZE] = 3 * state.CARD_KINDS
+        data[state.AGENT_SELECTION] = 0
+        data[state.TURN_AGENT] = 0
+        data[state.STATUS] = TURN
+        data[state.ACTION_TO_CHALLENGE] = EMPTY
+        data[state.CHALLENGE_TARGET] = EMPTY
+        data[state.BLOCKING_AGENT] = EMPTY
+
+        for seat in range(self.player_count):
+            offset = self.game.player(seat)
+            cards = [self.pull_card(), self.pull_card()]
+            self.game.set_hand(offset + state.HIDDEN, cards)
+            data[offset + state.COINS] = 2
+        for _ in range(3):
+            data[state.CENTER + self.pull_card()] += 1
+
+    def draw(self, offset: int, total: int) -> int:
+        """
+        removes a random card from the count vector at offset, which holds total
+        cards, and returns it
+        """
+        data = self.data
+        # a uniform index among the cards, which are at most 15
+        index = int(self.rng.random() * total)
+        card = offset
+        while index >= data[card]:
+            index -= data[card]
+            card += 1
+        data[card] -= 1
+        return card - offset
+
+    def pull_card(self) -> int:
+        """
+        removes a random card from the deck
+        """
+        card = self.draw(state.DECK, self.data[state.DECK_SIZE])
+        self.data[state.DECK_SIZE] -= 1
+        return card
+
+    def log(
+        self,
+        event: Event,
+        actor: int = EMPTY,
+        target: int = EMPTY,
+        card: int = EMPTY,
+        outcome: int = 0,
+    ):
+        self.events.append(event, actor, target, card, outcome)
+        if self.verbose:
+            print(event_to_string(event, actor, target, card, outcome, viewer=actor))
+
+    # reading and writing the record
+
+    def hidden(self, seat: int) -> List[int]:
+        return self.game.hand(self.game.player(seat) + state.HIDDEN)
+
+    def set_hidden(self, seat: int, cards: List[int]):
+        self.game.set_hand(self.game.player(seat) + state.HIDDEN, cards)
+
+    def hidden_count(self, seat: int) -> int:
+        return state.HAND_SIZE[self.data[self.game.player(seat) + state.HIDDEN]]
+
+    def exchange_targets(self, seat: int) -> Tuple[int, ...]:
+        """
+        returns the canonical target of each exchange target of seat, see
+        exchange_targets
+        """
+        data = self.data
+        hidden = data[self.game.player(seat) + state.HIDDEN]
+        return exchange_targets(hidden, data[state.VIEW])
+
+    def holds(self, seat: int, card: int) -> bool:
+        """
+        whether card is among seat's hidden cards
+        """
+        hand = self.data[self.game.player(seat) + state.HIDDEN]
+        return bool(state.HAND_MASK[hand] >> card & 1)
+
+    def add_coins(self, seat: int, coins: int):
+        self.data[self.game.player(seat) + state.COINS] += coins
+        self.game.version += 1
+
+    def next_alive(self, seat: int) -> int:
+        """
+        returns the next seat after seat that is still in the game
+        """
+        i = self.next_seats[self.data[state.TERMINATIONS]][seat]
+        assert i != EMPTY, "there is only one remaining player"
+        return i
+
+    def _open_window(self):
+        """
+        queues every alive seat but the turn agent to answer the turn agent's move
+        and selects the first of them
+        """
+        data = self.data
+        alive = ((1 << self.player_count) - 1) & ~data[state.TERMINATIONS]
+        data[state.RESPONDERS] = alive & ~(1 << data[state.TURN_AGENT])
+        self._next_responder()
+
+    def _next_responder(self) -> int:
+        """
+        selects the next queued seat of the reaction window and returns it, or
+        returns EMPTY once every responder has answered
+        """
+        data = self.data
+        responders = data[state.RESPONDERS]
+        if not responders:
+            return EMPTY
+        lowest = responders & -responders
+        data[state.RESPONDERS] = responders ^ lowest
+        seat = lowest.bit_length() - 1
+        data[state.AGENT_SELECTION] = seat
+        return seat
+
+    def responders(self) -> List[int]:
+        """
+        returns the seats still to answer the current decision in order: the
+        agent_selection, followed by the queued responders of a reaction window
+        """
+        data = self.data
+        seats = [data[state.AGENT_SELECTION]]
+        responders = data[state.RESPONDERS]
+        while responders:
+            lowest = responders & -responders
+            seats.append(lowest.bit_length() - 1)
+            responders ^= lowest
+        return seats
+
+    def respond(self, actions: List[int]):
+        """
+        plays the answers of every seat of responders(), in that order. Nothing is
+        revealed until a window is resolved, so this is the same as the players
+        answering at once.
+        """
+        for action in actions:
+            self.step(action, EMPTY)
+
+    # legal actions
+
+    def legal_actions(self, seat: int) -> Tuple[int, ...]:
+        """
+        returns the fixed indices of the legal actions of seat in the current
+        status, in the order of raw_env's current_actions. They are listed once per
+        decision context and shared afterwards, see decision_context.
+        """
+        key = self.decision_context(seat)
+        legal = self.templates.get(key)
+        if legal is None:
+            legal = self.templates[key] = tuple(self._list_legal_actions(seat))
+        return legal
+
+    def decision_context(self, seat: int) -> Tuple[int, ...]:
+        """
+        returns what the legal actions of seat depend on: the status, and then the
+        coin thresholds and alive opponents on a turn, the hidden and viewed cards
+        in an exchange or the number of hidden cards when losing influence
+        """
+        data = self.data
+        status = data[state.STATUS]
+        player = state.PLAYERS + state.PLAYER_SIZE * seat
+        if status == TURN:
+            coins = data[player + state.COINS]
+            tier = (coins >= 3) + (coins >= 7) + (coins >= 10)
+            return (status, seat, tier, data[state.TERMINATIONS])
+        if status == AMBASSADOR_EXCHANGE:
+            return (status, data[player + state.HIDDEN], data[state.VIEW])
+        if status == LOSE_INFLUENCE:
+            return (status, state.HAND_SIZE[data[player + state.HIDDEN]])
+        return (status,)
+
+    def _list_legal_actions(self, seat: int) -> List[int]:
+        data = self.data
+        status = data[state.STATUS]
+        if status == TURN:
+            coins = data[self.game.player(seat) + state.COINS]
+            if coins >= 10:
+                actions = [COUP]
+            else:
+                actions = TURN_ACTIONS[:]
+                if coins >= 3:
+                    actions.append(ASSASSIN)
+                if coins >= 7:
+                    actions.append(COUP)
+        elif status == AMBASSADOR_EXCHANGE:
+            hidden_count = self.hidden_count(seat)
+            if hidden_count == 2:
+                actions = [AMBASSADOR_EXCHANGE_4]
+            elif hidden_count == 1:
+                actions = [AMBASSADOR_EXCHANGE_3]
+            else:
+                raise Exception("Invalid number of cards")
+        elif status in REACTIONS:
+            actions = REACTIONS[status]
+        else:
+            raise Exception("Invalid status")
+
+        indices = []
+        for action in actions:
+            columns = self.columns[action]
+            if action == AMBASSADOR_EXCHANGE_3 or action == AMBASSADOR_EXCHANGE_4:
+                for target, canonical in enumerate(self.exchange_targets(seat)):
+                    if target == canonical:
+                        indices.append(columns[target])
+            elif FULLY_SPECIFIED[action]:
+                indices.append(columns[0])
+            elif SPECIFIES_OPPONENT[action]:
+                for target in self.opponents[data[state.TERMINATIONS]][seat]:
+                    indices.append(columns[target])
+            else:
+                indices.extend(columns[: self.hidden_count(seat)])
+        return indices
+
+    # playing
+
+    def step(self, action: int, target: int):
+        """
+        plays action (with target) for the agent_selection
+        """
+        self.handlers[(self.data[state.STATUS], action)](
+            self.data[state.AGENT_SELECTION], action, target
+        )
+
+    def _step_income(self, seat: int, action: int, target: int):
+        data = self.data
+        self.log(Event.INCOME, seat)
+        self.add_coins(seat, 1)
+
+        data[state.STATUS] = TURN
+        data[state.AGENT_SELECTION] = self.next_alive(seat)
+        data[state.TURN_AGENT] = self.next_alive(data[state.TURN_AGENT])
+
+    def _step_foreign_aid(self, seat: int, action: int, target: int):
+        data = self.data
+        self.log(Event.FOREIGN_AID, seat)
+        data[state.STATUS] = CAN_BLOCK_FOREIGN_AID
+        self._open_window()
+
+    def _step_foreign_aid_reaction(self, seat: int, action: int, target: int):
+        data = self.data
+        if action == BLOCK_FOREIGN_AID:
+            self.game.add_seat(state.BLOCKING_PLAYERS, seat)
+        if self._next_responder() != EMPTY:
+            return
+
+        turn_agent = data[state.TURN_AGENT]
+        if data[state.BLOCKING_PLAYERS] == 0:
+            self.log(Event.NO_FOREIGN_AID_BLOCK)
+            self.add_coins(turn_agent, 2)
+            self._end_turn()
+        else:
+            blocking_players = self.game.seats(state.BLOCKING_PLAYERS)
+            # a lone blocker takes no random draw
+            blocking_agent = (
+                blocking_players[0]
+                if len(blocking_players) == 1
+                else self.rng.choice(blocking_players)
+            )
+            data[state.BLOCKING_AGENT] = blocking_agent
+            self.log(Event.BLOCK_FOREIGN_AID, blocking_agent)
+
+            data[state.BLOCKING_PLAYERS] = 0
+            data[state.STATUS] = CAN_CHALLENGE
+            data[state.ACTION_TO_CHALLENGE] = BLOCK_FOREIGN_AID
+            data[state.CHALLENGE_TARGET] = EMPTY
+            data[state.AGENT_SELECTION] = turn_agent
+
+    def _step_coup(self, seat: int, action: int, target: int):
+        data = self.data
+        self.log(Event.COUP, seat, target)
+
+        self.add_coins(seat, -7)
+        data[state.STATUS] = LOSE_INFLUENCE
+        data[state.AGENT_SELECTION] = target
+
+    def _step_lose_influence(self, seat: int, action: int, target: int):
+        data = self.data
+        offset = self.game.player(seat)
+        hidden = data[offset + state.HIDDEN]
+        card = state.HAND_CARDS[hidden][target]
+        self.log(Event.LOSE_INFLUENCE, seat, target, card)
+
+        hidden = state.hand_without(hidden, target)
+        data[offset + state.HIDDEN] = hidden
+        visible = data[offset + state.VISIBLE]
+        data[offset + state.VISIBLE] = state.hand_with(visible, card)
+        self.game.version += 1
+
+        if not hidden:
+            self.game.add_seat(state.TERMINATIONS, seat)
+            data[state.ALIVE_COUNT] -= 1
+            if data[state.ALIVE_COUNT] == 1:
+                data[state.DONE] = 1
+                return
+        if (
+            data[state.ACTION_TO_CHALLENGE] == AMBASSADOR
+            and data[state.TURN_AGENT] != seat
+        ):
+            data[state.STATUS] = AMBASSADOR_EXCHANGE
+            data[state.AGENT_SELECTION] = data[state.TURN_AGENT]
+        else:
+            self._end_turn()
+
+    def _step_let_assassination(self, seat: int, action: int, target: int):
+        self.log(Event.LET_ASSASSINATION, seat)
+        self.data[state.STATUS] = LOSE_INFLUENCE
+
+    def _step_let_steal(self, seat: int, action: int, target: int):
+        self.log(Event.LET_STEAL, seat)
+        self.add_coins(self.data[state.TURN_AGENT], 2)
+        self.add_coins(seat, -2)
+        self._end_turn()
+
+    def _step_ambassador_exchange(self, seat: int, action: int, target: int):
+        data = self.data
+        game = self.game
+        # the player keeps one card out of three, or two out of four
+        cards = self.hidden(seat) + game.hand(state.VIEW)
+        keep = AMBASSADOR_MAPPINGS[action][target]
+
+        self.log(
+            Event.AMBASSADOR_EXCHANGE,
+            seat,
+            target,
+            history.pack_cards(cards),
+            len(cards),
+        )
+
+        self.set_hidden(seat, [cards[index] for index in keep])
+        # the viewed cards that are kept leave the center, whose counts hold them,
+        # and the hidden cards given up go into it
+        hidden_count = len(cards) - 2
+        for index in keep:
+            if index >= hidden_count:
+                data[state.CENTER + cards[index]] -= 1
+        for index in range(hidden_count):
+            if index not in keep:
+                data[state.CENTER + cards[index]] += 1
+
+        if data[state.VIEW_OWNER] == data[state.TURN_AGENT]:
+            data[state.VIEW_OWNER] = EMPTY
+            game.set_hand(state.VIEW, [])
+
+        self._end_turn()
+
+    def _step_claim(self, seat: int, action: int, target: int):
+        data = self.data
+        if action == ASSASSIN:
+            self.add_coins(data[state.TURN_AGENT], -3)
+
+        self.log(
+            Event.CLAIM,
+            seat,
+            target,
+            CLAIMED_CARD[action],
+            CLAIM_KINDS.get(action, history.CLAIM),
+        )
+
+        data[state.STATUS] = CAN_CHALLENGE
+        data[state.ACTION_TO_CHALLENGE] = action
+        data[state.CHALLENGE_TARGET] = target
+        if action in BLOCKS:
+            data[state.BLOCKING_AGENT] = seat
+            data[state.RESPONDERS] = 0
+            data[state.AGENT_SELECTION] = data[state.TURN_AGENT]
+        else:
+            self._open_window()
+
+    def _step_challenge_reaction(self, seat: int, action: int, target: int):
+        data = self.data
+        claim = data[state.ACTION_TO_CHALLENGE]
+        assert claim != EMPTY, "there is no claim to challenge"
+        if claim == BLOCK_FOREIGN_AID:
+            self._resolve_foreign_aid_block(action)
+        else:
+            if action == CHALLENGE:
+                self.game.add_seat(state.CHALLENGING_PLAYERS, seat)
+            if self._next_responder() != EMPTY:
+                return
+
+            lose_influence = self.resolve_challenge(
+                self.game.seats(state.CHALLENGING_PLAYERS), claim
+            )
+            blocking_agent = data[state.BLOCKING_AGENT]
+            challenged = (
+                data[state.TURN_AGENT] if blocking_agent == EMPTY else blocking_agent
+            )
+
+            if lose_influence == EMPTY:
+                self.log(Event.NO_CHALLENGE)
+                getattr(self, UNCHALLENGED[claim])()
+            elif lose_influence == challenged:
+                if self._resolve_bluff(claim, challenged):
+                    return
+            elif self._resolve_failed_challenge(claim, challenged, lose_influence):
+                return
+
+            data[state.CHALLENGING_PLAYERS] = 0
+            data[state.BLOCKING_AGENT] = EMPTY
+
+        data[state.ACTION_TO_CHALLENGE] = EMPTY
+        data[state.CHALLENGE_TARGET] = EMPTY
+
+    def resolve_challenge(self, challengers: List[int], claim: int) -> int:
+        """
+        returns EMPTY if no one challenges, otherwise the seat that loses influence:
+        a random challenger if the claimed card is held, the claimer otherwise
+        """
+        if not challengers:
+            return EMPTY
+
+        # a lone challenger takes no random draw
+        challenger = (
+            challengers[0] if len(challengers) == 1 else self.rng.choice(challengers)
+        )
+        data = self.data
+        claimer = (
+            data[state.BLOCKING_AGENT] if claim in BLOCKS else data[state.TURN_AGENT]
+        )
+        if self.holds(claimer, CLAIMED_CARD[claim]):
+            # the action was not a bluff, so the challenger loses influence
+            return challenger
+        # the action was a bluff, so the challenged player loses influence
+        return claimer
+
+    def _resolve_foreign_aid_block(self, action: int):
+        """
+        the turn agent challenges a foreign aid block or lets it stand
+        """
+        data = self.data
+        turn_agent = data[state.TURN_AGENT]
+        blocking_agent = data[state.BLOCKING_AGENT]
+        if action == CHALLENGE:
+            bluff = not self.holds(blocking_agent, DUKE_CARD)
+            self.log(
+                Event.FOREIGN_AID_BLOCK_CHALLENGE,
+                turn_agent,
+                blocking_agent,
+                outcome=int(bluff),
+            )
+
+            data[state.STATUS] = LOSE_INFLUENCE
+            if bluff:
+                data[state.AGENT_SELECTION] = blocking_agent
+                self.add_coins(turn_agent, 2)
+            else:
+                data[state.AGENT_SELECTION] = turn_agent
+        else:
+            self.log(Event.FOREIGN_AID_BLOCKED, turn_agent)
+            self._end_turn()
+
+        data[state.BLOCKING_AGENT] = EMPTY
+
+    # Effects of an unchallenged claim, see UNCHALLENGED.
+
+    def _unchallenged_duke(self):
+        turn_agent = self.data[state.TURN_AGENT]
+        self.log(Event.GAINS_3_COINS, turn_agent)
+        self.add_coins(turn_agent, 3)
+        self._end_turn()
+
+    def _unchallenged_assassin(self):
+        # check if contessa
+        data = self.data
+        data[state.STATUS] = ASSASSINATED
+        data[state.AGENT_SELECTION] = data[state.CHALLENGE_TARGET]
+
+    def _unchallenged_captain(self):
+        data = self.data
+        data[state.STATUS] = STOLEN
+        data[state.AGENT_SELECTION] = data[state.CHALLENGE_TARGET]
+
+    def _unchallenged_ambassador(self):
+        data = self.data
+        game = self.game
+        turn_agent = data[state.TURN_AGENT]
+        data[state.STATUS] = AMBASSADOR_EXCHANGE
+        data[state.AGENT_SELECTION] = turn_agent
+
+        # the turn agent looks at 2 random cards of the center, which stay in it
+        first = self.draw(state.CENTER, 3)
+        second = self.draw(state.CENTER, 2)
+        data[state.CENTER + first] += 1
+        data[state.CENTER + second] += 1
+        data[state.VIEW_OWNER] = turn_agent
+        game.set_hand(state.VIEW, [first, second])
+
+    def _end_turn(self):
+        data = self.data
+        turn_agent = self.next_alive(data[state.TURN_AGENT])
+        data[state.TURN_AGENT] = turn_agent
+        data[state.AGENT_SELECTION] = turn_agent
+        data[state.STATUS] = TURN
+
+    def _eliminate(self, seat: int) -> bool:
+        """
+        reveals all of seat's cards and returns whether the game is over
+        """
+        data = self.data
+        offset = self.game.player(seat)
+        hidden = data[offset + state.HIDDEN]
+        visible = data[offset + state.VISIBLE]
+        # the hidden cards go after the visible ones
+        shift = state.HAND_BITS * state.HAND_SIZE[visible]
+        data[offset + state.VISIBLE] = visible | hidden << shift
+        data[offset + state.HIDDEN] = 0
+        self.game.version += 1
+        self.game.add_seat(state.TERMINATIONS, seat)
+        data[state.ALIVE_COUNT] -= 1
+
+        if data[state.ALIVE_COUNT] == 1:
+            data[state.DONE] = 1
+            return True
+        return False
+
+    def _resolve_bluff(self, claim: int, challenged: int) -> bool:
+        """
+        the challenged player was bluffing and loses influence; returns whether the
+        game is over
+        """
+        data = self.data
+        turn_agent = data[state.TURN_AGENT]
+        if claim == BLOCK_ASSASSINATION:
+            # the turn agent challenged the contessa and is eliminated
+            self.log(Event.CONTESSA_BLUFF_CAUGHT, turn_agent)
+            if self._eliminate(turn_agent):
+                return True
+            self._end_turn()
+        else:
+            self.log(Event.CHALLENGE_SUCCEEDS, challenged)
+            data[state.STATUS] = LOSE_INFLUENCE
+            data[state.AGENT_SELECTION] = challenged
+
+            if claim in STEAL_BLOCKS:
+                self.add_coins(turn_agent, 2)
+                self.add_coins(challenged, -2)
+        return False
+
+    def _resolve_failed_challenge(
+        self, claim: int, challenged: int, challenger: int
+    ) -> bool:
+        """
+        the challenged player had the card, so the challenger loses influence and the
+        challenged player swaps the card with the center; returns whether the game is
+        over
+        """
+        data = self.data
+        turn_agent = data[state.TURN_AGENT]
+        if (
+            claim == ASSASSIN
+            and challenger == data[state.CHALLENGE_TARGET]
+            and not self.holds(challenger, CONTESSA_CARD)
+        ):
+            # the target wrongly challenged the assassin and has no contessa to block
+            self.log(Event.ASSASSIN_CHALLENGE_FAILS, challenger)
+            if self._eliminate(challenger):
+                return True
+            self._end_turn()
+            return False
+
+        self.log(Event.CHALLENGE_FAILS, challenger, challenged)
+
+        # the claim still takes effect
+        if claim == DUKE:
+            self.log(Event.GAINS_3_COINS, challenged)
+            self.add_coins(challenged, 3)
+        elif claim == CAPTAIN:
+            self.log(Event.STEALS_2_COINS, turn_agent)
+            self.add_coins(turn_agent, 2)
+            self.add_coins(data[state.CHALLENGE_TARGET], -2)
+        elif claim in STEAL_BLOCKS:
+            self.log(Event.BLOCKED_STEAL_CHALLENGE_FAILS, turn_agent)
+        elif claim == AMBASSADOR:
+            self._unchallenged_ambassador()
+
+        # the challenged player shuffles the card into the center and draws one
+        hidden = self.hidden(challenged)
+        card_index = hidden.index(CLAIMED_CARD[claim])
+        data[state.CENTER + hidden[card_index]] += 1
+        hidden[card_index] = self.draw(state.CENTER, 4)
+        self.set_hidden(challenged, hidden)
+
+        data[state.STATUS] = LOSE_INFLUENCE
+        data[state.AGENT_SELECTION] = challenger
+        return False
+
+
+class TwoPlayerCoupEngine(CoupCore):
+    """
+    CoupCore specialized for heads-up games, which raw_env(player_count=2) plays on.
+    With one opponent every reaction window has a single responder, so the
+    transitions below skip the seat scans and bitmask bookkeeping of the general
+    engine. They make the same random draws in the same order, so a seeded game
+    plays out identically on either engine.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, rng: random.Random, verbose: bool = False):
+        super().__init__(2, rng, verbose)
+
+    def next_alive(self, seat: int) -> int:
+        return 1 - seat
+
+    def _open_window(self):
+        # the opponent is the only responder, so nothing is queued
+        data = self.data
+        data[state.AGENT_SELECTION] = 1 - data[state.TURN_AGENT]
+
+    def _step_income(self, seat: int, action: int, target: int):
+        data = self.data
+        self.log(Event.INCOME, seat)
+        self.add_coins(seat, 1)
+
+        data[state.STATUS] = TURN
+        data[state.AGENT_SELECTION] = 1 - seat
+        data[state.TURN_AGENT] = 1 - data[state.TURN_AGENT]
+
+    def _step_foreign_aid_reaction(self, seat: int, action: int, target: int):
+        data = self.data
+        turn_agent = data[state.TURN_AGENT]
+        if action == LET_FOREIGN_AID:
+            self.log(Event.NO_FOREIGN_AID_BLOCK)
+            self.add_coins(turn_agent, 2)
+            self._end_turn()
+            return
+
+        data[state.BLOCKING_AGENT] = seat
+        self.log(Event.BLOCK_FOREIGN_AID, seat)
+
+        data[state.BLOCKING_PLAYERS] = 0
+        data[state.STATUS] = CAN_CHALLENGE
+        data[state.ACTION_TO_CHALLENGE] = BLOCK_FOREIGN_AID
+        data[state.CHALLENGE_TARGET] = EMPTY
+        data[state.AGENT_SELECTION] = turn_agent
+
+    def _step_challenge_reaction(self, seat: int, action: int, target: int):
+        data = self.data
+        claim = data[state.ACTION_TO_CHALLENGE]
+        assert claim != EMPTY, "there is no claim to challenge"
+        if claim == BLOCK_FOREIGN_AID:
+            self._resolve_foreign_aid_block(action)
+            data[state.ACTION_TO_CHALLENGE] = EMPTY
+            data[state.CHALLENGE_TARGET] = EMPTY
+            return
+
+        turn_agent = data[state.TURN_AGENT]
+        blocking_agent = data[state.BLOCKING_AGENT]
+        challenged = turn_agent if blocking_agent == EMPTY else blocking_agent
+        if action == NO_CHALLENGE:
+            self.log(Event.NO_CHALLENGE)
+            getattr(self, UNCHALLENGED[claim])()
+        else:
+            data[state.CHALLENGING_PLAYERS] = 1 << seat
+            if not self.holds(challenged, CLAIMED_CARD[claim]):
+                if self._resolve_bluff(claim, challenged):
+                    return
+            elif self._resolve_failed_challenge(claim, challenged, seat):
+                return
+
+        data[state.CHALLENGING_PLAYERS] = 0
+        data[state.BLOCKING_AGENT] = EMPTY
+        data[state.ACTION_TO_CHALLENGE] = EMPTY
+        data[state.CHALLENGE_TARGET] = EMPTY
+
+    def _end_turn(self):
+        data = self.data
+        turn_agent = 1 - data[state.TURN_AGENT]
+        data[state.TURN_AGENT] = turn_agent
+        data[state.AGENT_SELECTION] = turn_agent
+        data[state.STATUS] = TURN
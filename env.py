@@ -1,18 +1,20 @@
-import functools
-
 import gymnasium
 import numpy as np
-from gymnasium.spaces import Discrete
+from gymnasium.spaces import Box, Discrete, Space
 
 from pettingzoo import AECEnv
-from pettingzoo.utils import agent_selector, wrappers
+from pettingzoo.utils import wrappers
 
 import random
-from agent import Agent
+
+from agent import Agent, CARDS
 import agent
-from typing import List, Tuple, Dict, Optional
+import state
+from state import GameState, SeatFlags, Snapshot
+from history import Event, EventLog
+from core import CoupCore, TwoPlayerCoupEngine
+from typing import Callable, List, Tuple, Dict, Optional
 from utils import (
-    SPECIFY_OPPONENT,
     ActionSpecification,
     AgentStatus,
     Cards,
@@ -21,25 +23,60 @@ from utils import (
     ACTION_TO_CARD,
     map_combinations,
     CARD_TO_STRING,
+    action_table,
+    action_index_table,
+    action_columns,
+    Seed,
+    seed_sequence,
+    python_rng,
 )
 
 
 # CARD_NAMES = ["AMBASSADOR", "ASSASSIN", "CAPTAIN", "CONTESSA", "DUKE"]
-
-
-def env(render_mode=None):
+ACTIONS = list(Action)
+STATUSES = list(AgentStatus)
+# the exchange action of a player by number of hidden cards
+EXCHANGE_ACTIONS = [None, Action.AMBASSADOR_EXCHANGE_3, Action.AMBASSADOR_EXCHANGE_4]
+
+
+def _observed_cards(hidden: int, visible: int, own: bool) -> Tuple[int, int]:
+    # a player holds two cards, hidden ones first, and other players' hidden cards
+    # are observed as -1
+    if own:
+        cards = state.HAND_CARDS[hidden]
+    else:
+        cards = (-1,) * state.HAND_SIZE[hidden]
+    return (cards + state.HAND_CARDS[visible] + (-1, -1))[:2]
+
+
+# the two observed card values of a player, indexed by whether the player is the
+# observer and by hidden hand * HAND_CODES + visible hand
+OBSERVED_CARDS = [
+    [
+        _observed_cards(hidden, visible, own)
+        for hidden in range(state.HAND_CODES)
+        for visible in range(state.HAND_CODES)
+    ]
+    for own in (False, True)
+]
+
+def env(render_mode=None, **kwargs):
     """
     The env function often wraps the environment in wrappers by default.
     You can find full documentation for these methods
     elsewhere in the developer documentation.
+
+    The keyword arguments are passed on to raw_env. A fast raw_env checks that
+    every action is legal itself, so it goes without the out of bounds wrapper.
     """
     internal_render_mode = render_mode if render_mode != "ansi" else "human"
-    env = raw_env(render_mode=internal_render_mode)
+    env = raw_env(render_mode=internal_render_mode, **kwargs)
     # This wrapper is only for environments which print results to the terminal
     if render_mode == "ansi":
         env = wrappers.CaptureStdoutWrapper(env)
     # this wrapper helps error handling for discrete action spaces
-    env = wrappers.AssertOutOfBoundsWrapper(env)
+    if not kwargs.get("fast"):
+        env = wrappers.AssertOutOfBoundsWrapper(env)
     # Provides a wide vareity of helpful user errors
     # Strongly recommended
     env = wrappers.OrderEnforcingWrapper(env)
@@ -56,13 +93,37 @@ class raw_env(AECEnv):
 
     metadata = {"render_modes": ["human"], "name": "rps_v2"}
 
-    def __init__(self, player_count: int = 6, render_mode=None, verbose: bool = False):
+    def __init__(
+        self,
+        player_count: int = 6,
+        render_mode=None,
+        verbose: bool = False,
+        fixed_actions: bool = False,
+        dict_observations: bool = False,
+        fast: bool = False,
+    ):
         """
         The init method takes in environment arguments and
          should define the following attributes:
         - possible_agents
         - render_mode
 
+        With fixed_actions, step() takes indices into the fixed table self.action_specs
+        (see utils.action_table) instead of indices into the agent's current_actions,
+        and action_mask() tells which of them are legal.
+
+        With dict_observations, observe() returns {"observation": cards and coins,
+        "action_mask": action_mask() as int8} as masked RL libraries expect, which
+        implies fixed_actions. The mask is empty for every agent but the
+        agent_selection.
+
+        With fast, step() and step_reactions() replace their asserts with a single
+        check that the actions are among the legal ones prepared for the decision,
+        which also covers what env()'s out of bounds wrapper checks, and raise
+        ValueError otherwise. Games play out exactly as in the checked mode. Like
+        current_actions, the prepared actions are those of the last reset, step or
+        restore, so positions set up by hand need the checked mode.
+
         Note: as of v1.18.1, the action_spaces and observation_spaces attributes are deprecated.
         Spaces should be defined in the action_space() and observation_space() methods.
         If these methods are not overridden, spaces will be inferred from self.observation_spaces/action_spaces, raising a warning.
@@ -76,65 +137,149 @@ class raw_env(AECEnv):
         self.possible_agents = [str(i) for i in range(player_count)]
         self.render_mode = render_mode
         self.player_count = player_count
-        self.verbose = verbose
 
         self.ambassador_mapping_3 = map_combinations(3, 1)
         self.ambassador_mapping_4 = map_combinations(4, 2)
 
+        # the game is played by an integer core; this class converts between it and
+        # the agent ids and enums of the pettingzoo API. Every draw of the game
+        # comes from the env's own stream, see reset(). Heads-up games get the
+        # specialized engine.
+        self.seed_sequence = seed_sequence(None)
+        rng = python_rng(self.seed_sequence)
+        if player_count == 2:
+            self.core: CoupCore = TwoPlayerCoupEngine(rng, verbose)
+        else:
+            self.core = CoupCore(player_count, rng, verbose)
+
+        self.fixed_actions = fixed_actions or dict_observations
+        self.dict_observations = dict_observations
+        self.fast = fast
+        self.action_specs = action_table(player_count)
+        self.action_indices = action_index_table(player_count)
+        # shared masks of the legal action tuples of the core, see _legal_mask
+        self._masks: Dict[Tuple[int, ...], np.ndarray] = {}
+        self.action_columns = action_columns(player_count)
+        # the spaces are the same for every agent and never change, so they are
+        # built once
+        self._observation_space = self._build_observation_space()
+        self._action_space = Discrete(len(self.action_specs))
+        # (action, target) ints of every fixed action index
+        self.action_codes = [
+            (spec.name.value, state.EMPTY if spec.target is None else spec.target)
+            for spec in self.action_specs
+        ]
+
+        # observe() writes into one buffer per agent and hands out read-only views of
+        # it, recomputing only when the game's version moved since the last call
+        self.observation_buffers = [
+            np.zeros(3 * player_count, dtype=np.int16) for _ in range(player_count)
+        ]
+        self.observations = []
+        for buffer in self.observation_buffers:
+            view = buffer.view()
+            view.flags.writeable = False
+            self.observations.append(view)
+        self.observed_versions = [-1] * player_count
+        # the legal actions of the agent to move, prepared by step()
+        self._next_legal_actions: Tuple[int, ...] = ()
+
+    @property
+    def game(self) -> GameState:
+        return self.core.game
+
+    @property
+    def events(self) -> EventLog:
+        return self.core.events
+
+    @property
+    def verbose(self) -> bool:
+        return self.core.verbose
+
+    @verbose.setter
+    def verbose(self, verbose: bool):
+        self.core.verbose = verbose
+
+    @property
+    def rng(self) -> random.Random:
+        return self.core.rng
+
+    @rng.setter
+    def rng(self, rng: random.Random):
+        self.core.rng = rng
+
     def pull_card(self) -> Cards:
-        index = random.randint(
-            0, len(self.deck) - 1
-        )  # instead, randomly choose a card from the center using Card
-        card = self.deck[index]
-        del self.deck[index]
-        return card
-
-    # Observation space should be defined here.
-    # lru_cache allows observation and action spaces to be memoized, reducing clock cycles required to get each agent's space.
-    # If your spaces change over time, remove this line (disable caching).
-    # @functools.lru_cache(maxsize=None)
+        """
+        removes a random card from the deck and returns it
+        """
+        return CARDS[self.core.pull_card()]
 
     def observe(self, agent_id: str):
         """
         Observe should return the observation of the specified agent. This function
         should return a sane observation (though not necessarily the most up to date possible)
         at any time after reset() is called.
+
+        The observation is an int16 array of every player's two cards, hidden cards
+        first and other players' hidden cards as -1, followed by every player's
+        coins. It is a read-only view of a buffer that is rewritten in place when
+        the game changes, so copy it to keep it. With dict_observations it comes in a
+        dict with the agent's action mask.
         """
-        # observation of one agent is the previous state of the other
-        player = self.players[int(agent_id)]
-        observation = []
+        index = int(agent_id)
+        observation = self._observe_cards(index)
+        if not self.dict_observations:
+            return observation
+        # int8 like gymnasium's masked sampling expects
+        if agent_id == self.agent_selection:
+            legal = self.legal_actions(self.players[index])
+            mask = self._legal_mask(legal).astype(np.int8)
+        else:
+            mask = np.zeros(len(self.action_specs), dtype=np.int8)
+        return {"observation": observation, "action_mask": mask}
+
+    def _observe_cards(self, index: int) -> np.ndarray:
+        game = self.game
+        observation = self.observations[index]
+        self.players[index].observation = observation
+        if self.observed_versions[index] == game.version:
+            return observation
+
+        data = game.data
+        values = []
         for i in range(self.player_count):
-            if self.players[i] == player:
-                observation.extend(player.hidden_cards) 
-                observation.extend(player.visible_cards)
-            else:
-                # extend observation with -1 * len(self.players[i].hidden_cards)
-                observation.extend([-1] * len(self.players[i].hidden_cards))
-                observation.extend(self.players[i].visible_cards)
-
-        observation.extend([self.players[i].coins for i in range(self.player_count)])
-
-        assert len(observation) == 3 * self.player_count, "observation is wrong length"
-        player.observation = observation
-        return np.array(observation)
-
-    def observation_space(self, agent: Agent):
+            offset = game.player(i)
+            hands = data[offset + state.HIDDEN] * state.HAND_CODES
+            values += OBSERVED_CARDS[i == index][hands + data[offset + state.VISIBLE]]
+        values += data[state.PLAYERS + state.COINS :: state.PLAYER_SIZE]
+        self.observation_buffers[index][:] = values
+        self.observed_versions[index] = game.version
+        return observation
+
+    def observation_space(self, agent) -> Space:
+        return self._observation_space
+
+    def _build_observation_space(self) -> Space:
         # gymnasium spaces are defined and documented here: https://gymnasium.farama.org/api/spaces/
 
-        # first 2 * player_count values are the cards of all players
-        # next player_count values are the coins of all players
-
-        observation = []
-        for i in range(self.player_count):
-            if self.players[i] == agent:
-                observation.extend(agent.hidden_cards)
-                observation.extend(agent.visible_cards)
-            else:
-                observation.extend(self.players[i].hidden_cards)
-
-        observation.extend([self.players[i].coins for i in range(self.player_count)])
-
-        return Discrete(len(observation))
+        # first 2 * player_count values are the cards of all players (-1 for unseen)
+        # next player_count values are the coins of all players, which can go
+        # negative since the assassin is offered without 3 coins
+        int16 = np.iinfo(np.int16)
+        cards = 2 * self.player_count
+        observation = Box(
+            low=np.array([-1] * cards + [int16.min] * self.player_count),
+            high=np.array([len(Cards) - 1] * cards + [int16.max] * self.player_count),
+            dtype=np.int16,
+        )
+        if not self.dict_observations:
+            return observation
+        return gymnasium.spaces.Dict(
+            {
+                "observation": observation,
+                "action_mask": Box(0, 1, (len(self.action_specs),), dtype=np.int8),
+            }
+        )
 
     def current_actions_to_string(self, agent: Agent):
         string = ""
@@ -200,78 +345,67 @@ class raw_env(AECEnv):
         return string
 
     def current_actions(self, agent: Agent):
-        assert self.status is not None, "status must be specified"
+        agent.current_actions = [
+            self.action_specs[i] for i in self.legal_actions(agent)
+        ]
 
-        agent.current_actions = []
+    def legal_actions(self, agent: Agent) -> Tuple[int, ...]:
+        """
+        returns the fixed indices of the legal actions of agent, in the order of
+        current_actions
+        """
+        assert self.status is not None, "status must be specified"
+        return self.core.legal_actions(agent.index)
 
-        if self.status == AgentStatus.TURN:
-            actions = [
-                Action.INCOME,
-                Action.FOREIGN_AID,
-                Action.AMBASSADOR,
-                Action.CAPTAIN,
-                Action.DUKE,
-                Action.ASSASSIN
-            ]
-            if agent.coins >= 3:
-                actions.append(Action.ASSASSIN)
-            if agent.coins >= 7:
-                actions.append(Action.COUP)
-
-            if agent.coins >= 10:
-                actions = [Action.COUP]
-        elif self.status == AgentStatus.STOLEN:
-            actions = [
-                Action.BLOCK_STEAL_WITH_AMBASSADOR,
-                Action.BLOCK_STEAL_WITH_CAPTAIN,
-                Action.LET_STEAL,
-            ]
-        elif self.status == AgentStatus.AMBASSADOR_EXCHANGE:
-            if len(agent.hidden_cards) == 2:
-                actions = [Action.AMBASSADOR_EXCHANGE_4]
-            elif len(agent.hidden_cards) == 1:
-                actions = [Action.AMBASSADOR_EXCHANGE_3]
-            else:
-                raise Exception("Invalid number of cards")
-        elif self.status == AgentStatus.ASSASSINATED:
-            actions = [Action.BLOCK_ASSASSINATION, Action.LET_ASSASSINATION]
-        elif self.status == AgentStatus.LOSE_INFLUENCE:
-            actions = [Action.LOSE_INFLUENCE]
-        elif self.status == AgentStatus.CAN_CHALLENGE:
-            actions = [Action.CHALLENGE, Action.NO_CHALLENGE]
-        elif self.status == AgentStatus.CAN_BLOCK_FOREIGN_AID:
-            actions = [Action.BLOCK_FOREIGN_AID, Action.LET_FOREIGN_AID]
-        else:
-            raise Exception("Invalid status")
-
-        for action in actions:
-            if action == Action.AMBASSADOR_EXCHANGE_3:
-                for i in range(len(self.ambassador_mapping_3)):
-                    agent.current_actions.append(ActionSpecification(action, i))
-            elif action == Action.AMBASSADOR_EXCHANGE_4:
-                for i in range(len(self.ambassador_mapping_4)):
-                    agent.current_actions.append(ActionSpecification(action, i))
-            elif IS_FULLY_SPECIFIED[action]:
-                agent.current_actions.append(ActionSpecification(action, None))
-            else:
-                if SPECIFY_OPPONENT[action]:
-                    for target in range(self.player_count):
-                        if (
-                            str(target) != agent.name
-                            and not self.terminations[str(target)]
-                        ):
-                            agent.current_actions.append(
-                                ActionSpecification(action, target)
-                            )
-                else:
-                    for card in range(len(agent.hidden_cards)):
-                        agent.current_actions.append(ActionSpecification(action, card))
+    def _legal_mask(self, legal: Tuple[int, ...]) -> np.ndarray:
+        """
+        returns the read-only boolean mask of legal over action_specs, which is
+        shared by every decision with the same legal actions
+        """
+        mask = self._masks.get(legal)
+        if mask is None:
+            mask = np.zeros(len(self.action_specs), dtype=bool)
+            mask[list(legal)] = True
+            mask.flags.writeable = False
+            self._masks[legal] = mask
+        return mask
+
+    def action_mask(self, agent: Optional[Agent] = None) -> np.ndarray:
+        """
+        returns a boolean mask over self.action_specs of the legal actions of agent
+        (the agent_selection by default)
+        """
+        if agent is None:
+            agent = self.players[int(self.agent_selection)]
+        return self._legal_mask(self.legal_actions(agent)).copy()
 
     def action_specification_to_index(
         self, action_spec: ActionSpecification, player: Optional[Agent] = None
     ):
+        """
+        returns the index of action_spec for player (the agent_selection by default).
+        An exchange that keeps the same cards as an offered one maps to that one.
+        """
         if player is None:
             player = self.players[int(self.agent_selection)]
+        expected = EXCHANGE_ACTIONS[len(player.hidden_cards)]
+        if (
+            action_spec.name == expected
+            and self.status == AgentStatus.AMBASSADOR_EXCHANGE
+            and action_spec.target is not None
+        ):
+            canonical = self.core.exchange_targets(player.index)
+            if 0 <= action_spec.target < len(canonical):
+                action_spec = ActionSpecification(
+                    action_spec.name, canonical[action_spec.target]
+                )
+
+        if self.fixed_actions:
+            index = self.action_indices.get((action_spec.name, action_spec.target))
+            if index is None:
+                raise Exception("action_spec not found in action_specs")
+            return index
+
         for i in range(len(player.current_actions)):
             if (
                 player.current_actions[i].name == action_spec.name
@@ -281,11 +415,12 @@ class raw_env(AECEnv):
 
         raise Exception("action_spec not found in current_actions")
 
-    # Action space should be defined here.
-    # If your spaces change over time, remove this line (disable caching).
-    # @functools.lru_cache(maxsize=None)
-    def action_space(self, agent: Agent) -> Discrete:
-        return Discrete(len(agent.current_actions))
+    def action_space(self, agent) -> Discrete:
+        """
+        the space of agent, an Agent or an agent id as the pettingzoo wrappers pass:
+        the fixed action table, which also bounds any list of current actions
+        """
+        return self._action_space
 
     def render(self):
         """
@@ -315,7 +450,7 @@ class raw_env(AECEnv):
         """
         pass
 
-    def reset(self, seed=None, options=None):
+    def reset(self, seed: Seed = None, options=None):
         """
         Reset needs to initialize the following attributes
         - agents
@@ -328,76 +463,247 @@ class raw_env(AECEnv):
         And must set up the environment so that render(), step(), and observe()
         can be called without issues.
         Here it sets up the state dictionary which is used by step() and the observations dictionary which is used by step() and observe()
+
+        A seed (an int or a numpy SeedSequence) restarts the env's random stream, so
+        the deal and every later draw are reproducible; without one the stream
+        carries on from the previous game. Use spawn() to seed other envs.
         """
+        if seed is not None:
+            self.seed_sequence = seed_sequence(seed)
+            self.rng = python_rng(self.seed_sequence)
+
+        # the whole game lives in this record, the attributes below read and write it
+        self.core.new_game()
+        self.observed_versions = [-1] * self.player_count
+
         self.agents = self.possible_agents[:]
         self.rewards = {agent: 0 for agent in self.agents}
         self._cumulative_rewards = {agent: 0 for agent in self.agents}
-        self.terminations = {agent: False for agent in self.agents}
+        self.terminations = SeatFlags(
+            self.game, state.TERMINATIONS, self.agents, state.ALIVE_COUNT
+        )
         self.truncations = {agent: False for agent in self.agents}
         self.infos = {agent: {} for agent in self.agents}
-        self.state = {agent: None for agent in self.agents}  # type: ignore
 
-        # self.agent_selection = 0
+        self.players: List[Agent] = [
+            Agent(self.game, self.events, i, str(i), True)
+            for i in range(self.player_count)
+        ]
+        self._prepare_decision()
+
+    def reset_in_place(self, seed: Seed = None):
         """
-        Our agent_selector utility allows easy cyclic stepping through the agents list.
+        Resets like reset() but deals into the current game record and event log and
+        clears the current dicts and players instead of building new ones, so a
+        warm env starts its next game without allocating. The game is the same as
+        the one reset() deals for the seed. Anything kept from the previous game,
+        like players or terminations, follows the new game.
         """
-        self.agent_selection = str(0)
-        self.turn_agent: int = 0  # if we resolved this turn, who is going right now? +1 to get the agent which goes next
+        if not hasattr(self, "players"):
+            self.reset(seed)
+            return
+        if seed is not None:
+            self.seed_sequence = seed_sequence(seed)
+            self.rng = python_rng(self.seed_sequence)
+
+        self.core.new_game(in_place=True)
+        self.observed_versions[:] = [-1] * self.player_count
+
+        for agent in self.agents:
+            self.rewards[agent] = 0
+            self._cumulative_rewards[agent] = 0
+            self.truncations[agent] = False
+            self.infos[agent].clear()
+        for player in self.players:
+            player.current_actions = []
+            player.status = None
+            player.observation = None
+        self._prepare_decision()
+
+    def spawn(self, n: int) -> List[np.random.SeedSequence]:
+        """
+        returns n independent child seeds of this env's stream, for seeding other
+        envs or workers
+        """
+        return self.seed_sequence.spawn(n)
 
-        self.status: AgentStatus = AgentStatus.TURN
-        self.action_to_challenge: Optional[ActionSpecification] = None
+    # The game state is read and written through these properties, which convert
+    # between the GameState record and the ids and enums of the pettingzoo API.
 
-        # self.deck should contain 3 of each card
-        # loop through all values in Cards enum and add 3 of each card to the deck
-        self.deck = []
-        for card in Cards:
-            for i in range(3):
-                self.deck.append(card)
+    @property
+    def agent_selection(self) -> str:
+        return self.possible_agents[self.game.data[state.AGENT_SELECTION]]
 
-        self.players: List[Agent] = []
-        self.blocking_agent: Optional[int] = None
+    @agent_selection.setter
+    def agent_selection(self, agent_id: str):
+        self.game.data[state.AGENT_SELECTION] = int(agent_id)
 
-        self.alive_count = self.player_count
-        self.challenging_players: List[str] = []
-        self.blocking_players: List[str] = []
+    @property
+    def turn_agent(self) -> int:
+        return self.game.data[state.TURN_AGENT]
 
-        # adding players to the game
-        for i in range(0, self.player_count):
-            # pull 2 cards from the deck and deal to each player
-            cards = []
-            cards.append(self.pull_card())
-            cards.append(self.pull_card())
+    @turn_agent.setter
+    def turn_agent(self, i: int):
+        self.game.data[state.TURN_AGENT] = i
 
-            # create a Agent
-            player = Agent(cards, 2, str(i), True)
-            self.players.append(player)
+    @property
+    def status(self) -> AgentStatus:
+        return STATUSES[self.game.data[state.STATUS]]
 
-        self.center: List[Cards] = []
-        for i in range(3):
-            self.center.append(self.pull_card())
-        self.done = False
-        self.history = ""
+    @status.setter
+    def status(self, status: AgentStatus):
+        self.game.data[state.STATUS] = status.value
 
-    def add_to_history(self, string: str, ambassador=False):
-        if self.verbose:
-            print(string)
-        if ambassador:
-            self.history += (
-                f"Player {self.agent_selection} uses ambassador, seeing two centering cards and potentially exchanging"
-                + "\n"
-            )
-            for i in range(self.player_count):
-                if i == int(self.agent_selection):
-                    self.players[i].history += string + "\n"
-                else:
-                    self.players[i].history += (
-                        f"Player {self.agent_selection} uses ambassador, seeing two centering cards and potentially exchanging"
-                        + "\n"
-                    )
+    @property
+    def action_to_challenge(self) -> Optional[ActionSpecification]:
+        data = self.game.data
+        if data[state.ACTION_TO_CHALLENGE] == state.EMPTY:
+            return None
+        target = data[state.CHALLENGE_TARGET]
+        return ActionSpecification(
+            ACTIONS[data[state.ACTION_TO_CHALLENGE]],
+            None if target == state.EMPTY else target,
+        )
+
+    @action_to_challenge.setter
+    def action_to_challenge(self, action_spec: Optional[ActionSpecification]):
+        data = self.game.data
+        if action_spec is None:
+            data[state.ACTION_TO_CHALLENGE] = state.EMPTY
+            data[state.CHALLENGE_TARGET] = state.EMPTY
         else:
-            self.history += string + "\n"
-            for i in range(self.player_count):
-                self.players[i].history += string + "\n"
+            data[state.ACTION_TO_CHALLENGE] = action_spec.name.value
+            data[state.CHALLENGE_TARGET] = (
+                state.EMPTY if action_spec.target is None else action_spec.target
+            )
+
+    @property
+    def blocking_agent(self) -> Optional[int]:
+        blocking_agent = self.game.data[state.BLOCKING_AGENT]
+        return None if blocking_agent == state.EMPTY else blocking_agent
+
+    @blocking_agent.setter
+    def blocking_agent(self, i: Optional[int]):
+        self.game.data[state.BLOCKING_AGENT] = state.EMPTY if i is None else int(i)
+
+    @property
+    def challenging_players(self) -> List[str]:
+        return [str(i) for i in self.game.seats(state.CHALLENGING_PLAYERS)]
+
+    @challenging_players.setter
+    def challenging_players(self, agent_ids: List[str]):
+        self.game.set_seats(state.CHALLENGING_PLAYERS, [int(i) for i in agent_ids])
+
+    @property
+    def blocking_players(self) -> List[str]:
+        return [str(i) for i in self.game.seats(state.BLOCKING_PLAYERS)]
+
+    @blocking_players.setter
+    def blocking_players(self, agent_ids: List[str]):
+        self.game.set_seats(state.BLOCKING_PLAYERS, [int(i) for i in agent_ids])
+
+    @property
+    def alive_count(self) -> int:
+        return self.game.data[state.ALIVE_COUNT]
+
+    @alive_count.setter
+    def alive_count(self, count: int):
+        self.game.data[state.ALIVE_COUNT] = count
+
+    @property
+    def done(self) -> bool:
+        return bool(self.game.data[state.DONE])
+
+    @done.setter
+    def done(self, done: bool):
+        self.game.data[state.DONE] = int(done)
+
+    @property
+    def center(self) -> Tuple[Cards, ...]:
+        """
+        the cards of the center in card order, which is kept as counts. Assign a new
+        list to change it.
+        """
+        return tuple(CARDS[card] for card in self.game.counted_cards(state.CENTER))
+
+    @center.setter
+    def center(self, cards: List[Cards]):
+        self.game.set_counts(state.CENTER, [card.value for card in cards])
+
+    @property
+    def center_counts(self) -> Tuple[int, ...]:
+        """
+        the number of each card in the center, indexed by Cards value
+        """
+        return tuple(self.game.counts(state.CENTER))
+
+    @property
+    def deck(self) -> Tuple[Cards, ...]:
+        """
+        the cards left in the deck in card order, which is kept as counts. Assign a
+        new list to change it.
+        """
+        return tuple(CARDS[card] for card in self.game.counted_cards(state.DECK))
+
+    @deck.setter
+    def deck(self, cards: List[Cards]):
+        self.game.set_counts(state.DECK, [card.value for card in cards])
+        self.game.data[state.DECK_SIZE] = len(cards)
+
+    @property
+    def deck_counts(self) -> Tuple[int, ...]:
+        """
+        the number of each card left in the deck, indexed by Cards value
+        """
+        return tuple(self.game.counts(state.DECK))
+
+    def snapshot(self, rng: bool = True) -> Snapshot:
+        """
+        Saves the current position: the game record (cards, coins, deck, center,
+        status, challenge and block state, terminations), the random number generator
+        state and the length of the event log. The generator state is 625 ints and
+        most of the cost, which keeps a full snapshot well above the single digit
+        microseconds a search wants per simulation. Search loops resample the hidden
+        cards anyway and should snapshot with rng=False, as ISMCTSAgent does.
+        """
+        return Snapshot(
+            self.game.data[:], self.rng.getstate() if rng else None, len(self.events)
+        )
+
+    def restore(self, snapshot: Snapshot):
+        """
+        Returns to a position saved by snapshot(). The game record is overwritten in
+        place, so the players and terminations keep working, and the current_actions
+        of the agent_selection are prepared again. Rewards are not part of a
+        snapshot and are left as they are.
+        """
+        self.game.data[:] = snapshot.data
+        self.game.version += 1
+        if snapshot.rng_state is not None:
+            self.rng.setstate(snapshot.rng_state)
+        self.events.truncate(snapshot.event_count)
+        self._prepare_decision(rewards=False)
+
+    @property
+    def history(self) -> str:
+        """
+        the public history of the game, rendered from the event log
+        """
+        return self.events.render()
+
+    def add_to_history(
+        self,
+        event: Event,
+        actor: int = -1,
+        target: int = -1,
+        card: int = -1,
+        outcome: int = 0,
+    ):
+        """
+        logs an event; it is only rendered as text when verbose or when a history is
+        asked for
+        """
+        self.core.log(event, actor, target, card, outcome)
 
     def step(self, action: int):
         """
@@ -410,26 +716,33 @@ class raw_env(AECEnv):
         - infos
         - agent_selection (to the next agent)
         And any internal state used by observe() or render()
-        """
 
+        It also sets the current_actions of the next agent_selection, so they never
+        need to be asked for before a step. When the game ends, the winner is
+        rewarded 1 and every other player -1.
+        """
+        if self.fast:
+            index = self._legal_index(action)
+            if self.verbose:
+                self._print_step(action, self.action_specs[index])
+            self.core.step(*self.action_codes[index])
+            self._prepare_decision()
+            return
 
         player = self.players[int(self.agent_selection)]
         # action is a number, so we need to retrieve the action specification
 
-        action_spec = player.current_actions[action]
+        if self.fixed_actions:
+            assert action in self.legal_actions(player), "action must be legal"
+            action_spec = self.action_specs[action]
+        else:
+            action_spec = player.current_actions[action]
 
         # if action_spec.name in ACTION_TO_CARD and ACTION_TO_CARD[action_spec.name] not in player.hidden_cards:
 
 
         if self.verbose:
-            print(
-                self.turn_agent,
-                self.agent_selection,
-                action,
-                action_spec.name,
-                action_spec.target,
-                self.observe(self.agent_selection),
-            )
+            self._print_step(action, action_spec)
         if action_spec.name == Action.AMBASSADOR_EXCHANGE_3:
             assert len(player.hidden_cards) == 1, "player must have 1 hidden card"
         elif action_spec.name == Action.AMBASSADOR_EXCHANGE_4:
@@ -439,496 +752,955 @@ class raw_env(AECEnv):
         else:
             assert action_spec.target is not None, "action_spec.target must not be None"
 
-        if action_spec.name == Action.INCOME:
-            self.add_to_history(f"Player {self.agent_selection} takes income")
-            player.coins += 1
-
-            self.status = AgentStatus.TURN
-            observation = self.observe(self.agent_selection)
-
-            self.agent_selection = str(self.next_alive_agent(int(self.agent_selection)))
-            self.turn_agent = self.next_alive_agent(self.turn_agent)
-
-        elif action_spec.name == Action.FOREIGN_AID:
-            self.add_to_history(
-                f"Player {self.agent_selection} attempts to take foreign aid"
-            )
-            self.status = AgentStatus.CAN_BLOCK_FOREIGN_AID
-            self.agent_selection = str(1) if self.turn_agent == 0 else str(0)
-
-        elif action_spec.name in [Action.BLOCK_FOREIGN_AID, Action.LET_FOREIGN_AID]:
-            if action_spec.name == Action.BLOCK_FOREIGN_AID:
-                self.blocking_players.append(self.agent_selection)
+        key = (self.game.data[state.STATUS], action_spec.name.value)
+        assert key in self.core.handlers, "action must be legal in the current status"
+        self.core.step(
+            action_spec.name.value,
+            state.EMPTY if action_spec.target is None else action_spec.target,
+        )
+        self._prepare_decision()
 
-            last_alive_index = max(
-                [i for i, x in enumerate(self.terminations.values()) if not x]
-            )
+    def _legal_index(self, action: int) -> int:
+        """
+        returns the fixed index of action, raising ValueError unless it is one of the
+        legal actions prepared for the current decision
+        """
+        legal = self._next_legal_actions
+        if self.fixed_actions:
+            if action not in legal:
+                raise ValueError(f"action {action} is not legal")
+            return action
+        if not 0 <= action < len(legal):
+            raise ValueError(f"action {action} is not legal")
+        return legal[action]
+
+    def _print_step(self, action: int, action_spec: ActionSpecification):
+        print(
+            self.turn_agent,
+            self.agent_selection,
+            action,
+            action_spec.name,
+            action_spec.target,
+            self.observe(self.agent_selection),
+        )
+
+    def _prepare_decision(self, rewards: bool = True):
+        """
+        sets the current_actions of the agent_selection, or the rewards once the
+        game is over unless rewards is False
+        """
+        data = self.core.data
+        if data[state.DONE]:
+            self._next_legal_actions = ()
+            if not rewards:
+                return
+            terminations = data[state.TERMINATIONS]
+            for i, agent_id in enumerate(self.agents):
+                reward = -1 if terminations >> i & 1 else 1
+                self.rewards[agent_id] = reward
+                self._cumulative_rewards[agent_id] += reward
+            return
+
+        seat = data[state.AGENT_SELECTION]
+        legal = self.core.legal_actions(seat)
+        self._next_legal_actions = legal
+        specs = self.action_specs
+        self.players[seat].current_actions = [specs[i] for i in legal]
+
+    def step_observe(
+        self, action: int
+    ) -> Tuple[str, np.ndarray, np.ndarray, float, bool, bool]:
+        """
+        steps action and returns what the next decision needs in one call:
+        (agent_id, observation, action_mask, reward, terminated, truncated) for the
+        next agent_selection. The mask is over action_specs whatever fixed_actions
+        is, terminated is whether the game is over and the reward is the one of
+        agent_id on this step. The observation is a view, see observe(), and the
+        mask is read-only and shared with other decisions, so copy it to change it.
+        """
+        self.step(action)
+        agent_id = self.agent_selection
+        return (
+            agent_id,
+            self.observe(agent_id),
+            self._legal_mask(self._next_legal_actions),
+            self.rewards[agent_id],
+            self.done,
+            self.truncations[agent_id],
+        )
+
+    def reaction_agents(self) -> List[str]:
+        """
+        returns the agents that answer the current decision together: every responder
+        of a challenge or foreign aid window in the order they would step, or just
+        the agent_selection otherwise
+        """
+        return [str(seat) for seat in self.core.responders()]
 
-            if self.agent_selection == str(last_alive_index) or (
-                self.agent_selection == str(last_alive_index - 1)
-                and last_alive_index == self.turn_agent
-            ):
-                if len(self.blocking_players) == 0:
-                    self.add_to_history("No one blocks foreign aid")
-                    self.players[self.turn_agent].coins += 2
-
-                    self.turn_agent = self.next_alive_agent(self.turn_agent)
-                    self.agent_selection = str(self.turn_agent)
-                    self.status = AgentStatus.TURN
-
-                else:
-                    self.blocking_agent = int(random.choice(self.blocking_players))
-                    self.add_to_history(
-                        f"Player {self.blocking_agent} blocks foreign aid"
-                    )
-
-                    self.blocking_players = []
-                    self.status = AgentStatus.CAN_CHALLENGE
-                    self.action_to_challenge = ActionSpecification(
-                        Action.BLOCK_FOREIGN_AID
-                    )
-                    self.agent_selection = str(self.turn_agent)
-
-        elif action_spec.name == Action.COUP:
-            self.add_to_history(
-                f"Player {self.agent_selection} coups player {action_spec.target}"
-            )
+    def observe_reactions(self) -> np.ndarray:
+        """
+        returns the observations of reaction_agents() stacked in one array, for a
+        single batched forward pass of a policy
+        """
+        return np.stack([self.observe(agent_id) for agent_id in self.reaction_agents()])
 
-            player.coins -= 7
-            self.status = AgentStatus.LOSE_INFLUENCE
-            self.agent_selection = str(action_spec.target)
-
-        elif action_spec.name == Action.LOSE_INFLUENCE:
-            self.add_to_history(f"Player {self.agent_selection} loses influence: card {action_spec.target} ({CARD_TO_STRING[player.hidden_cards[action_spec.target]]})")  # type: ignore
-
-            card = player.hidden_cards[action_spec.target]  # type: ignore
-            del player.hidden_cards[action_spec.target]  # type: ignore
-            player.visible_cards.append(card)
-
-            if len(player.hidden_cards) == 0:
-                self.terminations[self.agent_selection] = True
-                self.alive_count -= 1
-                if self.alive_count == 1:
-                    self.done = True
-                    return
-            if self.action_to_challenge and self.action_to_challenge.name == Action.AMBASSADOR and self.turn_agent != int(self.agent_selection):  # type: ignore
-                self.status = AgentStatus.AMBASSADOR_EXCHANGE
-                self.agent_selection = str(self.turn_agent)
+    def step_reactions(self, actions: Dict[str, int]):
+        """
+        ParallelEnv-style step of a whole reaction window: actions maps every agent of
+        reaction_agents() to its action, a fixed action index with fixed_actions and
+        an index into its current_actions otherwise (the same list for every
+        responder). The answers are resolved like the sequence of step() calls they
+        replace.
+        """
+        agents = self.reaction_agents()
+        if self.fast:
+            if actions.keys() != set(agents):
+                raise ValueError("every responder must answer")
+            if len(agents) > 1:
+                # every responder of a window has the same legal actions
+                indices = [self._legal_index(actions[agent_id]) for agent_id in agents]
+                self.core.respond([self.action_codes[i][0] for i in indices])
+                self._prepare_decision()
+                return
+        assert sorted(actions) == sorted(agents), "every responder must answer"
+        if len(agents) == 1:
+            self.step(actions[agents[0]])
+            return
+
+        names = []
+        for agent_id in agents:
+            player = self.players[int(agent_id)]
+            if self.fixed_actions:
+                assert actions[agent_id] in self.legal_actions(
+                    player
+                ), "action must be legal"
+                action_spec = self.action_specs[actions[agent_id]]
             else:
-                self.status = AgentStatus.TURN
-
-                self.turn_agent = self.next_alive_agent(self.turn_agent)
-                self.agent_selection = str(self.turn_agent)
-
-        elif action_spec.name == Action.LET_ASSASSINATION:
-            self.add_to_history(
-                f"Player {self.agent_selection} lets assassination occur"
-            )
-            self.status = AgentStatus.LOSE_INFLUENCE
-
-        elif action_spec.name == Action.LET_STEAL:
-            self.add_to_history(f"Player {self.agent_selection} lets steal occur")
-            self.players[self.turn_agent].coins += 2
-            self.players[int(self.agent_selection)].coins -= 2
-
-            self.status = AgentStatus.TURN
-            self.turn_agent = self.next_alive_agent(self.turn_agent)
-            self.agent_selection = str(self.turn_agent)
-
-        elif action_spec.name == Action.AMBASSADOR_EXCHANGE_3:
-            assert len(player.hidden_cards) == 1, "player must have 1 hidden card"
-
-            cards = player.hidden_cards + self.players[self.turn_agent].ambassador_center_view  # type: ignore
-            keep = self.ambassador_mapping_3[action_spec.target]  # type: ignore
+                self.current_actions(player)
+                action_spec = player.current_actions[actions[agent_id]]
+            names.append(action_spec.name.value)
+        self.core.respond(names)
+        self._prepare_decision()
+
+    def add_step_hook(
+        self,
+        status: AgentStatus,
+        action: Action,
+        pre: Optional[Callable[["raw_env", ActionSpecification], None]] = None,
+        post: Optional[Callable[["raw_env", ActionSpecification], None]] = None,
+    ):
+        """
+        Calls pre(env, action_spec) before and post(env, action_spec) after the handler
+        of action in status (see core.STEP_HANDLERS), e.g. to time or count it. Hooks
+        stack, and handlers without hooks are called directly.
+        """
+        key = (status.value, action.value)
+        handler = self.core.handlers[key]
 
-            self.add_to_history(
-                f"Player {self.agent_selection} sees cards: {[CARD_TO_STRING[card] for card in cards]}; keeps cards {[CARD_TO_STRING[cards[index]] for index in keep]}",
-                ambassador=True,
+        def hooked(seat: int, action: int, target: int):
+            action_spec = ActionSpecification(
+                ACTIONS[action], None if target == state.EMPTY else target
             )
+            if pre is not None:
+                pre(self, action_spec)
+            handler(seat, action, target)
+            if post is not None:
+                post(self, action_spec)
 
-            player.hidden_cards = [cards[keep[0]]]
-            cards = cards[1:]
-
-            assert len(cards) == 2, "cards must have 2 elements"
-            self.center[-2:] = cards
+        self.core.handlers[key] = hooked
 
-            # shuffle the center
-            random.shuffle(self.center)
+    def remove_step_hooks(self):
+        self.core.reset_handlers()
 
-            # set the ambassador center view to None
-            self.players[self.turn_agent].ambassador_center_view = None
+    def next_alive_agent(self, i: int) -> int:
+        """
+        returns next alive agent
+        """
+        return self.core.next_alive(i)
 
-            self.turn_agent = self.next_alive_agent(self.turn_agent)
-            self.agent_selection = str(self.turn_agent)
-            self.status = AgentStatus.TURN
+    def resolve_challenge(
+        self, challenging_players: List[str], action_to_challenge: ActionSpecification
+    ) -> Optional[str]:
+        """
+        returns None if no one challenges, otherwise returns the player who loses influence
+        """
+        lose_influence = self.core.resolve_challenge(
+            [int(i) for i in challenging_players], action_to_challenge.name.value
+        )
+        return None if lose_influence == state.EMPTY else str(lose_influence)
 
-        elif action_spec.name == Action.AMBASSADOR_EXCHANGE_4:
-            assert len(player.hidden_cards) == 2, "player must have 1 hidden card"
 
-            cards = player.hidden_cards + self.players[self.turn_agent].ambassador_center_view  # type: ignore
-            keep = self.ambassador_mapping_4[action_spec.target]  # type: ignore
+class EnvPool:
+    """
+    Warm raw_env instances built with the same keyword arguments. acquire() hands
+    one out after reset_in_place, building it only if none is free, and release()
+    takes it back for the next caller. A worker that plays many short games, or
+    searches that need scratch envs, then pays for building an env once.
+    """
 
-            self.add_to_history(
-                f"Player {self.agent_selection} sees cards: {[CARD_TO_STRING[card] for card in cards]}; keeps cards {[CARD_TO_STRING[cards[index]] for index in keep]}",
-                ambassador=True,
-            )
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.free: List[raw_env] = []
+
+    def acquire(self, seed: Seed = None) -> raw_env:
+        env = self.free.pop() if self.free else raw_env(**self.kwargs)
+        env.reset_in_place(seed)
+        return env
+
+    def release(self, env: raw_env):
+        self.free.append(env)
+
+    def __len__(self) -> int:
+        return len(self.free)
+
+
+# statuses and actions as plain ints, used by the vectorized engine below
+_TURN = AgentStatus.TURN.value
+_STOLEN = AgentStatus.STOLEN.value
+_ASSASSINATED = AgentStatus.ASSASSINATED.value
+_CAN_CHALLENGE = AgentStatus.CAN_CHALLENGE.value
+_CAN_BLOCK_FOREIGN_AID = AgentStatus.CAN_BLOCK_FOREIGN_AID.value
+_LOSE_INFLUENCE = AgentStatus.LOSE_INFLUENCE.value
+_AMBASSADOR_EXCHANGE = AgentStatus.AMBASSADOR_EXCHANGE.value
+
+_CLAIMS = [
+    Action.DUKE,
+    Action.ASSASSIN,
+    Action.BLOCK_ASSASSINATION,
+    Action.CAPTAIN,
+    Action.BLOCK_STEAL_WITH_AMBASSADOR,
+    Action.BLOCK_STEAL_WITH_CAPTAIN,
+    Action.AMBASSADOR,
+]
+_BLOCKS = [
+    Action.BLOCK_ASSASSINATION,
+    Action.BLOCK_STEAL_WITH_AMBASSADOR,
+    Action.BLOCK_STEAL_WITH_CAPTAIN,
+]
+
+# card claimed by each action, indexed by Action value (-1 if the action claims nothing)
+_ACTION_TO_CARD_VALUE = np.full(len(Action), -1, dtype=np.int8)
+for _action, _card in ACTION_TO_CARD.items():
+    _ACTION_TO_CARD_VALUE[_action.value] = _card.value
+
+
+class BatchCoupEnv:
+    """
+    Steps num_envs Coup games in lockstep. The state of every game is held as
+    structure-of-arrays NumPy buffers with a leading game axis, and step() resolves
+    each action type for all the games that chose it with one vectorized update.
 
-            player.hidden_cards = [cards[keep[0]], cards[keep[1]]]
-            cards = cards[2:]
+    The transition rules are the ones of core.CoupCore, which raw_env plays on: a
+    reaction window is answered by every alive player other than the turn agent in
+    ascending seat order (only the turn agent answers a block), and it is resolved
+    once the last of them has answered.
 
-            assert len(cards) == 2, "cards must have 2 elements"
-            self.center[-2:] = cards
+    Actions are indices into the fixed table self.action_specs (utils.action_table),
+    and legal_mask() returns the legal indices for the agent_selection of every game.
+    """
 
-            # shuffle the center
-            random.shuffle(self.center)
+    def __init__(
+        self,
+        num_envs: int,
+        player_count: int = 2,
+        seed: Seed = None,
+        autoreset: bool = True,
+    ):
+        assert (
+            player_count <= 6 and player_count >= 2
+        ), "player_count must be between 2 and 6"
 
-            # set the ambassador center view to None
-            self.players[self.turn_agent].ambassador_center_view = None
+        self.num_envs = num_envs
+        self.player_count = player_count
+        self.autoreset = autoreset
+        self.seed_sequence = seed_sequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+        self.ambassador_mapping_3 = np.array(map_combinations(3, 1), dtype=np.intp)
+        self.ambassador_mapping_4 = np.array(map_combinations(4, 2), dtype=np.intp)
+        # the positions each keep-choice gives up, which go into the center
+        self._given_up_3 = np.array(
+            [[i for i in range(3) if i not in keep] for keep in map_combinations(3, 1)],
+            dtype=np.intp,
+        )
+        self._given_up_4 = np.array(
+            [[i for i in range(4) if i not in keep] for keep in map_combinations(4, 2)],
+            dtype=np.intp,
+        )
+
+        self.action_specs = action_table(player_count)
+        self._spec_to_index = action_index_table(player_count)
+        self._columns = {
+            action: np.array(indices, dtype=np.intp)
+            for action, indices in action_columns(player_count).items()
+        }
+        self.action_names = np.array(
+            [spec.name.value for spec in self.action_specs], dtype=np.int8
+        )
+        self.action_targets = np.array(
+            [-1 if spec.target is None else spec.target for spec in self.action_specs],
+            dtype=np.int8,
+        )
+        # legal actions by decision context, see legal_mask
+        self._templates = self._build_templates()
+
+        n, p = num_envs, player_count
+        self.coins = np.zeros((n, p), dtype=np.int16)
+        self.hidden_cards = np.full((n, p, 2), -1, dtype=np.int8)
+        self.visible_cards = np.full((n, p, 2), -1, dtype=np.int8)
+        self.alive = np.ones((n, p), dtype=bool)
+        self.status = np.zeros(n, dtype=np.int8)
+        self.turn_agent = np.zeros(n, dtype=np.int8)
+        self.agent_selection = np.zeros(n, dtype=np.int8)
+        self.action_to_challenge = np.full(n, -1, dtype=np.int8)
+        self.challenge_target = np.full(n, -1, dtype=np.int8)
+        self.blocking_agent = np.full(n, -1, dtype=np.int8)
+        self.challenging_players = np.zeros((n, p), dtype=bool)
+        self.blocking_players = np.zeros((n, p), dtype=bool)
+        self.center = np.zeros((n, 3), dtype=np.int8)
+        self.ambassador_center_view = np.full((n, 2), -1, dtype=np.int8)
+        self.deck_counts = np.zeros((n, len(Cards)), dtype=np.int8)
+        self.done = np.zeros(n, dtype=bool)
+        self.winner = np.full(n, -1, dtype=np.int8)
+
+        self.reset()
+
+    def spawn(self, n: int) -> List[np.random.SeedSequence]:
+        """
+        returns n independent child seeds of this env's stream, for seeding other
+        envs or workers
+        """
+        return self.seed_sequence.spawn(n)
 
-            self.turn_agent = self.next_alive_agent(self.turn_agent)
-            self.agent_selection = str(self.turn_agent)
-            self.status = AgentStatus.TURN
+    @property
+    def action_count(self) -> int:
+        return len(self.action_specs)
 
-        elif (
-            action_spec.name == Action.DUKE
-            or action_spec.name == Action.ASSASSIN
-            or action_spec.name == Action.BLOCK_ASSASSINATION
-            or action_spec.name == Action.CAPTAIN
-            or action_spec.name == Action.BLOCK_STEAL_WITH_AMBASSADOR
-            or action_spec.name == Action.BLOCK_STEAL_WITH_CAPTAIN
-            or action_spec.name == Action.AMBASSADOR
-        ):
-            if action_spec.name == Action.ASSASSIN:
-                self.players[self.turn_agent].coins -= 3
-
-            # printing stuff
-            if action_spec.name == Action.DUKE:
-                self.add_to_history(f"Player {self.agent_selection} claims Duke")
-            elif action_spec.name == Action.ASSASSIN:
-                self.add_to_history(f"Player {self.agent_selection} claims Assassin")
-            elif action_spec.name == Action.BLOCK_ASSASSINATION:
-                self.add_to_history(f"Player {self.agent_selection} claims Contessa")
-            elif action_spec.name == Action.CAPTAIN:
-                self.add_to_history(
-                    f"Player {self.agent_selection} claims Captain to steal from player {action_spec.target}"
-                )
+    def action_index(self, action_spec: ActionSpecification) -> int:
+        return self._spec_to_index[(action_spec.name, action_spec.target)]
 
-            elif action_spec.name == Action.BLOCK_STEAL_WITH_AMBASSADOR:
-                self.add_to_history(
-                    f"Player {self.agent_selection} claims Ambassador to block steal"
+    def reset(self, seed: Seed = None):
+        """
+        deals a fresh game into every slot
+        """
+        if seed is not None:
+            self.seed_sequence = seed_sequence(seed)
+            self.rng = np.random.default_rng(self.seed_sequence)
+        self._reset_games(np.arange(self.num_envs))
+
+    def _reset_games(self, games: np.ndarray):
+        k, p = len(games), self.player_count
+
+        # a random permutation of the 15 card deck per game: two cards per player,
+        # then three for the center, and the rest stays in the deck
+        deck = np.repeat(np.arange(len(Cards), dtype=np.int8), 3)
+        shuffled = deck[np.argsort(self.rng.random((k, len(deck))), axis=1)]
+        self.hidden_cards[games] = shuffled[:, : 2 * p].reshape(k, p, 2)
+        self.center[games] = shuffled[:, 2 * p : 2 * p + 3]
+        rest = shuffled[:, 2 * p + 3 :]
+        self.deck_counts[games] = (
+            rest[:, :, None] == np.arange(len(Cards), dtype=np.int8)
+        ).sum(axis=1)
+
+        self.coins[games] = 2
+        self.visible_cards[games] = -1
+        self.alive[games] = True
+        self.status[games] = _TURN
+        self.turn_agent[games] = 0
+        self.agent_selection[games] = 0
+        self.action_to_challenge[games] = -1
+        self.challenge_target[games] = -1
+        self.blocking_agent[games] = -1
+        self.challenging_players[games] = False
+        self.blocking_players[games] = False
+        self.ambassador_center_view[games] = -1
+        self.done[games] = False
+        self.winner[games] = -1
+
+    def load_game(self, i: int, env: raw_env):
+        """
+        copies the current state of a raw_env into game slot i
+        """
+        for p, player in enumerate(env.players):
+            self.coins[i, p] = player.coins
+            self.hidden_cards[i, p] = -1
+            self.hidden_cards[i, p, : len(player.hidden_cards)] = [
+                card.value for card in player.hidden_cards
+            ]
+            self.visible_cards[i, p] = -1
+            self.visible_cards[i, p, : len(player.visible_cards)] = [
+                card.value for card in player.visible_cards
+            ]
+            self.alive[i, p] = not env.terminations[str(p)]
+            self.challenging_players[i, p] = str(p) in env.challenging_players
+            self.blocking_players[i, p] = str(p) in env.blocking_players
+
+        self.status[i] = env.status.value
+        self.turn_agent[i] = env.turn_agent
+        self.agent_selection[i] = int(env.agent_selection)
+        action_to_challenge = env.action_to_challenge
+        if action_to_challenge is None:
+            self.action_to_challenge[i] = -1
+            self.challenge_target[i] = -1
+        else:
+            self.action_to_challenge[i] = action_to_challenge.name.value
+            self.challenge_target[i] = (
+                -1 if action_to_challenge.target is None else action_to_challenge.target
+            )
+        self.blocking_agent[i] = (
+            -1 if env.blocking_agent is None else int(env.blocking_agent)
+        )
+        view = env.players[env.turn_agent].ambassador_center_view
+        center = [card.value for card in env.center]
+        if view is None:
+            self.ambassador_center_view[i] = -1
+        else:
+            # the cards looked at are the last two of this engine's center (a failed
+            # challenge of the ambassador can have swapped one of them out)
+            self.ambassador_center_view[i] = [card.value for card in view]
+            for card in view:
+                if card.value in center:
+                    center.remove(card.value)
+                    center.append(card.value)
+        self.center[i] = center
+        self.deck_counts[i] = env.deck_counts
+        self.done[i] = env.done
+        self.winner[i] = (
+            [p for p in range(self.player_count) if not env.terminations[str(p)]][0]
+            if env.done
+            else -1
+        )
+
+    @staticmethod
+    def _first_keeps(cards: np.ndarray, mapping: np.ndarray) -> np.ndarray:
+        """
+        returns which keep-choices of mapping are the first to keep their cards out
+        of each row of cards, like core.exchange_targets
+        """
+        kept = np.sort(cards[:, mapping], axis=2).astype(np.intp)
+        codes = (kept * len(Cards) ** np.arange(mapping.shape[1])).sum(axis=2)
+        earlier = np.tri(len(mapping), k=-1, dtype=bool)
+        same = codes[:, :, None] == codes[:, None, :]
+        return ~(same & earlier).any(axis=2)
+
+    def _mask_rules(
+        self,
+        status: np.ndarray,
+        coins: np.ndarray,
+        targets: np.ndarray,
+        hidden_count: np.ndarray,
+    ) -> np.ndarray:
+        """
+        returns the legal actions of decisions with the given status (-1 once the
+        game is over), coins, alive opponents and number of hidden cards, before
+        equivalent exchanges are removed
+        """
+        turn = status == _TURN
+        claims = turn & (coins < 10)
+
+        mask = np.zeros((len(status), self.action_count), dtype=bool)
+        columns = self._columns
+        for action in [Action.INCOME, Action.FOREIGN_AID, Action.AMBASSADOR, Action.DUKE]:
+            mask[:, columns[action]] = claims[:, None]
+        # the assassin is offered regardless of coins, like in raw_env.current_actions
+        for action in [Action.CAPTAIN, Action.ASSASSIN]:
+            mask[:, columns[action]] = claims[:, None] & targets
+        mask[:, columns[Action.COUP]] = (turn & (coins >= 7))[:, None] & targets
+
+        for action in [
+            Action.BLOCK_STEAL_WITH_AMBASSADOR,
+            Action.BLOCK_STEAL_WITH_CAPTAIN,
+            Action.LET_STEAL,
+        ]:
+            mask[:, columns[action]] = (status == _STOLEN)[:, None]
+        for action in [Action.BLOCK_ASSASSINATION, Action.LET_ASSASSINATION]:
+            mask[:, columns[action]] = (status == _ASSASSINATED)[:, None]
+        for action in [Action.CHALLENGE, Action.NO_CHALLENGE]:
+            mask[:, columns[action]] = (status == _CAN_CHALLENGE)[:, None]
+        for action in [Action.BLOCK_FOREIGN_AID, Action.LET_FOREIGN_AID]:
+            mask[:, columns[action]] = (status == _CAN_BLOCK_FOREIGN_AID)[:, None]
+
+        exchange = status == _AMBASSADOR_EXCHANGE
+        mask[:, columns[Action.AMBASSADOR_EXCHANGE_3]] = (
+            exchange & (hidden_count == 1)
+        )[:, None]
+        mask[:, columns[Action.AMBASSADOR_EXCHANGE_4]] = (
+            exchange & (hidden_count == 2)
+        )[:, None]
+        mask[:, columns[Action.LOSE_INFLUENCE]] = (status == _LOSE_INFLUENCE)[
+            :, None
+        ] & (np.arange(2) < hidden_count[:, None])
+        return mask
+
+    def _context(
+        self,
+        status: np.ndarray,
+        tier: np.ndarray,
+        opponents: np.ndarray,
+        hidden_count: np.ndarray,
+    ) -> np.ndarray:
+        """
+        returns the row of _templates of each decision: the status (-1 once the game
+        is over), the coin tier (how many of 3, 7 and 10 coins are reached), the
+        bitmask of alive opponents and the number of hidden cards
+        """
+        return (((status + 1) * 4 + tier) << self.player_count | opponents) * 3 + (
+            hidden_count
+        )
+
+    def _build_templates(self) -> np.ndarray:
+        p = self.player_count
+        status, tier, opponents, hidden_count = (
+            axis.ravel()
+            for axis in np.meshgrid(
+                np.arange(-1, len(AgentStatus)),
+                np.arange(4),
+                np.arange(1 << p),
+                np.arange(3),
+                indexing="ij",
+            )
+        )
+        templates = np.zeros((len(status), self.action_count), dtype=bool)
+        coins = np.array([0, 3, 7, 10])[tier]
+        targets = (opponents[:, None] >> np.arange(p) & 1).astype(bool)
+        rows = self._context(status, tier, opponents, hidden_count)
+        templates[rows] = self._mask_rules(status, coins, targets, hidden_count)
+        return templates
+
+    def legal_mask(self) -> np.ndarray:
+        """
+        returns a (num_envs, action_count) boolean mask of the legal actions of every
+        game's agent_selection; finished games have no legal actions. The mask of
+        each game is looked up in _templates by its decision context, and only
+        exchanges look at the cards.
+        """
+        n, p = self.num_envs, self.player_count
+        games = np.arange(n)
+        selection = self.agent_selection.astype(np.intp)
+        coins = self.coins[games, selection]
+        hidden = self.hidden_cards[games, selection]
+        hidden_count = (hidden >= 0).sum(axis=1)
+        targets = self.alive & (np.arange(p) != selection[:, None])
+        status = np.where(self.done, -1, self.status).astype(np.intp)
+
+        tier = (coins >= 3).astype(np.intp) + (coins >= 7) + (coins >= 10)
+        opponents = targets @ (1 << np.arange(p))
+        mask = self._templates[self._context(status, tier, opponents, hidden_count)]
+
+        exchange = np.nonzero(status == _AMBASSADOR_EXCHANGE)[0]
+        if len(exchange):
+            hidden = hidden[exchange]
+            view = self.ambassador_center_view[exchange]
+            columns = self._columns
+            mask[exchange[:, None], columns[Action.AMBASSADOR_EXCHANGE_3]] &= (
+                self._first_keeps(
+                    np.concatenate([hidden[:, :1], view], axis=1),
+                    self.ambassador_mapping_3,
                 )
-
-            elif action_spec.name == Action.BLOCK_STEAL_WITH_CAPTAIN:
-                self.add_to_history(
-                    f"Player {self.agent_selection} claims Ambassador to block steal"
+            )
+            mask[exchange[:, None], columns[Action.AMBASSADOR_EXCHANGE_4]] &= (
+                self._first_keeps(
+                    np.concatenate([hidden, view], axis=1), self.ambassador_mapping_4
                 )
-            elif action_spec.name == Action.AMBASSADOR:
-                self.add_to_history(f"Player {self.agent_selection} claims Ambassador")
+            )
+        return mask
 
-            # end printing stuff
+    def observe(self) -> np.ndarray:
+        """
+        returns the (num_envs, 3 * player_count) observations of every game's
+        agent_selection, laid out like raw_env.observe
+        """
+        n, p = self.num_envs, self.player_count
+        hidden = self.hidden_cards
+        visible = self.visible_cards
+        hidden_count = (hidden >= 0).sum(axis=2)
+
+        # other players' hidden cards are observed as -1
+        own = np.arange(p) == self.agent_selection[:, None]
+        hidden = np.where(own[:, :, None] | (hidden < 0), hidden, -1)
+
+        cards = np.empty((n, p, 2), dtype=np.int16)
+        cards[:, :, 0] = np.where(hidden_count >= 1, hidden[:, :, 0], visible[:, :, 0])
+        cards[:, :, 1] = np.where(
+            hidden_count == 2,
+            hidden[:, :, 1],
+            np.where(hidden_count == 1, visible[:, :, 0], visible[:, :, 1]),
+        )
+        return np.concatenate([cards.reshape(n, 2 * p), self.coins], axis=1)
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        takes one action index per game for its agent_selection. Actions must be legal
+        according to legal_mask(); the actions of finished games are ignored.
 
-            self.status = AgentStatus.CAN_CHALLENGE
-            self.action_to_challenge = action_spec
-            if (
-                action_spec.name == Action.BLOCK_ASSASSINATION
-                or action_spec.name == Action.BLOCK_STEAL_WITH_AMBASSADOR
-                or action_spec.name == Action.BLOCK_STEAL_WITH_CAPTAIN
-            ):
-                self.blocking_agent = int(self.agent_selection)
-                self.agent_selection = str(self.turn_agent)
-            else:
-                self.agent_selection = str(1) if self.turn_agent == 0 else str(0)
-
-        elif action_spec.name in [Action.CHALLENGE, Action.NO_CHALLENGE]:
-            if self.action_to_challenge.name == Action.BLOCK_FOREIGN_AID:  # type: ignore
-                if action_spec.name == Action.CHALLENGE:
-                    lose_influence = str(self.turn_agent) if Cards.DUKE in self.players[int(self.blocking_agent)].hidden_cards else self.blocking_agent  # type: ignore
-
-                    if lose_influence == str(self.turn_agent):
-                        self.add_to_history(
-                            f"Player {self.turn_agent} incorrectly challenges player {self.turn_agent} on the duke, so the foreign aid fails and player {self.turn_agent} loses a card."
-                        )
-                    else:
-                        self.add_to_history(
-                            f"Player {self.turn_agent} correctly challenges player {self.blocking_agent} on the duke, so the foreign aid succeeds and player {self.blocking_agent} loses a card."
-                        )
-
-                    assert (
-                        lose_influence is not None
-                    ), "lose_influence must not be None in FOREIGN_AID"
-
-                    self.status = AgentStatus.LOSE_INFLUENCE
-                    if lose_influence == self.blocking_agent:
-                        self.agent_selection = str(self.blocking_agent)
-                        self.players[self.turn_agent].coins += 2
-                    else:
-                        self.agent_selection = str(self.turn_agent)
-
-                else:
-                    self.add_to_history(
-                        f"Player {self.turn_agent} does not challenge, so the foreign aid is blocked."
-                    )
-                    self.status = AgentStatus.TURN
-                    self.turn_agent = self.next_alive_agent(self.turn_agent)
-                    self.agent_selection = str(self.turn_agent)
-
-                self.blocking_agent = None
+        returns (done, winner): which games finished on this step and the seat that
+        won each of them (-1 for the others). With autoreset, finished games are dealt
+        again before returning.
+        """
+        actions = np.asarray(actions)
+        live = ~self.done
+        names = np.where(live, self.action_names[actions], -1)
+        targets = self.action_targets[actions]
+
+        def chose(*chosen: Action) -> np.ndarray:
+            return np.nonzero(np.isin(names, [action.value for action in chosen]))[0]
+
+        games = chose(Action.INCOME)
+        if len(games):
+            self.coins[games, self.agent_selection[games]] += 1
+            self._end_turn(games)
+
+        games = chose(Action.FOREIGN_AID)
+        if len(games):
+            self.status[games] = _CAN_BLOCK_FOREIGN_AID
+            self.blocking_players[games] = False
+            self.agent_selection[games] = self._next_responder(
+                games, np.full(len(games), -1)
+            )
 
-            else:
-                if action_spec.name == Action.CHALLENGE:
-                    self.challenging_players.append(self.agent_selection)
+        games = chose(Action.BLOCK_FOREIGN_AID, Action.LET_FOREIGN_AID)
+        if len(games):
+            self._step_foreign_aid_reaction(games, names[games])
+
+        games = chose(Action.COUP)
+        if len(games):
+            self.coins[games, self.agent_selection[games]] -= 7
+            self.status[games] = _LOSE_INFLUENCE
+            self.agent_selection[games] = targets[games]
+
+        games = chose(Action.LOSE_INFLUENCE)
+        if len(games):
+            self._step_lose_influence(games, targets[games])
+
+        games = chose(Action.LET_ASSASSINATION)
+        if len(games):
+            self.status[games] = _LOSE_INFLUENCE
+
+        games = chose(Action.LET_STEAL)
+        if len(games):
+            self.coins[games, self.turn_agent[games]] += 2
+            self.coins[games, self.agent_selection[games]] -= 2
+            self._end_turn(games)
+
+        games = chose(Action.AMBASSADOR_EXCHANGE_3, Action.AMBASSADOR_EXCHANGE_4)
+        if len(games):
+            self._step_exchange(games, names[games], targets[games])
+
+        games = chose(*_CLAIMS)
+        if len(games):
+            self._step_claim(games, names[games], targets[games])
+
+        games = chose(Action.CHALLENGE, Action.NO_CHALLENGE)
+        if len(games):
+            self._step_challenge_reaction(games, names[games])
+
+        finished = self.done & live
+        winner = np.where(finished, self.winner, -1)
+        if self.autoreset and finished.any():
+            self._reset_games(np.nonzero(finished)[0])
+        return finished, winner
+
+    def _step_foreign_aid_reaction(self, games: np.ndarray, names: np.ndarray):
+        selection = self.agent_selection[games]
+        blocked = names == Action.BLOCK_FOREIGN_AID.value
+        self.blocking_players[games[blocked], selection[blocked]] = True
+
+        responder = self._next_responder(games, selection)
+        waiting = responder >= 0
+        self.agent_selection[games[waiting]] = responder[waiting]
+
+        games = games[~waiting]
+        any_block = self.blocking_players[games].any(axis=1)
+
+        let = games[~any_block]
+        self.coins[let, self.turn_agent[let]] += 2
+        self._end_turn(let)
+
+        block = games[any_block]
+        self.blocking_agent[block] = self._choose(self.blocking_players[block])
+        self.blocking_players[block] = False
+        self.status[block] = _CAN_CHALLENGE
+        self.action_to_challenge[block] = Action.BLOCK_FOREIGN_AID.value
+        self.challenge_target[block] = -1
+        self.agent_selection[block] = self.turn_agent[block]
+
+    def _step_lose_influence(self, games: np.ndarray, targets: np.ndarray):
+        selection = self.agent_selection[games]
+        hidden = self.hidden_cards[games, selection]
+        card = hidden[np.arange(len(games)), targets]
+
+        # remove the card from the hidden ones, keeping the order of the rest
+        remaining = np.where(targets[:, None] == 0, hidden[:, [1, 1]], hidden)
+        remaining[:, 1] = -1
+        self.hidden_cards[games, selection] = remaining
+        visible_count = (self.visible_cards[games, selection] >= 0).sum(axis=1)
+        self.visible_cards[games, selection, visible_count] = card
+
+        dead = remaining[:, 0] < 0
+        self.alive[games[dead], selection[dead]] = False
+        finished = self._check_done(games[dead])
+        self._end_turn(np.setdiff1d(games, finished))
+
+    def _step_exchange(self, games: np.ndarray, names: np.ndarray, targets: np.ndarray):
+        selection = self.agent_selection[games]
+        hidden = self.hidden_cards[games, selection]
+        view = self.ambassador_center_view[games]
+        given_up = np.empty_like(view)
+
+        three = names == Action.AMBASSADOR_EXCHANGE_3.value
+        rows = np.nonzero(three)[0]
+        cards = np.concatenate([hidden[rows, :1], view[rows]], axis=1)
+        keep = self.ambassador_mapping_3[targets[rows]]
+        hidden[rows] = -1
+        hidden[rows, :1] = np.take_along_axis(cards, keep, axis=1)
+        given_up[rows] = np.take_along_axis(
+            cards, self._given_up_3[targets[rows]], axis=1
+        )
+
+        rows = np.nonzero(~three)[0]
+        cards = np.concatenate([hidden[rows], view[rows]], axis=1)
+        keep = self.ambassador_mapping_4[targets[rows]]
+        hidden[rows] = np.take_along_axis(cards, keep, axis=1)
+        given_up[rows] = np.take_along_axis(
+            cards, self._given_up_4[targets[rows]], axis=1
+        )
+
+        self.hidden_cards[games, selection] = hidden
+        # the two cards given up take the place of the viewed ones, the last two of
+        # the center, which is reshuffled
+        self.center[games, 1:] = given_up
+        self.center[games] = self._shuffle_rows(self.center[games])
+        self.ambassador_center_view[games] = -1
+        self._end_turn(games)
+
+    def _step_claim(self, games: np.ndarray, names: np.ndarray, targets: np.ndarray):
+        assassin = games[names == Action.ASSASSIN.value]
+        self.coins[assassin, self.turn_agent[assassin]] -= 3
+
+        self.status[games] = _CAN_CHALLENGE
+        self.action_to_challenge[games] = names
+        self.challenge_target[games] = targets
+        self.challenging_players[games] = False
+
+        # blocks are answered by the turn agent, other claims by everyone else
+        block = np.isin(names, [action.value for action in _BLOCKS])
+        blocks = games[block]
+        self.blocking_agent[blocks] = self.agent_selection[blocks]
+        self.agent_selection[blocks] = self.turn_agent[blocks]
+
+        claims = games[~block]
+        self.agent_selection[claims] = self._next_responder(
+            claims, np.full(len(claims), -1)
+        )
+
+    def _step_challenge_reaction(self, games: np.ndarray, names: np.ndarray):
+        challenge = names == Action.CHALLENGE.value
+
+        foreign_aid = self.action_to_challenge[games] == Action.BLOCK_FOREIGN_AID.value
+        self._resolve_foreign_aid_block(games[foreign_aid], challenge[foreign_aid])
+        games, challenge = games[~foreign_aid], challenge[~foreign_aid]
+
+        selection = self.agent_selection[games]
+        self.challenging_players[games[challenge], selection[challenge]] = True
+
+        block = np.isin(
+            self.action_to_challenge[games], [action.value for action in _BLOCKS]
+        )
+        responder = np.where(block, -1, self._next_responder(games, selection))
+        waiting = responder >= 0
+        self.agent_selection[games[waiting]] = responder[waiting]
+
+        games = games[~waiting]
+        if len(games):
+            self._resolve_challenge(games)
+        self.challenging_players[games] = False
+        self.blocking_agent[games] = -1
+        self.action_to_challenge[games] = -1
+        self.challenge_target[games] = -1
+
+    def _resolve_foreign_aid_block(self, games: np.ndarray, challenge: np.ndarray):
+        blocking_agent = self.blocking_agent[games]
+        self.blocking_agent[games] = -1
+        self.action_to_challenge[games] = -1
+
+        self._end_turn(games[~challenge])
+
+        games, blocker = games[challenge], blocking_agent[challenge]
+        has_duke = (self.hidden_cards[games, blocker] == Cards.DUKE.value).any(axis=1)
+
+        # a wrong challenge costs the turn agent a card, a right one the blocker
+        turn_agent = self.turn_agent[games]
+        self.coins[games[~has_duke], turn_agent[~has_duke]] += 2
+        self.status[games] = _LOSE_INFLUENCE
+        self.agent_selection[games] = np.where(has_duke, turn_agent, blocker)
+
+    def _resolve_challenge(self, games: np.ndarray):
+        """
+        resolves the claim of every game whose challenge window is over
+        """
+        claimed = self.action_to_challenge[games]
+        challenged = np.where(
+            self.blocking_agent[games] >= 0,
+            self.blocking_agent[games],
+            self.turn_agent[games],
+        )
+        any_challenge = self.challenging_players[games].any(axis=1)
+
+        self._resolve_unchallenged(games[~any_challenge], claimed[~any_challenge])
+
+        games = games[any_challenge]
+        claimed, challenged = claimed[any_challenge], challenged[any_challenge]
+        challenger = self._choose(self.challenging_players[games])
+        card = _ACTION_TO_CARD_VALUE[claimed]
+        honest = (self.hidden_cards[games, challenged] == card[:, None]).any(axis=1)
+
+        self._resolve_bluff(games[~honest], claimed[~honest], challenged[~honest])
+        self._resolve_failed_challenge(
+            games[honest], claimed[honest], challenged[honest], challenger[honest]
+        )
+
+    def _resolve_unchallenged(self, games: np.ndarray, claimed: np.ndarray):
+        duke = games[claimed == Action.DUKE.value]
+        self.coins[duke, self.turn_agent[duke]] += 3
+        self._end_turn(duke)
+
+        for action, status in [
+            (Action.ASSASSIN, _ASSASSINATED),
+            (Action.CAPTAIN, _STOLEN),
+        ]:
+            attacked = games[claimed == action.value]
+            self.status[attacked] = status
+            self.agent_selection[attacked] = self.challenge_target[attacked]
+
+        self._end_turn(games[np.isin(claimed, [action.value for action in _BLOCKS])])
+
+        ambassador = games[claimed == Action.AMBASSADOR.value]
+        self.status[ambassador] = _AMBASSADOR_EXCHANGE
+        self.agent_selection[ambassador] = self.turn_agent[ambassador]
+        self._show_center(ambassador)
+
+    def _resolve_bluff(
+        self, games: np.ndarray, claimed: np.ndarray, challenged: np.ndarray
+    ):
+        # like raw_env, a caught contessa bluff eliminates the challenging turn agent
+        contessa = claimed == Action.BLOCK_ASSASSINATION.value
+        eliminated = games[contessa]
+        self._eliminate(eliminated, self.turn_agent[eliminated])
+        finished = self._check_done(eliminated)
+        self._end_turn(np.setdiff1d(eliminated, finished))
+
+        games, claimed, challenged = games[~contessa], claimed[~contessa], challenged[~contessa]
+        self.status[games] = _LOSE_INFLUENCE
+        self.agent_selection[games] = challenged
+
+        steal = games[
+            (claimed == Action.BLOCK_STEAL_WITH_AMBASSADOR.value)
+            | (claimed == Action.BLOCK_STEAL_WITH_CAPTAIN.value)
+        ]
+        self.coins[steal, self.turn_agent[steal]] += 2
+        self.coins[steal, self.blocking_agent[steal]] -= 2
+
+    def _resolve_failed_challenge(
+        self,
+        games: np.ndarray,
+        claimed: np.ndarray,
+        challenged: np.ndarray,
+        challenger: np.ndarray,
+    ):
+        # a target without a contessa that wrongly challenges an assassin dies outright
+        target = self.challenge_target[games]
+        no_contessa = ~(
+            self.hidden_cards[games, target] == Cards.CONTESSA.value
+        ).any(axis=1)
+        dies = (claimed == Action.ASSASSIN.value) & (challenger == target) & no_contessa
+        eliminated = games[dies]
+        self._eliminate(eliminated, challenger[dies])
+        finished = self._check_done(eliminated)
+        self._end_turn(np.setdiff1d(eliminated, finished))
+
+        games, claimed = games[~dies], claimed[~dies]
+        challenged, challenger = challenged[~dies], challenger[~dies]
+
+        duke = claimed == Action.DUKE.value
+        self.coins[games[duke], challenged[duke]] += 3
+
+        steal = games[claimed == Action.CAPTAIN.value]
+        self.coins[steal, self.turn_agent[steal]] += 2
+        self.coins[steal, self.challenge_target[steal]] -= 2
+
+        self._show_center(games[claimed == Action.AMBASSADOR.value])
+
+        # the challenged player shuffles the revealed card into the center and draws
+        hidden = self.hidden_cards[games, challenged]
+        card = _ACTION_TO_CARD_VALUE[claimed]
+        slot = np.argmax(hidden == card[:, None], axis=1)
+        pool = self._shuffle_rows(
+            np.concatenate([card[:, None], self.center[games]], axis=1)
+        )
+        hidden[np.arange(len(games)), slot] = pool[:, 0]
+        self.hidden_cards[games, challenged] = hidden
+        self.center[games] = pool[:, 1:]
+
+        self.status[games] = _LOSE_INFLUENCE
+        self.agent_selection[games] = challenger
+
+    def _show_center(self, games: np.ndarray):
+        # shuffle the center and show its last two cards to the turn agent
+        self.center[games] = self._shuffle_rows(self.center[games])
+        self.ambassador_center_view[games] = self.center[games, 1:]
+
+    def _eliminate(self, games: np.ndarray, seats: np.ndarray):
+        hidden = self.hidden_cards[games, seats]
+        visible = self.visible_cards[games, seats]
+        # the hidden cards are revealed after the ones that are already visible
+        self.visible_cards[games, seats] = np.where(
+            visible[:, :1] >= 0, np.stack([visible[:, 0], hidden[:, 0]], axis=1), hidden
+        )
+        self.hidden_cards[games, seats] = -1
+        self.alive[games, seats] = False
+
+    def _check_done(self, games: np.ndarray) -> np.ndarray:
+        """
+        marks the games with one alive player left as done and returns them
+        """
+        finished = games[self.alive[games].sum(axis=1) == 1]
+        self.done[finished] = True
+        self.winner[finished] = np.argmax(self.alive[finished], axis=1)
+        return finished
 
-                # get the maximum index whose element is False in self.terminations:
-                last_alive_index = max(
-                    [i for i, x in enumerate(self.terminations.values()) if not x]
-                )
-                if (
-                    self.agent_selection == str(last_alive_index)
-                    or (
-                        self.agent_selection == str(last_alive_index - 1)
-                        and last_alive_index == self.turn_agent
-                    )
-                    or self.action_to_challenge.name == Action.BLOCK_ASSASSINATION  # type: ignore
-                    or self.action_to_challenge.name == Action.BLOCK_STEAL_WITH_AMBASSADOR  # type: ignore
-                    or self.action_to_challenge.name == Action.BLOCK_STEAL_WITH_CAPTAIN  # type: ignore
-                    or self.action_to_challenge.name == Action.AMBASSADOR  # type: ignore
-                ):
-                    lose_influence = self.resolve_challenge(
-                        self.challenging_players, self.action_to_challenge  # type: ignore
-                    )
-
-                    if lose_influence is None:
-                        self.add_to_history(f"No one challenges")
-
-                        if self.action_to_challenge.name == Action.DUKE:  # type: ignore
-                            self.add_to_history(
-                                f"Player {self.turn_agent} successfully gains 3 coins"
-                            )
-                            self.players[self.turn_agent].coins += 3
-                            self.turn_agent = self.next_alive_agent(self.turn_agent)
-                            self.agent_selection = str(self.turn_agent)
-                            self.status = AgentStatus.TURN
-                        elif self.action_to_challenge.name == Action.ASSASSIN:  # type: ignore
-                            # check if contessa
-                            self.status = AgentStatus.ASSASSINATED
-                            self.agent_selection = str(self.action_to_challenge.target)  # type: ignore
-
-                        elif self.action_to_challenge.name == Action.CAPTAIN:  # type: ignore
-                            self.status = AgentStatus.STOLEN
-                            self.agent_selection = str(self.action_to_challenge.target)  # type: ignore
-
-                        elif self.action_to_challenge.name == Action.BLOCK_STEAL_WITH_AMBASSADOR or self.action_to_challenge.name == Action.BLOCK_STEAL_WITH_CAPTAIN or self.action_to_challenge.name == Action.BLOCK_ASSASSINATION:  # type: ignore
-                            self.turn_agent = self.next_alive_agent(self.turn_agent)
-                            self.agent_selection = str(self.turn_agent)
-                            self.status = AgentStatus.TURN
-
-                        elif self.action_to_challenge.name == Action.AMBASSADOR:  # type: ignore
-                            self.status = AgentStatus.AMBASSADOR_EXCHANGE
-                            self.agent_selection = str(self.turn_agent)
-
-                            random.shuffle(self.center)
-                            # take the last 2 cards from the center
-                            self.players[
-                                self.turn_agent
-                            ].ambassador_center_view = self.center[-2:]
-
-                    elif (self.blocking_agent is None and lose_influence == str(self.turn_agent)) or (self.blocking_agent is not None and lose_influence == str(self.blocking_agent)):  # type: ignore
-                        # this means the challenged player loses influence
-                        if (
-                            self.agent_selection == str(self.turn_agent)
-                            and self.action_to_challenge.name  # type: ignore
-                            == Action.BLOCK_ASSASSINATION
-                        ):
-                            self.add_to_history(
-                                f"The contessa was successfully challenged; immediately die."
-                            )
-
-                            player.visible_cards.extend(player.hidden_cards)
-                            player.hidden_cards = []
-                            self.terminations[str(self.agent_selection)] = True
-                            self.alive_count -= 1
-
-                            if self.alive_count == 1:
-                                self.done = True
-                                return
-
-                            self.turn_agent = self.next_alive_agent(self.turn_agent)
-                            self.agent_selection = str(self.turn_agent)
-                            self.status = AgentStatus.TURN
-                        else:
-                            challenged_agent = (
-                                self.blocking_agent
-                                if self.blocking_agent is not None
-                                else self.turn_agent
-                            )
-                            self.add_to_history(
-                                f"Player {challenged_agent} is successfully challenged, so they lose a card."
-                            )
-                            self.status = AgentStatus.LOSE_INFLUENCE
-                            self.agent_selection = str(challenged_agent)
-
-                            if (
-                                self.action_to_challenge.name  # type: ignore
-                                == Action.BLOCK_STEAL_WITH_AMBASSADOR
-                                or self.action_to_challenge.name  # type: ignore
-                                == Action.BLOCK_STEAL_WITH_CAPTAIN
-                            ):
-                                self.players[self.turn_agent].coins += 2
-                                self.players[self.blocking_agent].coins -= 2  # type: ignore
-
-                                self.status = AgentStatus.LOSE_INFLUENCE
-                                assert self.agent_selection == str(
-                                    self.blocking_agent
-                                ), "agent_selection must be blocking_agent"
-
-                    else:
-                        # the challenging player loses influence
-                        if (
-                            self.agent_selection != str(self.turn_agent)
-                            and self.action_to_challenge.name == Action.ASSASSIN  # type: ignore
-                            and Cards.CONTESSA
-                            not in player.hidden_cards  # TODO: this should be the targeted player, not player
-                        ):  # type: ignore  # if challenging assassin wrong, die if no contessa.
-                            self.add_to_history(
-                                f"Player actually has an assassin, so the challenge fails and they immediately die"
-                            )
-                            player.visible_cards.extend(player.hidden_cards)
-                            player.hidden_cards = []
-                            self.terminations[str(self.agent_selection)] = True
-                            self.alive_count -= 1
-
-                            if self.alive_count == 1:
-                                self.done = True
-                                return
-
-                            self.turn_agent = self.next_alive_agent(self.turn_agent)
-                            self.agent_selection = str(self.turn_agent)
-                            self.status = AgentStatus.TURN
-
-                        else:
-                            challenged_agent = (
-                                self.blocking_agent
-                                if self.blocking_agent is not None
-                                else self.turn_agent
-                            )
-                            self.add_to_history(
-                                f"Player {lose_influence} tried to challenge, but was unsuccessful. They lose a card, and player {challenged_agent} gets to shuffle in a new card from the deck."
-                            )
-
-                            # the challenger loses influence
-                            if self.action_to_challenge.name == Action.DUKE:  # type: ignore
-                                self.add_to_history(
-                                    f"Player {challenged_agent} successfully gains 3 coins"
-                                )
-                                self.players[challenged_agent].coins += 3
-
-                            elif self.action_to_challenge.name == Action.CAPTAIN:  # type: ignore
-                                self.add_to_history(
-                                    f"Player {self.turn_agent} successfully steals 2 coins"
-                                )
-                                self.players[self.turn_agent].coins += 2
-                                if self.blocking_agent:
-                                    self.players[self.blocking_agent].coins -= 2  # type: ignore
-                                else:
-                                    self.players[int(self.agent_selection)].coins -= 2
-
-                            elif (
-                                self.action_to_challenge.name  # type: ignore
-                                == Action.BLOCK_STEAL_WITH_AMBASSADOR
-                                or self.action_to_challenge.name  # type: ignore
-                                == Action.BLOCK_STEAL_WITH_CAPTAIN
-                            ):
-                                self.add_to_history(
-                                    f"Player {self.turn_agent} incorrectly challenges the blocked steal, so they lose a card"
-                                )
-                                self.status = AgentStatus.LOSE_INFLUENCE
-                                self.agent_selection = str(self.turn_agent)
-
-                            elif self.action_to_challenge.name == Action.AMBASSADOR:  # type: ignore
-                                self.status = AgentStatus.AMBASSADOR_EXCHANGE
-                                self.agent_selection = str(self.turn_agent)
-
-                                random.shuffle(self.center)
-                                # take the last 2 cards from the center
-                                self.players[
-                                    self.turn_agent
-                                ].ambassador_center_view = self.center[-2:]
-
-                            # the challenged player gets a random card
-                            # if self.blocking_agent:
-                            #     challenged_agent = self.players[self.blocking_agent] # type: ignore
-                            # else:
-                            #     challenged_agent = self.players[self.turn_agent]
-
-                            card_index = self.players[challenged_agent].hidden_cards.index(ACTION_TO_CARD[self.action_to_challenge.name])  # type: ignore
-
-                            shuffled_cards = [
-                                self.players[challenged_agent].hidden_cards[card_index]
-                            ] + self.center
-                            random.shuffle(shuffled_cards)
-                            self.players[challenged_agent].hidden_cards[
-                                card_index
-                            ] = shuffled_cards[0]
-                            self.center = shuffled_cards[1:]
-
-                            self.status = AgentStatus.LOSE_INFLUENCE
-                            self.agent_selection = str(lose_influence)
-
-                    self.challenging_players = []
-
-                    self.blocking_agent = None
-                else:
-                    self.agent_selection = str(
-                        self.next_alive_agent(int(self.agent_selection))
-                    )
-                    if self.agent_selection == str(self.turn_agent):
-                        # skip the turn agent
-                        self.agent_selection = str(
-                            self.next_alive_agent(int(self.agent_selection))
-                        )
-
-            self.action_to_challenge = None
+    def _end_turn(self, games: np.ndarray):
+        self.turn_agent[games] = self._next_alive(games, self.turn_agent[games])
+        self.agent_selection[games] = self.turn_agent[games]
+        self.status[games] = _TURN
 
-    def next_alive_agent(self, i: int) -> int:
+    def _next_alive(self, games: np.ndarray, seats: np.ndarray) -> np.ndarray:
         """
-        returns next alive agent
+        returns the next alive seat after each of seats
         """
-        i_old = i
-        i = (i + 1) % self.player_count
-        while self.terminations[str(i)]:
-            i = (i + 1) % self.player_count
-        assert i != i_old, "there is only one remaining player"
-        return i
+        p = self.player_count
+        order = (seats[:, None].astype(np.intp) + np.arange(1, p + 1)) % p
+        first = np.argmax(self.alive[games[:, None], order], axis=1)
+        return order[np.arange(len(games)), first]
 
-    def resolve_challenge(
-        self, challenging_players: List[str], action_to_challenge: ActionSpecification
-    ) -> Optional[str]:
+    def _next_responder(self, games: np.ndarray, after: np.ndarray) -> np.ndarray:
         """
-        returns None if no one challenges, otherwise returns the player who loses influence
+        returns the lowest alive seat above after that is not the turn agent, or -1
+        once the reaction window is over
         """
-        if len(challenging_players) == 0:
-            return None
-
-        challenging_player = random.choice(challenging_players)
+        seats = np.arange(self.player_count)
+        responders = (
+            self.alive[games]
+            & (seats > after[:, None])
+            & (seats != self.turn_agent[games][:, None])
+        )
+        return np.where(responders.any(axis=1), np.argmax(responders, axis=1), -1)
+
+    def _choose(self, candidates: np.ndarray) -> np.ndarray:
+        """
+        picks one candidate seat uniformly at random per row
+        """
+        return np.argmax(self.rng.random(candidates.shape) + candidates, axis=1)
 
-        # check if the action was a bluff
-        if self.action_to_challenge.name == Action.BLOCK_ASSASSINATION or self.action_to_challenge.name == Action.BLOCK_STEAL_WITH_AMBASSADOR or self.action_to_challenge.name == Action.BLOCK_STEAL_WITH_CAPTAIN:  # type: ignore
-            if (
-                ACTION_TO_CARD[action_to_challenge.name]
-                in self.players[self.blocking_agent].hidden_cards  # type: ignore
-            ):
-                # the action was not a bluff, so the challenger loses influence
-                return challenging_player
-            else:
-                # the action was a bluff, so the challenged player loses influence
-                return str(self.blocking_agent)
-        else:
-            if (
-                ACTION_TO_CARD[action_to_challenge.name]
-                in self.players[self.turn_agent].hidden_cards
-            ):
-                # the action was not a bluff, so the challenger loses influence
-                return challenging_player
-            else:
-                # the action was a bluff, so the challenged player loses influence
-                return str(self.turn_agent)  # type: ignore
+    def _shuffle_rows(self, a: np.ndarray) -> np.ndarray:
+        order = np.argsort(self.rng.random(a.shape), axis=1)
+        return np.take_along_axis(a, order, axis=1)
@@ -0,0 +1,177 @@
+from array import array
+from enum import IntEnum
+from typing import List, Optional
+
+from utils import CARD_TO_STRING, Cards, map_combinations
+
+CARDS = list(Cards)
+
+
+class Event(IntEnum):
+    INCOME = 0
+    FOREIGN_AID = 1
+    NO_FOREIGN_AID_BLOCK = 2
+    BLOCK_FOREIGN_AID = 3
+    COUP = 4
+    LOSE_INFLUENCE = 5
+    LET_ASSASSINATION = 6
+    LET_STEAL = 7
+    AMBASSADOR_EXCHANGE = 8
+    CLAIM = 9
+    FOREIGN_AID_BLOCK_CHALLENGE = 10
+    FOREIGN_AID_BLOCKED = 11
+    NO_CHALLENGE = 12
+    GAINS_3_COINS = 13
+    CONTESSA_BLUFF_CAUGHT = 14
+    CHALLENGE_SUCCEEDS = 15
+    ASSASSIN_CHALLENGE_FAILS = 16
+    CHALLENGE_FAILS = 17
+    STEALS_2_COINS = 18
+    BLOCKED_STEAL_CHALLENGE_FAILS = 19
+
+
+EVENTS = list(Event)
+
+# Text of each event, formatted with the actor, target, card and outcome fields.
+# Claims and ambassador exchanges are rendered separately.
+EVENT_TO_STRING = {
+    Event.INCOME: "Player {actor} takes income",
+    Event.FOREIGN_AID: "Player {actor} attempts to take foreign aid",
+    Event.NO_FOREIGN_AID_BLOCK: "No one blocks foreign aid",
+    Event.BLOCK_FOREIGN_AID: "Player {actor} blocks foreign aid",
+    Event.COUP: "Player {actor} coups player {target}",
+    Event.LOSE_INFLUENCE: "Player {actor} loses influence: card {target} ({card})",
+    Event.LET_ASSASSINATION: "Player {actor} lets assassination occur",
+    Event.LET_STEAL: "Player {actor} lets steal occur",
+    Event.FOREIGN_AID_BLOCKED: "Player {actor} does not challenge, so the foreign aid is blocked.",
+    Event.NO_CHALLENGE: "No one challenges",
+    Event.GAINS_3_COINS: "Player {actor} successfully gains 3 coins",
+    Event.CONTESSA_BLUFF_CAUGHT: "The contessa was successfully challenged; immediately die.",
+    Event.CHALLENGE_SUCCEEDS: "Player {actor} is successfully challenged, so they lose a card.",
+    Event.ASSASSIN_CHALLENGE_FAILS: "Player actually has an assassin, so the challenge fails and they immediately die",
+    Event.CHALLENGE_FAILS: "Player {actor} tried to challenge, but was unsuccessful. They lose a card, and player {target} gets to shuffle in a new card from the deck.",
+    Event.STEALS_2_COINS: "Player {actor} successfully steals 2 coins",
+    Event.BLOCKED_STEAL_CHALLENGE_FAILS: "Player {actor} incorrectly challenges the blocked steal, so they lose a card",
+}
+
+# the outcome of a FOREIGN_AID_BLOCK_CHALLENGE is 1 if the blocker had no duke
+FOREIGN_AID_BLOCK_CHALLENGE_TO_STRING = [
+    "Player {actor} incorrectly challenges player {target} on the duke, so the foreign aid fails and player {actor} loses a card.",
+    "Player {actor} correctly challenges player {target} on the duke, so the foreign aid succeeds and player {target} loses a card.",
+]
+
+# the card of a CLAIM is the claimed card, its outcome the kind of claim
+CLAIM = 0
+CLAIM_STEAL = 1
+CLAIM_BLOCK_STEAL = 2
+
+AMBASSADOR_MAPPINGS = {3: map_combinations(3, 1), 4: map_combinations(4, 2)}
+
+EVENT_SIZE = 5  # event code, actor, target, card, outcome
+
+
+def pack_cards(cards: List[int]) -> int:
+    """
+    packs up to four card values into one base 5 number
+    """
+    packed = 0
+    for card in reversed(cards):
+        packed = packed * len(CARDS) + card
+    return packed
+
+
+def unpack_cards(packed: int, count: int) -> List[int]:
+    cards = []
+    for _ in range(count):
+        cards.append(packed % len(CARDS))
+        packed //= len(CARDS)
+    return cards
+
+
+def event_to_string(
+    event: Event,
+    actor: int,
+    target: int,
+    card: int,
+    outcome: int,
+    viewer: Optional[int] = None,
+) -> str:
+    """
+    Renders one event as seen by player viewer, or as the public history when viewer
+    is None. Only the exchanging player sees the cards of an ambassador exchange.
+    """
+    if event == Event.AMBASSADOR_EXCHANGE:
+        if viewer != actor:
+            return f"Player {actor} uses ambassador, seeing two centering cards and potentially exchanging"
+        # the outcome is the number of cards seen, the card field packs them
+        cards = unpack_cards(card, outcome)
+        keep = AMBASSADOR_MAPPINGS[outcome][target]
+        return f"Player {actor} sees cards: {[CARD_TO_STRING[CARDS[c]] for c in cards]}; keeps cards {[CARD_TO_STRING[CARDS[cards[index]]] for index in keep]}"
+    if event == Event.CLAIM:
+        name = CARD_TO_STRING[CARDS[card]]
+        if outcome == CLAIM_STEAL:
+            return f"Player {actor} claims {name} to steal from player {target}"
+        if outcome == CLAIM_BLOCK_STEAL:
+            return f"Player {actor} claims {name} to block steal"
+        return f"Player {actor} claims {name}"
+    if event == Event.FOREIGN_AID_BLOCK_CHALLENGE:
+        template = FOREIGN_AID_BLOCK_CHALLENGE_TO_STRING[outcome]
+    else:
+        template = EVENT_TO_STRING[event]
+    return template.format(
+        actor=actor,
+        target=target,
+        card=CARD_TO_STRING[CARDS[card]] if card >= 0 else "",
+        outcome=outcome,
+    )
+
+
+class EventLog:
+    """
+    Append-only log of the events of a game, stored as EVENT_SIZE int16 fields per
+    event. Text is only rendered when a history is asked for.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = array("h")
+
+    def append(
+        self,
+        event: Event,
+        actor: int = -1,
+        target: int = -1,
+        card: int = -1,
+        outcome: int = 0,
+    ):
+        self.data.extend((event, actor, target, card, outcome))
+
+    def __len__(self) -> int:
+        return len(self.data) // EVENT_SIZE
+
+    def truncate(self, length: int):
+        """
+        drops the events after the first length ones
+        """
+        del self.data[length * EVENT_SIZE :]
+
+    def clear(self):
+        del self.data[:]
+
+    def event(self, i: int) -> tuple:
+        """
+        returns the (Event, actor, target, card, outcome) fields of event i
+        """
+        fields = self.data[i * EVENT_SIZE : (i + 1) * EVENT_SIZE]
+        return (EVENTS[fields[0]],) + tuple(fields[1:])
+
+    def render(self, viewer: Optional[int] = None) -> str:
+        """
+        returns the history as seen by player viewer, or the public one when viewer is
+        None, with one line per event
+        """
+        return "".join(
+            event_to_string(*self.event(i), viewer=viewer) + "\n"
+            for i in range(len(self))
+        )
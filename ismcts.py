@@ -0,0 +1,250 @@
+import math
+import time
+from typing import Dict, List, Optional
+
+import state
+from env import raw_env
+from utils import Action, AgentStatus, Seed, python_rng, seed_sequence
+
+AMBASSADOR_EXCHANGE = AgentStatus.AMBASSADOR_EXCHANGE.value
+
+
+class Node:
+    """
+    a node of the search tree, reached from its parent by one fixed action index
+    """
+
+    __slots__ = ("children", "visits", "available", "rewards")
+
+    def __init__(self, player_count: int):
+        self.children: Dict[int, "Node"] = {}
+        self.visits = 0
+        self.available = 1  # how often the action leading here was legal
+        self.rewards = [0.0] * player_count
+
+
+class ISMCTSAgent:
+    """
+    Single-observer information set Monte Carlo tree search for raw_env.
+
+    Each simulation deals the cards the searching player cannot see (the other
+    players' hidden cards, the center and the deck) at random from the cards that
+    are not visible to them, walks down one shared tree with UCB over the actions
+    that are legal in that deal, expands a node and finishes the game with random
+    play. The tree therefore only depends on what the searching player knows.
+
+    Call choose() on the player's turns and observe() with every action played in
+    the game, including the chosen ones, so the subtree of the position reached is
+    reused by the next search.
+    """
+
+    def __init__(
+        self,
+        player_count: int,
+        simulations: int = 1000,
+        time_limit: Optional[float] = None,
+        exploration: float = 0.7,
+        rollout_depth: int = 200,
+        seed: Seed = None,
+    ):
+        """
+        Args:
+            player_count (int): The number of players of the games to search.
+            simulations (int): The number of simulations per move.
+            time_limit (float): If given, a search also stops after this many seconds.
+            exploration (float): The UCB exploration constant.
+            rollout_depth (int): The number of random steps after which a rollout is
+                scored by the hidden cards left instead of by the winner.
+            seed (int or SeedSequence): Seed of the deals and rollouts.
+        """
+        self.player_count = player_count
+        self.simulations = simulations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        search_seed, env_seed = seed_sequence(seed).spawn(2)
+        self.rng = python_rng(search_seed)
+
+        # simulations run in a private env with its own random stream, so the game
+        # being played is untouched
+        self.env = raw_env(player_count=player_count, fixed_actions=True)
+        self.env.reset(seed=env_seed)
+
+        self.player: Optional[int] = None  # seat searched for by the last choose()
+        self.root: Optional[Node] = None
+        # actions played since the root was searched, None if one of them was hidden
+        self.pending: Optional[List[int]] = []
+        self.simulations_per_second = 0.0
+
+    def observe(self, env: raw_env, action: int):
+        """
+        records that action (an index valid for env.step) is about to be played in env
+        """
+        player = env.players[int(env.agent_selection)]
+        if env.fixed_actions:
+            action_spec = env.action_specs[action]
+        else:
+            action_spec = player.current_actions[action]
+
+        if self.pending is None:
+            return
+        if (
+            action_spec.name == Action.AMBASSADOR_EXCHANGE_3
+            or action_spec.name == Action.AMBASSADOR_EXCHANGE_4
+        ) and player.index != self.player:
+            # the cards another player keeps are not seen, so the tree is lost
+            self.pending = None
+            return
+        self.pending.append(
+            self.env.action_indices[(action_spec.name, action_spec.target)]
+        )
+
+    def choose(self, env: raw_env) -> int:
+        """
+        searches the position of env for its agent_selection and returns the chosen
+        action as an index valid for env.step
+        """
+        player = env.players[int(env.agent_selection)]
+        root = self.reuse_root() if player.index == self.player else None
+        if root is None:
+            root = Node(self.player_count)
+        self.player = player.index
+
+        snapshot = env.snapshot(rng=False)
+        # the event count belongs to env's log; the private log restarts empty for
+        # every simulation instead
+        snapshot.event_count = 0
+        start = time.perf_counter()
+        simulations = 0
+        while simulations < self.simulations and (
+            self.time_limit is None or time.perf_counter() - start < self.time_limit
+        ):
+            self.simulate(root, snapshot, player.index)
+            simulations += 1
+        elapsed = time.perf_counter() - start
+        self.simulations_per_second = simulations / elapsed if elapsed > 0 else 0.0
+
+        legal = env.legal_actions(player)
+        best = max(
+            legal,
+            key=lambda a: root.children[a].visits if a in root.children else -1,
+        )
+        self.root = root
+        self.pending = []
+
+        if env.fixed_actions:
+            return best
+        env.current_actions(player)
+        return env.action_specification_to_index(self.env.action_specs[best], player)
+
+    def reuse_root(self) -> Optional[Node]:
+        """
+        returns the node of the current position in the last tree, if there is one
+        """
+        node = self.root
+        if node is None or self.pending is None:
+            return None
+        for action in self.pending:
+            node = node.children.get(action)
+            if node is None:
+                return None
+        return node
+
+    def simulate(self, root: Node, snapshot: state.Snapshot, player: int):
+        env = self.env
+        env.restore(snapshot)
+        self.determinize(player)
+
+        node = root
+        path = [node]
+        while not env.done:
+            mover = int(env.agent_selection)
+            legal = list(dict.fromkeys(env.legal_actions(env.players[mover])))
+            untried = [a for a in legal if a not in node.children]
+            for a in legal:
+                if a in node.children:
+                    node.children[a].available += 1
+
+            if untried:
+                action = self.rng.choice(untried)
+                child = node.children[action] = Node(self.player_count)
+                env.step(action)
+                path.append(child)
+                break
+
+            children = node.children
+            action = max(
+                legal,
+                key=lambda a: children[a].rewards[mover] / children[a].visits
+                + self.exploration
+                * math.sqrt(math.log(children[a].available) / children[a].visits),
+            )
+            node = children[action]
+            env.step(action)
+            path.append(node)
+
+        rewards = self.rollout()
+        for node in path:
+            node.visits += 1
+            for p in range(self.player_count):
+                node.rewards[p] += rewards[p]
+
+    def determinize(self, player: int):
+        """
+        deals the cards player cannot see at random from the unseen ones: three of
+        each card less the visible cards, player's hidden cards and the center cards
+        player is looking at in an exchange. Any other view is stale, so it is
+        dealt again from the new center rather than giving its cards away.
+        """
+        game = self.env.game
+        data = game.data
+
+        unseen = [3] * state.CARD_KINDS
+        for p in range(self.player_count):
+            for card in game.hand(game.player(p) + state.VISIBLE):
+                unseen[card] -= 1
+        for card in game.hand(game.player(player) + state.HIDDEN):
+            unseen[card] -= 1
+        view = []
+        if (
+            data[state.STATUS] == AMBASSADOR_EXCHANGE
+            and data[state.VIEW_OWNER] == player
+        ):
+            view = game.hand(state.VIEW)
+            for card in view:
+                unseen[card] -= 1
+
+        pool = [card for card in range(state.CARD_KINDS) for _ in range(unseen[card])]
+        self.rng.shuffle(pool)
+
+        for p in range(self.player_count):
+            if p != player:
+                offset = game.player(p) + state.HIDDEN
+                count = game.hand_size(offset)
+                game.set_hand(offset, [pool.pop() for _ in range(count)])
+        center = [pool.pop() for _ in range(3 - len(view))] + view
+        game.set_counts(state.CENTER, center)
+        game.set_counts(state.DECK, [pool.pop() for _ in range(data[state.DECK_SIZE])])
+        assert not pool, "every unseen card is dealt"
+
+        if not view and game.hand_size(state.VIEW):
+            game.set_hand(state.VIEW, self.rng.sample(center, 2))
+
+    def rollout(self) -> List[float]:
+        """
+        plays the game out at random and returns every player's reward
+        """
+        env = self.env
+        for _ in range(self.rollout_depth):
+            if env.done:
+                break
+            agent = env.players[int(env.agent_selection)]
+            env.step(self.rng.choice(env.legal_actions(agent)))
+
+        game = env.game
+        hidden = [
+            game.hand_size(game.player(p) + state.HIDDEN)
+            for p in range(self.player_count)
+        ]
+        total = sum(hidden)
+        return [count / total for count in hidden]
@@ -0,0 +1,282 @@
+"""
+Multi-process self-play.
+
+Each worker process builds its own raw_env, plays games with a policy and sends the
+finished trajectories back in batches of NumPy arrays; the main process writes
+every batch to its own shard file. Envs never cross process boundaries, so the
+only data pickled is the trajectories themselves.
+
+Run with `python selfplay.py OUTPUT_DIR --games 10000 --workers 8`.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import random
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from env import raw_env
+from utils import Action, Seed, python_rng, seed_sequence
+
+# a policy returns a fixed action index for env.agent_selection
+Policy = Callable[[raw_env, random.Random], int]
+
+
+def random_policy(env: raw_env, rng: random.Random) -> int:
+    """
+    plays a uniformly random legal action
+    """
+    return rng.choice(env.legal_actions(env.players[int(env.agent_selection)]))
+
+
+# the scripted player's preference among its legal actions, lowest target first
+SCRIPTED_ORDER = [
+    Action.COUP,
+    Action.DUKE,
+    Action.NO_CHALLENGE,
+    Action.BLOCK_ASSASSINATION,
+    Action.LET_FOREIGN_AID,
+    Action.LET_STEAL,
+    Action.LOSE_INFLUENCE,
+    Action.AMBASSADOR_EXCHANGE_3,
+    Action.AMBASSADOR_EXCHANGE_4,
+]
+SCRIPTED_RANK = {action: i for i, action in enumerate(SCRIPTED_ORDER)}
+
+
+def scripted_policy(env: raw_env, rng: random.Random) -> int:
+    """
+    a fixed, deterministic strategy: coup when it can, otherwise claim the duke,
+    never challenge and let every reaction through except assassinations
+    """
+    specs = env.action_specs
+    return min(
+        env.legal_actions(env.players[int(env.agent_selection)]),
+        key=lambda a: (SCRIPTED_RANK.get(specs[a].name, len(SCRIPTED_ORDER)), a),
+    )
+
+
+def play_game(
+    env: raw_env, policy: Policy, rng: random.Random, max_steps: int
+) -> Dict[str, np.ndarray]:
+    """
+    plays one game and returns its trajectory: the observation of the player to
+    move, that player and their action at every step, and the winner (-1 if the
+    game was cut off after max_steps)
+    """
+    env.reset_in_place()
+    observations = []
+    players = []
+    actions = []
+    agent_id = env.agent_selection
+    observation = env.observe(agent_id)
+    done = False
+    while not done and len(actions) < max_steps:
+        observations.append(observation.copy())
+        players.append(int(agent_id))
+        action = policy(env, rng)
+        actions.append(action)
+        agent_id, observation, _, _, done, _ = env.step_observe(action)
+
+    winner = -1
+    if env.done:
+        winner = next(
+            i
+            for i, agent in enumerate(env.possible_agents)
+            if not env.terminations[agent]
+        )
+    return {
+        "observations": np.array(observations, dtype=np.int16).reshape(
+            len(actions), 3 * env.player_count
+        ),
+        "players": np.array(players, dtype=np.int8),
+        "actions": np.array(actions, dtype=np.int16),
+        "winner": np.array(winner, dtype=np.int8),
+    }
+
+
+def concatenate(trajectories: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    packs trajectories into flat step arrays, with game_offsets[g] the first step
+    of game g
+    """
+    lengths = [len(trajectory["actions"]) for trajectory in trajectories]
+    return {
+        "observations": np.concatenate([t["observations"] for t in trajectories]),
+        "players": np.concatenate([t["players"] for t in trajectories]),
+        "actions": np.concatenate([t["actions"] for t in trajectories]),
+        "winners": np.array([t["winner"] for t in trajectories], dtype=np.int8),
+        "game_offsets": np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(
+            np.int64
+        ),
+    }
+
+
+def worker(
+    worker_id: int,
+    games: int,
+    queue,
+    player_count: int,
+    policy: Policy,
+    batch_size: int,
+    seed: np.random.SeedSequence,
+    max_steps: int,
+):
+    """
+    plays games and puts ("batch", worker_id, arrays, stats) messages on queue,
+    then ("done", worker_id, None, None). A game that raises is dropped and
+    counted as an error.
+    """
+    policy_seed, env_seed = seed.spawn(2)
+    rng = python_rng(policy_seed)
+    env = raw_env(player_count=player_count, fixed_actions=True)
+    # later games carry on the stream seeded here
+    env.reset(seed=env_seed)
+
+    played = 0
+    while played < games:
+        start = time.perf_counter()
+        trajectories = []
+        errors = 0
+        last_error = None
+        for _ in range(min(batch_size, games - played)):
+            played += 1
+            try:
+                trajectories.append(play_game(env, policy, rng, max_steps))
+            except Exception:
+                errors += 1
+                last_error = traceback.format_exc(limit=3)
+        stats = {
+            "worker": worker_id,
+            "games": len(trajectories),
+            "steps": sum(len(t["actions"]) for t in trajectories),
+            "errors": errors,
+            "last_error": last_error,
+            "seconds": time.perf_counter() - start,
+        }
+        arrays = concatenate(trajectories) if trajectories else None
+        queue.put(("batch", worker_id, arrays, stats))
+    queue.put(("done", worker_id, None, None))
+
+
+def run(
+    output_dir: str,
+    games: int,
+    workers: Optional[int] = None,
+    player_count: int = 2,
+    policy: Policy = random_policy,
+    batch_size: int = 256,
+    seed: Seed = 0,
+    max_steps: int = 1000,
+) -> dict:
+    """
+    Plays games of self-play in worker processes and writes them to
+    output_dir/shard-XXXXX.npz, one shard per batch, with the statistics of every
+    shard and the totals in output_dir/stats.json.
+
+    Args:
+        output_dir (str): The directory the shards are written to.
+        games (int): The total number of games to play.
+        workers (int): The number of worker processes, the number of cores by
+            default.
+        player_count (int): The number of players of each game.
+        policy (Policy): Picks the action of every player; it is sent to the
+            workers, so it must be picklable, e.g. a module level function.
+        batch_size (int): The number of games per batch and shard.
+        seed (int or SeedSequence): Every worker plays with its own child stream
+            of this seed, so a run is reproducible for a given number of workers.
+        max_steps (int): Games are cut off after this many steps.
+
+    Returns:
+        dict: The statistics written to stats.json.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    seeds = seed_sequence(seed).spawn(workers)
+    queue = multiprocessing.Queue()
+    processes = []
+    for i in range(workers):
+        share = games // workers + (i < games % workers)
+        process = multiprocessing.Process(
+            target=worker,
+            args=(
+                i, share, queue, player_count, policy, batch_size, seeds[i], max_steps
+            ),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    start = time.perf_counter()
+    shards = []
+    running = set(range(workers))
+    crashed = []
+    while running:
+        try:
+            kind, worker_id, arrays, stats = queue.get(timeout=1.0)
+        except queue_module.Empty:
+            # a worker that died without saying so would otherwise hang the run
+            for i in list(running):
+                if processes[i].exitcode not in (None, 0):
+                    running.discard(i)
+                    crashed.append(i)
+            continue
+        if kind == "done":
+            running.discard(worker_id)
+            continue
+        if arrays is not None:
+            stats["file"] = f"shard-{len(shards):05d}.npz"
+            np.savez(os.path.join(output_dir, stats["file"]), **arrays)
+        stats["games_per_second"] = stats["games"] / stats["seconds"]
+        shards.append(stats)
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    total_games = sum(shard["games"] for shard in shards)
+    results = {
+        "workers": workers,
+        "player_count": player_count,
+        "games": total_games,
+        "steps": sum(shard["steps"] for shard in shards),
+        "errors": sum(shard["errors"] for shard in shards),
+        "crashed_workers": crashed,
+        "seconds": elapsed,
+        "games_per_second": total_games / elapsed if elapsed > 0 else 0.0,
+        "shards": shards,
+    }
+    with open(os.path.join(output_dir, "stats.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("output_dir")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--player-count", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(
+        args.output_dir,
+        args.games,
+        workers=args.workers,
+        player_count=args.player_count,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    print(
+        f"{results['games']} games, {results['steps']} steps, "
+        f"{results['errors']} errors in {results['seconds']:.1f}s "
+        f"({results['games_per_second']:.0f} games/s) "
+        f"with {results['workers']} workers"
+    )
@@ -0,0 +1,256 @@
+from array import array
+from collections.abc import MutableMapping
+from typing import Iterator, List, Optional, Tuple
+
+
+# Layout of a game record. Every field is one int16 slot; cards are stored as
+# Cards values, seats as player indices and sets of seats as bitmasks. Unset seats
+# hold EMPTY. The center and the deck are unordered, so they are kept as the count
+# of each card. Hands (a player's hidden or visible cards and the ambassador view)
+# are ordered and packed into one slot, see pack_hand.
+EMPTY = -1
+
+STATUS = 0
+TURN_AGENT = 1
+AGENT_SELECTION = 2
+ACTION_TO_CHALLENGE = 3  # Action value of the claim being challenged
+CHALLENGE_TARGET = 4  # target of that claim
+BLOCKING_AGENT = 5
+CHALLENGING_PLAYERS = 6  # bitmask
+BLOCKING_PLAYERS = 7  # bitmask
+TERMINATIONS = 8  # bitmask
+ALIVE_COUNT = 9
+DONE = 10
+VIEW_OWNER = 11  # player looking at the center during an ambassador exchange
+VIEW = 12  # hand
+CENTER = 13  # count of each card, 5 slots
+DECK_SIZE = 18
+DECK = 19  # count of each card, 5 slots
+RESPONDERS = 24  # bitmask of the seats still to answer the reaction window
+PLAYERS = 25  # first player block
+CARD_KINDS = 5
+
+# layout of a player block
+HIDDEN = 0  # hand
+VISIBLE = 1  # hand
+COINS = 2
+PLAYER_SIZE = 3
+
+# A hand holds up to two cards, HAND_BITS bits each as card + 1 with the first
+# card in the low bits, so the empty hand is 0. The tables below are indexed by
+# the packed hand.
+HAND_BITS = 3
+HAND_CODES = 1 << 2 * HAND_BITS
+
+
+def pack_hand(cards: List[int]) -> int:
+    hand = 0
+    for card in reversed(cards):
+        hand = hand << HAND_BITS | card + 1
+    return hand
+
+
+def _unpack_hand(hand: int) -> Tuple[int, ...]:
+    cards = []
+    while hand & (1 << HAND_BITS) - 1:
+        cards.append((hand & (1 << HAND_BITS) - 1) - 1)
+        hand >>= HAND_BITS
+    return tuple(cards)
+
+
+HAND_CARDS = [_unpack_hand(hand) for hand in range(HAND_CODES)]
+HAND_SIZE = [len(cards) for cards in HAND_CARDS]
+# bitmask of the cards in the hand, bit c set if card c is held
+HAND_MASK = [sum({1 << card for card in cards}) for cards in HAND_CARDS]
+
+
+def hand_without(hand: int, index: int) -> int:
+    """
+    returns the hand with the card at index removed
+    """
+    shift = HAND_BITS * index
+    return hand & (1 << shift) - 1 | hand >> shift + HAND_BITS << shift
+
+
+def hand_with(hand: int, card: int) -> int:
+    """
+    returns the hand with card added at the end
+    """
+    return hand | card + 1 << HAND_BITS * HAND_SIZE[hand]
+
+
+class GameState:
+    """
+    The whole state of one game as a fixed-layout int16 record: the global fields
+    above followed by one PLAYER_SIZE block per player, which is about 220 bytes
+    with the object headers for a six player game. raw_env and its Agent objects
+    read and write through it, so a game can be stored or copied without any of
+    the env objects.
+
+    version is bumped on every write of cards or coins, which is all an observation
+    reads, so cached observations know when to refresh.
+    """
+
+    __slots__ = ("player_count", "data", "version")
+
+    def __init__(self, player_count: int, data: Optional[array] = None):
+        self.player_count = player_count
+        self.version = 0
+        if data is None:
+            data = array("h", [EMPTY]) * (PLAYERS + PLAYER_SIZE * player_count)
+            for field in [
+                CHALLENGING_PLAYERS,
+                BLOCKING_PLAYERS,
+                TERMINATIONS,
+                DONE,
+                RESPONDERS,
+            ]:
+                data[field] = 0
+            data[ALIVE_COUNT] = player_count
+            data[VIEW] = 0
+            for i in range(player_count):
+                data[PLAYERS + PLAYER_SIZE * i + HIDDEN] = 0
+                data[PLAYERS + PLAYER_SIZE * i + VISIBLE] = 0
+            data[DECK_SIZE] = 0
+            data[CENTER : CENTER + CARD_KINDS] = array("h", [0] * CARD_KINDS)
+            data[DECK : DECK + CARD_KINDS] = array("h", [0] * CARD_KINDS)
+        self.data = data
+
+    def copy(self) -> "GameState":
+        return GameState(self.player_count, self.data[:])
+
+    def tobytes(self) -> bytes:
+        return self.data.tobytes()
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, GameState) and self.data == other.data
+
+    def __hash__(self) -> int:
+        return hash(self.data.tobytes())
+
+    def player(self, i: int) -> int:
+        """
+        returns the offset of player i's block
+        """
+        return PLAYERS + PLAYER_SIZE * i
+
+    def hand(self, offset: int) -> List[int]:
+        """
+        returns the cards of the hand at offset in order
+        """
+        return list(HAND_CARDS[self.data[offset]])
+
+    def set_hand(self, offset: int, cards: List[int]):
+        assert len(cards) <= 2, "too many cards for a hand"
+        self.data[offset] = pack_hand(cards)
+        self.version += 1
+
+    def hand_size(self, offset: int) -> int:
+        return HAND_SIZE[self.data[offset]]
+
+    def holds(self, offset: int, card: int) -> bool:
+        """
+        whether the hand at offset holds card
+        """
+        return bool(HAND_MASK[self.data[offset]] >> card & 1)
+
+    def counts(self, offset: int) -> List[int]:
+        """
+        returns the count of each card in the count vector at offset
+        """
+        return self.data[offset : offset + CARD_KINDS].tolist()
+
+    def counted_cards(self, offset: int) -> List[int]:
+        """
+        returns the cards of the count vector at offset in card order
+        """
+        data = self.data
+        return [
+            card for card in range(CARD_KINDS) for _ in range(data[offset + card])
+        ]
+
+    def set_counts(self, offset: int, cards: List[int]):
+        """
+        sets the count vector at offset to hold cards
+        """
+        counts = [0] * CARD_KINDS
+        for card in cards:
+            counts[card] += 1
+        self.data[offset : offset + CARD_KINDS] = array("h", counts)
+
+    def seats(self, field: int) -> List[int]:
+        """
+        returns the seats in the bitmask field
+        """
+        mask = self.data[field]
+        return [i for i in range(self.player_count) if mask >> i & 1]
+
+    def set_seats(self, field: int, seats: List[int]):
+        mask = 0
+        for i in seats:
+            mask |= 1 << i
+        self.data[field] = mask
+
+    def add_seat(self, field: int, i: int):
+        self.data[field] |= 1 << i
+
+
+class Snapshot:
+    """
+    a saved raw_env position, see raw_env.snapshot and raw_env.restore. The event log
+    is append-only, so the snapshot only keeps its length.
+    """
+
+    __slots__ = ("data", "rng_state", "event_count")
+
+    def __init__(self, data: array, rng_state, event_count: int):
+        self.data = data
+        self.rng_state = rng_state
+        self.event_count = event_count
+
+
+class SeatFlags(MutableMapping):
+    """
+    dict-like view of a bitmask field keyed by agent id, used for raw_env.terminations.
+    If count is given, that field is kept at the number of seats not flagged and the
+    game is done once it is down to one, as when a player is eliminated.
+    """
+
+    __slots__ = ("game", "field", "agents", "count")
+
+    def __init__(
+        self,
+        game: GameState,
+        field: int,
+        agents: List[str],
+        count: Optional[int] = None,
+    ):
+        self.game = game
+        self.field = field
+        self.agents = agents
+        self.count = count
+
+    def __getitem__(self, agent: str) -> bool:
+        return bool(self.game.data[self.field] >> int(agent) & 1)
+
+    def __setitem__(self, agent: str, value: bool):
+        data = self.game.data
+        bit = 1 << int(agent)
+        if bool(data[self.field] & bit) == bool(value):
+            return
+        data[self.field] ^= bit
+        if self.count is not None:
+            data[self.count] += -1 if value else 1
+            data[DONE] = int(data[self.count] <= 1)
+
+    def __delitem__(self, agent: str):
+        raise TypeError("agents cannot be removed from a game")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.agents)
+
+    def __len__(self) -> int:
+        return len(self.agents)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
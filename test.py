@@ -1,6 +1,32 @@
-from env import raw_env
+from array import array
+import copy
+import os
+import pickle
+import random
+import tempfile
+
+import numpy as np
+
+import state
+import core
+from core import STEP_HANDLERS, CoupCore, TwoPlayerCoupEngine
+import env as coup
+from env import raw_env, BatchCoupEnv, EnvPool
+from history import Event, event_to_string, pack_cards, unpack_cards
+from ismcts import ISMCTSAgent
+import benchmark
+import selfplay
 from pettingzoo.utils import agent_selector, wrappers
-from utils import ActionSpecification, Action, AgentStatus, Cards
+from utils import (
+    ALL_ACTION_SPECS,
+    ActionSpecification,
+    Action,
+    AgentStatus,
+    Cards,
+    action_table,
+    action_index_table,
+    action_columns,
+)
 
 
 def test_init_env():
@@ -207,7 +233,7 @@ def test_assassination_fails_contessa_bluff():
     assert env.done == True
     assert env.players[0].coins == 1
     assert env.players[1].coins == 4
-    assert env.players[1].hidden_cards == []
+    assert env.players[1].hidden_cards == ()
     assert len(env.players[1].visible_cards) == 2
 
 
@@ -382,8 +408,8 @@ def test_assassination_challenge_fails_has_contessa():
 
     assert env.players[0].coins == 0
     assert env.players[1].coins == 3
-    assert env.players[1].hidden_cards == [Cards.CAPTAIN]
-    assert env.players[1].visible_cards == [Cards.CONTESSA]
+    assert env.players[1].hidden_cards == (Cards.CAPTAIN,)
+    assert env.players[1].visible_cards == (Cards.CONTESSA,)
 
 
 def test_assassination_challenge_fails_no_contessa():
@@ -546,8 +572,8 @@ def test_assassination_succeeds_no_challenge():
     assert env.players[0].coins == 0
     assert env.players[1].coins == 3
     assert env.status == AgentStatus.TURN
-    assert env.players[1].hidden_cards == [Cards.CAPTAIN]
-    assert env.players[1].visible_cards == [Cards.AMBASSADOR]
+    assert env.players[1].hidden_cards == (Cards.CAPTAIN,)
+    assert env.players[1].visible_cards == (Cards.AMBASSADOR,)
 
 
 def test_assassination_challenge_succeeds():
@@ -628,8 +654,8 @@ def test_assassination_challenge_succeeds():
     assert env.players[0].coins == 0
     assert env.players[1].coins == 3
     assert env.status == AgentStatus.TURN
-    assert env.players[0].hidden_cards == [Cards.AMBASSADOR]
-    assert env.players[0].visible_cards == [Cards.DUKE]
+    assert env.players[0].hidden_cards == (Cards.AMBASSADOR,)
+    assert env.players[0].visible_cards == (Cards.DUKE,)
 
 
 def test_foreign_aid_succeeds():
@@ -810,8 +836,8 @@ def test_foreign_aid_fails_duke_challenge_fails():
     assert env.status == AgentStatus.TURN
     assert env.players[0].coins == 2
     assert env.players[1].coins == 2
-    assert env.players[0].hidden_cards == [Cards.DUKE]
-    assert env.players[0].visible_cards == [Cards.AMBASSADOR]
+    assert env.players[0].hidden_cards == (Cards.DUKE,)
+    assert env.players[0].visible_cards == (Cards.AMBASSADOR,)
     assert len(env.players[1].hidden_cards) == 2
 
 
@@ -888,8 +914,8 @@ def test_foreign_aid_succeeds_duke_challenge_succeeds():
     assert env.status == AgentStatus.TURN
     assert env.players[0].coins == 4
     assert env.players[1].coins == 2
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.CAPTAIN]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.CAPTAIN,)
     assert len(env.players[0].hidden_cards) == 2
 
 
@@ -1029,8 +1055,8 @@ def test_steal_fails_challenge_success():
     assert env.players[0].coins == 2
     assert env.players[1].coins == 2
 
-    assert env.players[0].hidden_cards == [Cards.DUKE]
-    assert env.players[0].visible_cards == [Cards.AMBASSADOR]
+    assert env.players[0].hidden_cards == (Cards.DUKE,)
+    assert env.players[0].visible_cards == (Cards.AMBASSADOR,)
 
     # player 1 just gets income
     agent = env.players[int(env.agent_selection)]
@@ -1046,8 +1072,8 @@ def test_steal_fails_challenge_success():
     assert env.players[0].coins == 2
     assert env.players[1].coins == 3
 
-    assert env.players[0].hidden_cards == [Cards.DUKE]
-    assert env.players[0].visible_cards == [Cards.AMBASSADOR]
+    assert env.players[0].hidden_cards == (Cards.DUKE,)
+    assert env.players[0].visible_cards == (Cards.AMBASSADOR,)
     assert len(env.players[1].hidden_cards) == 2
 
 
@@ -1109,8 +1135,8 @@ def test_steal_succeeds_challenge_fails():
     assert env.players[0].coins == 4
     assert env.players[1].coins == 0
 
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.DUKE]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.DUKE,)
     assert len(env.players[0].hidden_cards) == 2
 
     # player 1 just gets income
@@ -1127,8 +1153,8 @@ def test_steal_succeeds_challenge_fails():
     assert env.players[0].coins == 4
     assert env.players[1].coins == 1
 
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.DUKE]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.DUKE,)
     assert len(env.players[0].hidden_cards) == 2
 
 
@@ -1324,8 +1350,8 @@ def test_steal_succeeds_ambassador_block_challenge_succeeds():
 
     assert len(env.players[0].hidden_cards) == 2
 
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.DUKE]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.DUKE,)
 
     # player 1 just gets income
     agent = env.players[int(env.agent_selection)]
@@ -1342,8 +1368,8 @@ def test_steal_succeeds_ambassador_block_challenge_succeeds():
     assert env.players[1].coins == 1
 
     assert len(env.players[0].hidden_cards) == 2
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.DUKE]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.DUKE,)
 
 
 def test_steal_succeeds_captain_block_challenge_succeeds():
@@ -1441,8 +1467,8 @@ def test_steal_succeeds_captain_block_challenge_succeeds():
 
     assert len(env.players[0].hidden_cards) == 2
 
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.DUKE]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.DUKE,)
 
     # player 1 just gets income
     agent = env.players[int(env.agent_selection)]
@@ -1459,8 +1485,8 @@ def test_steal_succeeds_captain_block_challenge_succeeds():
     assert env.players[1].coins == 1
 
     assert len(env.players[0].hidden_cards) == 2
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.DUKE]
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.DUKE,)
 
 
 def test_steal_fails_ambassador_block_challenge_fails():
@@ -1556,8 +1582,8 @@ def test_steal_fails_ambassador_block_challenge_fails():
     assert env.players[0].coins == 2
     assert env.players[1].coins == 2
 
-    assert env.players[0].hidden_cards == [Cards.AMBASSADOR]
-    assert env.players[0].visible_cards == [Cards.CAPTAIN]
+    assert env.players[0].hidden_cards == (Cards.AMBASSADOR,)
+    assert env.players[0].visible_cards == (Cards.CAPTAIN,)
 
     # player 1 just gets income
     agent = env.players[int(env.agent_selection)]
@@ -1575,8 +1601,8 @@ def test_steal_fails_ambassador_block_challenge_fails():
 
     assert len(env.players[1].hidden_cards) == 2
 
-    assert env.players[0].hidden_cards == [Cards.AMBASSADOR]
-    assert env.players[0].visible_cards == [Cards.CAPTAIN]
+    assert env.players[0].hidden_cards == (Cards.AMBASSADOR,)
+    assert env.players[0].visible_cards == (Cards.CAPTAIN,)
 
 
 def test_steal_fails_captain_block_challenge_fails():
@@ -1672,8 +1698,8 @@ def test_steal_fails_captain_block_challenge_fails():
     assert env.players[0].coins == 2
     assert env.players[1].coins == 2
 
-    assert env.players[0].hidden_cards == [Cards.AMBASSADOR]
-    assert env.players[0].visible_cards == [Cards.CAPTAIN]
+    assert env.players[0].hidden_cards == (Cards.AMBASSADOR,)
+    assert env.players[0].visible_cards == (Cards.CAPTAIN,)
 
     # player 1 just gets income
     agent = env.players[int(env.agent_selection)]
@@ -1691,8 +1717,8 @@ def test_steal_fails_captain_block_challenge_fails():
 
     assert len(env.players[1].hidden_cards) == 2
 
-    assert env.players[0].hidden_cards == [Cards.AMBASSADOR]
-    assert env.players[0].visible_cards == [Cards.CAPTAIN]
+    assert env.players[0].hidden_cards == (Cards.AMBASSADOR,)
+    assert env.players[0].visible_cards == (Cards.CAPTAIN,)
 
 
 def test_ambassador_succeeds_no_challenge():
@@ -1816,8 +1842,8 @@ def test_ambassador_comprehensive():
     assert env.players[1].coins == 2
 
     assert len(env.players[0].hidden_cards) == 1
-    assert env.players[0].hidden_cards == [Cards.CAPTAIN]
-    assert env.players[0].visible_cards == [Cards.DUKE]
+    assert env.players[0].hidden_cards == (Cards.CAPTAIN,)
+    assert env.players[0].visible_cards == (Cards.DUKE,)
     assert len(env.players[1].hidden_cards) == 2
 
     # player 1 takes income
@@ -1836,8 +1862,8 @@ def test_ambassador_comprehensive():
     assert env.players[1].coins == 3
 
     assert len(env.players[0].hidden_cards) == 1
-    assert env.players[0].hidden_cards == [Cards.CAPTAIN]
-    assert env.players[0].visible_cards == [Cards.DUKE]
+    assert env.players[0].hidden_cards == (Cards.CAPTAIN,)
+    assert env.players[0].visible_cards == (Cards.DUKE,)
     assert len(env.players[1].hidden_cards) == 2
 
     # player 0 ambassadors again (but actually has ambassador because I hacked it)
@@ -1887,9 +1913,9 @@ def test_ambassador_comprehensive():
     assert env.players[1].coins == 3
 
     assert len(env.players[0].hidden_cards) == 1
-    assert env.players[0].visible_cards == [Cards.DUKE]
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.AMBASSADOR]
+    assert env.players[0].visible_cards == (Cards.DUKE,)
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.AMBASSADOR,)
 
     # player 0 exchanges
     agent = env.players[int(env.agent_selection)]
@@ -1905,9 +1931,887 @@ def test_ambassador_comprehensive():
     assert env.players[0].coins == 2
     assert env.players[1].coins == 3
 
-    assert env.players[0].visible_cards == [Cards.DUKE]
-    assert env.players[1].hidden_cards == [Cards.CONTESSA]
-    assert env.players[1].visible_cards == [Cards.AMBASSADOR]
+    assert env.players[0].visible_cards == (Cards.DUKE,)
+    assert env.players[1].hidden_cards == (Cards.CONTESSA,)
+    assert env.players[1].visible_cards == (Cards.AMBASSADOR,)
+
+
+def batch_game_state(env, i=0):
+    # the parts of a game's state that do not depend on how the center was shuffled
+    return (
+        [int(coins) for coins in env.coins[i]],
+        [[int(card) for card in cards if card >= 0] for cards in env.visible_cards[i]],
+        [int((cards >= 0).sum()) for cards in env.hidden_cards[i]],
+        [bool(alive) for alive in env.alive[i]],
+        int(env.status[i]),
+        int(env.turn_agent[i]),
+        int(env.agent_selection[i]),
+        bool(env.done[i]),
+        sorted(
+            [int(card) for card in env.hidden_cards[i].ravel() if card >= 0]
+            + [int(card) for card in env.center[i]]
+        ),
+    )
+
+
+def test_batch_env_matches_raw_env():
+    batch = BatchCoupEnv(1, player_count=2, seed=0, autoreset=False)
+    rng = random.Random(0)
+
+    for game in range(200):
+        env = raw_env(player_count=2)
+        env.reset(seed=game)
+        while not env.done:
+            agent = env.players[int(env.agent_selection)]
+            env.current_actions(agent)
+            action = rng.randrange(len(agent.current_actions))
+            action_spec = agent.current_actions[action]
+
+            batch.load_game(0, env)
+            legal = set(np.nonzero(batch.legal_mask()[0])[0])
+            assert legal == {batch.action_index(spec) for spec in agent.current_actions}
+            observation = [
+                card.value if isinstance(card, Cards) else card
+                for card in env.observe(env.agent_selection)
+            ]
+            assert batch.observe()[0].tolist() == observation
+
+            env.step(action)
+            batch.step(np.array([batch.action_index(action_spec)]))
+
+            assert batch_game_state(batch) == (
+                [player.coins for player in env.players],
+                [[card.value for card in player.visible_cards] for player in env.players],
+                [len(player.hidden_cards) for player in env.players],
+                [not env.terminations[agent] for agent in env.agents],
+                env.status.value,
+                env.turn_agent,
+                int(env.agent_selection),
+                env.done,
+                sorted(
+                    [card.value for player in env.players for card in player.hidden_cards]
+                    + [card.value for card in env.center]
+                ),
+            )
+
+
+def test_batch_env_many_players():
+    rng = np.random.default_rng(0)
+    for player_count in range(2, 7):
+        env = BatchCoupEnv(128, player_count=player_count, seed=player_count)
+        finished = 0
+        for _ in range(300):
+            mask = env.legal_mask()
+            assert mask.any(axis=1).all()
+            actions = np.argmax(rng.random(mask.shape) * mask, axis=1)
+            done, winner = env.step(actions)
+
+            finished += done.sum()
+            assert (winner[done] >= 0).all()
+            cards = (env.hidden_cards >= 0).sum(axis=2) + (env.visible_cards >= 0).sum(
+                axis=2
+            )
+            assert (cards == 2).all()
+            assert (env.alive == (env.hidden_cards[:, :, 0] >= 0)).all()
+            assert env.observe().shape == (128, 3 * player_count)
+        assert finished > 0
+
+
+def test_game_state_record():
+    env = raw_env(render_mode="human", player_count=3)
+    env.reset(seed=42)
+
+    env.players[1].hidden_cards = [Cards.DUKE, Cards.CAPTAIN]
+    env.players[1].coins = 5
+    env.center = [Cards.CONTESSA, Cards.CONTESSA, Cards.ASSASSIN]
+    game = env.game.copy()
+    assert game == env.game
+    assert game.hand(game.player(1) + state.HIDDEN) == [
+        Cards.DUKE.value,
+        Cards.CAPTAIN.value,
+    ]
+    assert game.data[game.player(1) + state.COINS] == 5
+
+    # the players and the env attributes write through to the record
+    env.terminations["2"] = True
+    env.players[1].visible_cards = [Cards.AMBASSADOR]
+    env.players[1].hidden_cards = [Cards.DUKE]
+    assert game != env.game
+    assert env.game.seats(state.TERMINATIONS) == [2]
+    assert env.terminations == {"0": False, "1": False, "2": True}
+    assert env.players[1].visible_cards == (Cards.AMBASSADOR,)
+    assert env.players[1].hidden_cards == (Cards.DUKE,)
+    # the center and the deck are kept as counts and listed in card order
+    assert env.center == (Cards.ASSASSIN, Cards.CONTESSA, Cards.CONTESSA)
+    assert env.center_counts == (0, 1, 0, 2, 0)
+    assert len(env.deck) == sum(env.deck_counts) == 15 - 2 * 3 - 3
+
+    # terminations keep the alive count and done in step, counting player 2 once
+    assert env.alive_count == 2 and not env.done
+    env.terminations["2"] = True
+    assert env.alive_count == 2
+    env.terminations["1"] = True
+    assert env.alive_count == 1 and env.done
+    env.terminations["1"] = False
+    assert env.alive_count == 2 and not env.done
+    assert env.next_alive_agent(0) == 1
+
+
+def test_fixed_action_indices():
+    for player_count in range(2, 7):
+        table = action_table(player_count)
+        indices = action_index_table(player_count)
+        assert len(table) == 24 + 3 * player_count
+        for i, spec in enumerate(table):
+            assert indices[(spec.name, spec.target)] == i
+        assert [table[i].target for i in action_columns(player_count)[Action.COUP]] == list(
+            range(player_count)
+        )
+
+
+def test_fixed_actions_mode():
+    env = raw_env(render_mode="human", player_count=2, fixed_actions=True)
+    env.reset(seed=42)
+
+    env.players[0].hidden_cards = [Cards.ASSASSIN, Cards.AMBASSADOR]
+    env.players[1].hidden_cards = [Cards.DUKE, Cards.DUKE]
+
+    # indices keep their meaning whatever the decision
+    action = env.action_specification_to_index(ActionSpecification(Action.DUKE))
+    assert env.action_specs[action].name == Action.DUKE
+    assert env.action_space(env.players[0]).n == len(env.action_specs)
+    assert env.action_mask()[action]
+    env.step(action)
+
+    assert env.status == AgentStatus.CAN_CHALLENGE
+    assert not env.action_mask()[action]
+    env.step(env.action_specification_to_index(ActionSpecification(Action.CHALLENGE)))
+
+    assert env.agent_selection == "0"
+    assert env.status == AgentStatus.LOSE_INFLUENCE
+    env.step(
+        env.action_specification_to_index(
+            ActionSpecification(Action.LOSE_INFLUENCE, target=1)
+        )
+    )
+    assert env.players[0].hidden_cards == (Cards.ASSASSIN,)
+    assert env.players[0].visible_cards == (Cards.AMBASSADOR,)
+
+    # the mask matches current_actions through a random game
+    rng = random.Random(0)
+    env.reset(seed=0)
+    while not env.done:
+        agent = env.players[int(env.agent_selection)]
+        env.current_actions(agent)
+        mask = env.action_mask(agent)
+        assert set(np.nonzero(mask)[0]) == {
+            env.action_specification_to_index(spec) for spec in agent.current_actions
+        }
+        env.step(rng.choice(np.nonzero(mask)[0]))
+
+
+def test_snapshot_restore():
+    env = raw_env(render_mode="human", player_count=2)
+    env.reset(seed=42)
+
+    def play(seed):
+        rng = random.Random(seed)
+        for _ in range(30):
+            if env.done:
+                break
+            agent = env.players[int(env.agent_selection)]
+            env.current_actions(agent)
+            env.step(rng.randrange(len(agent.current_actions)))
+        return env.game.copy(), env.history
+
+    play(0)
+    snapshot = env.snapshot()
+    game = env.game.copy()
+    history = env.history
+
+    first = play(1)
+    env.restore(snapshot)
+    assert env.game == game
+    assert env.history == history
+
+    # the random number generator is restored too, so the game continues the same way
+    assert play(1) == first
+
+    env.restore(env.snapshot(rng=False))
+    assert env.game == first[0]
+
+    # the decision is prepared again, so current_actions and step_observe's mask
+    # belong to the restored position rather than the one it left
+    env.reset(seed=1)
+    turn = env.snapshot()
+    player = env.players[0]
+    foreign_aid = player.current_actions.index(ActionSpecification(Action.FOREIGN_AID))
+    env.step(foreign_aid)
+    window = env.snapshot()
+    env.restore(turn)
+    assert ActionSpecification(Action.INCOME) in player.current_actions
+    env.restore(window)
+    reactions = {
+        ActionSpecification(Action.BLOCK_FOREIGN_AID),
+        ActionSpecification(Action.LET_FOREIGN_AID),
+    }
+    assert set(env.players[1].current_actions) == reactions
+    env.restore(turn)
+    _, _, mask, _, _, _ = env.step_observe(foreign_aid)
+    assert {env.action_specs[i] for i in np.flatnonzero(mask)} == reactions
+
+
+def test_ismcts_agent():
+    for fixed_actions in [False, True]:
+        env = raw_env(player_count=2, fixed_actions=fixed_actions)
+        env.reset(seed=3)
+        search = ISMCTSAgent(2, simulations=50, seed=0)
+        rng = random.Random(0)
+
+        while not env.done:
+            agent = env.players[int(env.agent_selection)]
+            env.current_actions(agent)
+            if agent.index == 0:
+                hidden_cards = [player.hidden_cards for player in env.players]
+                action = search.choose(env)
+                # searching leaves the game alone
+                assert [player.hidden_cards for player in env.players] == hidden_cards
+                assert search.simulations_per_second > 0
+                assert search.root is not None and search.root.visits >= 50
+            elif fixed_actions:
+                action = rng.choice(env.legal_actions(agent))
+            else:
+                action = rng.randrange(len(agent.current_actions))
+            search.observe(env, action)
+            env.step(action)
+
+
+def test_event_log():
+    env = raw_env(player_count=2)
+    env.reset(seed=11)
+    rng = random.Random(11)
+    exchanges = 0
+    for _ in range(30):
+        env.reset()
+        while not env.done:
+            agent = env.players[int(env.agent_selection)]
+            env.current_actions(agent)
+            env.step(rng.randrange(len(agent.current_actions)))
+        assert env.history.count("\n") == len(env.events)
+        for i in range(len(env.events)):
+            event, actor, target, card, outcome = env.events.event(i)
+            if event != Event.AMBASSADOR_EXCHANGE:
+                continue
+            exchanges += 1
+            public = event_to_string(event, actor, target, card, outcome)
+            assert "potentially exchanging" in public
+            assert public in env.players[1 - actor].history
+            seen = event_to_string(event, actor, target, card, outcome, viewer=actor)
+            assert "sees cards" in seen and seen in env.players[actor].history
+            assert seen not in env.history
+    assert exchanges > 0
+
+    # restoring a snapshot drops the events logged after it
+    env.reset()
+    snapshot = env.snapshot()
+    agent = env.players[int(env.agent_selection)]
+    env.current_actions(agent)
+    env.step(0)
+    assert len(env.events) > 0
+    env.restore(snapshot)
+    assert len(env.events) == 0 and env.history == ""
+
+    assert unpack_cards(pack_cards([4, 0, 2, 3]), 4) == [4, 0, 2, 3]
+
+
+def test_observe_buffers():
+    env = raw_env(player_count=3)
+    env.reset(seed=42)
+    observation = env.observe("1")
+    assert observation.dtype == np.int16 and not observation.flags.writeable
+    assert env.observe("1") is observation
+    hidden = [card.value for card in env.players[1].hidden_cards]
+    assert observation.tolist()[:6] == [-1, -1] + hidden + [-1, -1]
+    assert observation.tolist()[6:] == [2, 2, 2]
+
+    # writing cards or coins refreshes the cached observation
+    env.players[0].visible_cards = [Cards.DUKE]
+    env.players[0].hidden_cards = [Cards.CAPTAIN]
+    env.players[2].coins = 7
+    assert env.observe("1") is observation
+    assert observation.tolist()[:2] == [-1, Cards.DUKE.value]
+    assert observation.tolist()[-1] == 7
+    assert env.observe("0").tolist()[:2] == [Cards.CAPTAIN.value, Cards.DUKE.value]
+
+    # restoring a snapshot also refreshes it
+    env.reset()
+    snapshot = env.snapshot()
+    before = env.observe("0").copy()
+    env.players[0].coins = 5
+    assert env.observe("0")[6] == 5
+    env.restore(snapshot)
+    assert (env.observe("0") == before).all()
+
+
+def test_selfplay():
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = selfplay.run(output_dir, games=20, workers=2, batch_size=4, seed=1)
+        assert results["games"] == 20 and results["errors"] == 0
+        assert len(results["shards"]) == 6
+
+        steps = 0
+        for shard in results["shards"]:
+            arrays = np.load(os.path.join(output_dir, shard["file"]))
+            assert arrays["observations"].shape == (shard["steps"], 6)
+            assert arrays["observations"].dtype == np.int16
+            assert len(arrays["winners"]) == len(arrays["game_offsets"]) == shard["games"]
+            assert set(arrays["winners"].tolist()) <= {0, 1}
+            steps += len(arrays["actions"])
+        assert steps == results["steps"]
+
+
+def test_seeded_reset():
+    def play(env, seed):
+        env.reset(seed=seed)
+        rng = random.Random(0)
+        while not env.done:
+            env.step(rng.choice(env.legal_actions(env.players[int(env.agent_selection)])))
+        return env.history
+
+    # the env's own stream makes games reproducible, whatever the global one does
+    env = raw_env(player_count=2, fixed_actions=True)
+    random.seed(1)
+    history = play(env, 7)
+    state_before = random.getstate()
+    random.seed(2)
+    assert play(raw_env(player_count=2, fixed_actions=True), 7) == history
+    random.seed(1)
+    assert random.getstate() == state_before
+
+    # spawned child streams are reproducible and independent
+    children = env.spawn(3)
+    again = raw_env(player_count=2, fixed_actions=True)
+    again.reset(seed=7)
+    children_again = again.spawn(3)
+    histories = [play(raw_env(player_count=2, fixed_actions=True), c) for c in children]
+    assert histories == [
+        play(raw_env(player_count=2, fixed_actions=True), c) for c in children_again
+    ]
+    assert len(set(histories)) == 3
+
+    batch = BatchCoupEnv(4, seed=children[0])
+    other = BatchCoupEnv(4, seed=children_again[0])
+    assert (batch.hidden_cards == other.hidden_cards).all()
+
+
+def test_benchmark_games():
+    for wrapped in [False, True]:
+        result = benchmark.bench_games(
+            2, "scripted", verbose=True, wrapped=wrapped, games=3, memory_games=1
+        )
+        assert result["finished"] == 3 and result["errors"] == 0
+        assert result["steps_per_second"] > 0 and result["peak_memory_kib"] > 0
+        assert result["mean_game_length"] == result["steps"] / 3
+
+
+def test_step_dispatch_hooks():
+    env = raw_env(player_count=2, fixed_actions=True)
+    env.reset(seed=3)
+    calls = []
+    env.add_step_hook(
+        AgentStatus.TURN,
+        Action.INCOME,
+        pre=lambda env, spec: calls.append(("pre", env.players[0].coins)),
+        post=lambda env, spec: calls.append(("post", env.players[0].coins)),
+    )
+    env.add_step_hook(
+        AgentStatus.TURN, Action.INCOME, post=lambda env, spec: calls.append("outer")
+    )
+    env.step(env.action_indices[(Action.INCOME, None)])
+    assert calls == [("pre", 2), ("post", 3), "outer"]
+
+    # the hooks can be removed
+    env.remove_step_hooks()
+    env.step(env.action_indices[(Action.INCOME, None)])
+    assert len(calls) == 3
+
+    # every action has a handler
+    for spec in env.action_specs:
+        assert any(action == spec.name.value for _, action in STEP_HANDLERS)
+
+
+def test_two_player_engine_matches_general():
+    assert isinstance(raw_env(player_count=2).core, TwoPlayerCoupEngine)
+    codes = raw_env(player_count=2).action_codes
+    # the heads-up engine must play every seeded game exactly like the general one
+    for seed in range(300):
+        general = CoupCore(2, random.Random(seed))
+        heads_up = TwoPlayerCoupEngine(random.Random(seed))
+        general.new_game()
+        heads_up.new_game()
+        rng = random.Random(-seed)
+        while not general.data[state.DONE]:
+            seat = general.data[state.AGENT_SELECTION]
+            legal = general.legal_actions(seat)
+            assert heads_up.legal_actions(seat) == legal
+            action, target = codes[rng.choice(legal)]
+            general.step(action, target)
+            heads_up.step(action, target)
+            assert heads_up.data == general.data
+            assert heads_up.events.data == general.events.data
+        assert heads_up.rng.getstate() == general.rng.getstate()
+
+
+def test_n_player_reaction_windows():
+    env = raw_env(player_count=4, fixed_actions=True)
+    env.reset(seed=42)
+    env.turn_agent = 1
+    env.agent_selection = "1"
+    env.status = AgentStatus.TURN
+    env.terminations["2"] = True
+    env.alive_count = 3
+
+    # every alive player but the turn agent answers, in seat order
+    env.step(env.action_indices[(Action.DUKE, None)])
+    assert env.agent_selection == "0"
+    env.step(env.action_indices[(Action.NO_CHALLENGE, None)])
+    assert env.agent_selection == "3"
+    assert env.action_to_challenge == ActionSpecification(Action.DUKE, None)
+    env.step(env.action_indices[(Action.NO_CHALLENGE, None)])
+    assert env.players[1].coins == 5
+    assert env.agent_selection == "3" and env.status == AgentStatus.TURN
+
+    # a foreign aid is let through only once every responder has let it
+    env.step(env.action_indices[(Action.FOREIGN_AID, None)])
+    assert env.agent_selection == "0"
+    env.step(env.action_indices[(Action.LET_FOREIGN_AID, None)])
+    assert env.agent_selection == "1" and env.status == AgentStatus.CAN_BLOCK_FOREIGN_AID
+    env.step(env.action_indices[(Action.BLOCK_FOREIGN_AID, None)])
+    assert env.blocking_agent == 1 and env.agent_selection == "3"
+    assert env.status == AgentStatus.CAN_CHALLENGE
+    assert env.players[3].coins == 2
+
+    # whole games of every size finish
+    rng = random.Random(0)
+    for player_count in range(3, 7):
+        env = raw_env(player_count=player_count, fixed_actions=True)
+        for seed in range(20):
+            env.reset(seed=seed)
+            while not env.done:
+                env.step(rng.choice(env.action_mask().nonzero()[0]))
+
+
+def test_step_reactions():
+    env = raw_env(player_count=4, fixed_actions=True)
+    env.reset(seed=42)
+    challenge = env.action_indices[(Action.CHALLENGE, None)]
+    no_challenge = env.action_indices[(Action.NO_CHALLENGE, None)]
+    assert env.reaction_agents() == ["0"]
+
+    env.step(env.action_indices[(Action.DUKE, None)])
+    assert env.reaction_agents() == ["1", "2", "3"]
+    observations = env.observe_reactions()
+    assert observations.shape == (3, 12)
+    assert (observations[1] == env.observe("2")).all()
+
+    # answering at once resolves the window like answering one at a time
+    snapshot = env.snapshot()
+    env.step_reactions({"1": no_challenge, "2": challenge, "3": no_challenge})
+    parallel = (env.game.tobytes(), env.history)
+    env.restore(snapshot)
+    for action in [no_challenge, challenge, no_challenge]:
+        env.step(action)
+    assert (env.game.tobytes(), env.history) == parallel
+    assert env.reaction_agents() == [env.agent_selection]
+
+    # every responder must answer
+    env.restore(snapshot)
+    try:
+        env.step_reactions({"1": no_challenge, "2": no_challenge})
+        assert False, "a missing answer must raise"
+    except AssertionError as error:
+        assert "every responder" in str(error)
+
+    # with current_actions, every responder indexes the same reaction list
+    env = raw_env(player_count=3)
+    env.reset(seed=42)
+    env.current_actions(env.players[0])
+    env.step(env.action_specification_to_index(ActionSpecification(Action.FOREIGN_AID)))
+    env.step_reactions({"1": 1, "2": 1})
+    assert env.players[0].coins == 4 and env.agent_selection == "1"
+
+
+def test_step_observe():
+    env = raw_env(player_count=2)
+    env.reset(seed=42)
+    # reset and step set the current actions of the agent to move
+    assert len(env.players[0].current_actions) == 6
+    income = env.action_specification_to_index(ActionSpecification(Action.INCOME))
+
+    agent_id, observation, mask, reward, terminated, truncated = env.step_observe(income)
+    assert agent_id == env.agent_selection == "1"
+    assert (observation == env.observe("1")).all()
+    assert mask.tolist() == env.action_mask().tolist()
+    assert {env.action_specs[i] for i in np.nonzero(mask)[0]} == set(
+        env.players[1].current_actions
+    )
+    assert (reward, terminated, truncated) == (0, False, False)
+
+    # the game ends with the winner rewarded
+    env.reset(seed=42)
+    env.players[1].hidden_cards = [Cards.DUKE]
+    env.players[0].coins = 7
+    env.current_actions(env.players[0])
+    env.step_observe(env.action_specification_to_index(ActionSpecification(Action.COUP, 1)))
+    _, _, mask, reward, terminated, _ = env.step_observe(0)
+    assert terminated and env.done and not mask.any()
+    assert reward == env.rewards["1"] == -1 and env.rewards["0"] == 1
+    assert env._cumulative_rewards == {"0": 1, "1": -1}
+
+
+def test_dict_observations():
+    env = raw_env(player_count=3, dict_observations=True)
+    assert env.fixed_actions
+    # the spaces are fixed and built once
+    space = env.observation_space("0")
+    assert env.observation_space("1") is space
+    assert env.action_space("0") is env.action_space("0")
+    assert env.action_space("0").n == len(env.action_specs)
+
+    rng = np.random.default_rng(0)
+    env.reset(seed=42)
+    while not env.done:
+        observation = env.observe(env.agent_selection)
+        assert space.contains(observation)
+        mask = observation["action_mask"]
+        assert mask.tolist() == env.action_mask().astype(np.int8).tolist()
+        other = str((int(env.agent_selection) + 1) % 3)
+        assert not env.observe(other)["action_mask"].any()
+        env.step(env.action_space(env.agent_selection).sample(mask))
+
+    # plain observations keep their array space
+    env = raw_env(player_count=2)
+    env.reset(seed=42)
+    assert env.observation_space("0").contains(env.observe("0"))
+
+
+def test_card_counts():
+    env = raw_env(player_count=4, fixed_actions=True)
+    env.reset(seed=42)
+    counts = [0] * len(Cards)
+    for player in env.players:
+        for card in player.hidden_cards:
+            counts[card.value] += 1
+    for card in range(len(Cards)):
+        counts[card] += env.center_counts[card] + env.deck_counts[card]
+    assert counts == [3] * len(Cards)
+    assert sum(env.center_counts) == 3 and sum(env.deck_counts) == 15 - 8 - 3
+
+    # draws only take cards that are there
+    env.center = [Cards.DUKE, Cards.DUKE, Cards.DUKE]
+    assert env.core.draw(state.CENTER, 3) == Cards.DUKE.value
+    assert env.center_counts == (0, 0, 0, 0, 2)
+    env.center = [Cards.DUKE, Cards.DUKE, Cards.CAPTAIN]
+
+    # the center keeps three cards through exchanges and challenges, and no card is
+    # made or lost
+    rng = random.Random(0)
+    for seed in range(50):
+        env.reset(seed=seed)
+        while not env.done:
+            env.step(rng.choice(env.legal_actions(env.players[int(env.agent_selection)])))
+            assert sum(env.center_counts) == 3 and min(env.center_counts) >= 0
+            counts = [a + b for a, b in zip(env.center_counts, env.deck_counts)]
+            for player in env.players:
+                for card in player.hidden_cards + player.visible_cards:
+                    counts[card.value] += 1
+            assert counts == [3] * len(Cards)
+
+
+def test_hand_encoding():
+    for cards in [[], [4], [0, 0], [3, 1], [4, 4]]:
+        hand = state.pack_hand(cards)
+        assert list(state.HAND_CARDS[hand]) == cards
+        assert state.HAND_SIZE[hand] == len(cards)
+        for card in range(len(Cards)):
+            assert bool(state.HAND_MASK[hand] >> card & 1) == (card in cards)
+        for index in range(len(cards)):
+            rest = cards[:index] + cards[index + 1 :]
+            assert state.hand_without(hand, index) == state.pack_hand(rest)
+        if len(cards) < 2:
+            assert state.hand_with(hand, 2) == state.pack_hand(cards + [2])
+
+    env = raw_env(player_count=3)
+    env.reset(seed=3)
+    player = env.players[1]
+    player.hidden_cards = [Cards.CONTESSA, Cards.DUKE]
+    assert env.core.holds(1, Cards.DUKE.value)
+    assert not env.core.holds(1, Cards.CAPTAIN.value)
+
+    # losing influence moves the card to the end of the visible hand
+    env.game.data[state.STATUS] = AgentStatus.LOSE_INFLUENCE.value
+    env.game.data[state.AGENT_SELECTION] = 1
+    env.core.step(Action.LOSE_INFLUENCE.value, 0)
+    assert player.hidden_cards == (Cards.DUKE,)
+    assert player.visible_cards == (Cards.CONTESSA,)
+
+    # equal positions have equal records, so the record can key a table
+    copy = env.game.copy()
+    assert copy == env.game and hash(copy) == hash(env.game)
+    copy.set_hand(copy.player(1) + state.HIDDEN, [Cards.CAPTAIN.value])
+    assert copy != env.game
+
+
+def test_seat_tables():
+    next_alive, opponents = core.seat_tables(4)
+    assert core.seat_tables(4)[0] is next_alive
+    assert next_alive[0] == [1, 2, 3, 0]
+    assert next_alive[0b0110] == [3, 3, 3, 0]
+    assert next_alive[0b1110][0] == state.EMPTY
+    assert opponents[0b0100][1] == (0, 3)
+
+    env = raw_env(player_count=4, fixed_actions=True)
+    env.reset(seed=1)
+    env.terminations["2"] = True
+    assert env.next_alive_agent(1) == 3
+    assert env.next_alive_agent(3) == 0
+
+
+def test_exchange_deduplication():
+    env = raw_env(player_count=2, fixed_actions=True)
+    env.reset(seed=0)
+    env.players[0].hidden_cards = [Cards.AMBASSADOR, Cards.CAPTAIN]
+    env.center = [Cards.DUKE, Cards.DUKE, Cards.DUKE]
+    env.step(env.action_specification_to_index(ActionSpecification(Action.AMBASSADOR)))
+    env.step(env.action_specification_to_index(ActionSpecification(Action.NO_CHALLENGE)))
+    assert env.status == AgentStatus.AMBASSADOR_EXCHANGE
+
+    # keeping either duke is the same, so only one of each pair is offered
+    player = env.players[0]
+    specs = [env.action_specs[i] for i in env.legal_actions(player)]
+    cards = player.hidden_cards + player.ambassador_center_view
+    kept = [
+        sorted(cards[i].value for i in env.ambassador_mapping_4[spec.target])
+        for spec in specs
+    ]
+    assert len(specs) == 4
+    assert sorted(map(tuple, kept)) == sorted(set(map(tuple, kept)))
+    assert env.action_mask().sum() == 4
+
+    # an equivalent keep-choice maps to the offered one
+    duplicate = ActionSpecification(Action.AMBASSADOR_EXCHANGE_4, 2)
+    index = env.action_specification_to_index(duplicate)
+    assert env.action_specs[index].target == 1
+    env.step(index)
+    assert sorted(card.value for card in player.hidden_cards) == [
+        Cards.AMBASSADOR.value,
+        Cards.DUKE.value,
+    ]
+
+
+def test_action_specs_interned():
+    spec = ActionSpecification(Action.CAPTAIN, 1)
+    assert spec is ActionSpecification(Action.CAPTAIN, np.int64(1))
+    assert spec != ActionSpecification(Action.CAPTAIN, 2)
+    assert {spec: 1}[ActionSpecification(Action.CAPTAIN, 1)] == 1
+    assert pickle.loads(pickle.dumps(spec)) is spec
+    assert copy.deepcopy(spec) is spec
+    try:
+        spec.target = 2
+        assert False, "specs must be immutable"
+    except AttributeError:
+        pass
+
+    env = raw_env(player_count=3)
+    env.reset(seed=0)
+    agent = env.players[0]
+    env.current_actions(agent)
+    assert all(spec in ALL_ACTION_SPECS for spec in agent.current_actions)
+    assert set(env.action_specs) <= set(ALL_ACTION_SPECS)
+
+
+def test_legal_action_templates():
+    env = raw_env(player_count=3, fixed_actions=True)
+    env.reset(seed=4)
+    core = env.core
+    rng = random.Random(4)
+    for _ in range(300):
+        if env.done:
+            env.reset(seed=rng.randrange(100))
+        seat = int(env.agent_selection)
+        legal = env.legal_actions(env.players[seat])
+        # the shared tuple is the one listing it from scratch would give
+        assert legal == tuple(core._list_legal_actions(seat))
+        assert core.templates[core.decision_context(seat)] is legal
+        assert env.action_mask().nonzero()[0].tolist() == sorted(set(legal))
+        env.step(rng.choice(legal))
+    assert len(core.templates) < 100
+
+    # the batch templates agree with the rules on every context
+    batch = BatchCoupEnv(64, 3, seed=0)
+    for _ in range(40):
+        mask = batch.legal_mask()
+        games = np.arange(batch.num_envs)
+        selection = batch.agent_selection.astype(np.intp)
+        hidden = batch.hidden_cards[games, selection]
+        status = np.where(batch.done, -1, batch.status).astype(np.intp)
+        rules = batch._mask_rules(
+            status,
+            batch.coins[games, selection],
+            batch.alive & (np.arange(3) != selection[:, None]),
+            (hidden >= 0).sum(axis=1),
+        )
+        assert not (mask & ~rules).any()
+        exchange = status == AgentStatus.AMBASSADOR_EXCHANGE.value
+        assert (mask[~exchange] == rules[~exchange]).all()
+        actions = np.array([np.flatnonzero(row)[0] if row.any() else 0 for row in mask])
+        batch.step(actions)
+
+
+def test_reset_in_place():
+    fresh = raw_env(player_count=4, fixed_actions=True)
+    warm = raw_env(player_count=4, fixed_actions=True)
+    warm.reset(seed=1)
+    players, terminations, game = warm.players, warm.terminations, warm.game
+    rng = random.Random(0)
+    for seed in range(20):
+        # play part of a game first, so reset_in_place has something to clear
+        for _ in range(rng.randrange(60)):
+            if warm.done:
+                break
+            warm.step(rng.choice(warm.legal_actions(warm.players[int(warm.agent_selection)])))
+        fresh.reset(seed=seed)
+        warm.reset_in_place(seed=seed)
+        assert warm.players is players and warm.game is game
+        assert warm.terminations is terminations
+        assert warm.game.data == fresh.game.data
+        assert warm.events.data == fresh.events.data == array("h")
+        assert warm.rng.getstate() == fresh.rng.getstate()
+        assert warm.rewards == fresh.rewards
+        assert warm._cumulative_rewards == fresh._cumulative_rewards
+        assert warm.infos == fresh.infos and warm.truncations == fresh.truncations
+        assert (warm.observe("2") == fresh.observe("2")).all()
+        assert warm.players[0].current_actions == fresh.players[0].current_actions
+
+    pool = EnvPool(player_count=3, fixed_actions=True)
+    env = pool.acquire(seed=5)
+    assert len(pool) == 0 and env.player_count == 3
+    pool.release(env)
+    assert pool.acquire(seed=6) is env and len(pool) == 0
+
+
+def test_fast_mode():
+    for fixed_actions in [True, False]:
+        checked = raw_env(player_count=4, fixed_actions=fixed_actions)
+        fast = raw_env(player_count=4, fixed_actions=fixed_actions, fast=True)
+        rng = random.Random(7)
+        for seed in range(30):
+            checked.reset(seed=seed)
+            fast.reset(seed=seed)
+            while not checked.done:
+                legal = checked.legal_actions(checked.players[int(checked.agent_selection)])
+                choice = rng.randrange(len(legal))
+                action = legal[choice] if fixed_actions else choice
+                agents = checked.reaction_agents()
+                if len(agents) > 1 and seed % 2:
+                    # answer some windows at once, the same answer from everyone
+                    checked.step_reactions({agent_id: action for agent_id in agents})
+                    fast.step_reactions({agent_id: action for agent_id in agents})
+                else:
+                    checked.step(action)
+                    fast.step(action)
+                assert fast.game.data == checked.game.data
+            assert fast.events.data == checked.events.data
+            assert fast._cumulative_rewards == checked._cumulative_rewards
+
+    env = raw_env(player_count=3, fixed_actions=True, fast=True)
+    env.reset(seed=0)
+    illegal = env.action_indices[(Action.COUP, 1)]
+    for action in [illegal, -1, len(env.action_specs)]:
+        try:
+            env.step(action)
+            assert False, "illegal actions must raise"
+        except ValueError:
+            pass
+    try:
+        env.step_reactions({})
+        assert False, "missing responders must raise"
+    except ValueError:
+        pass
+
+    # restoring prepares the restored decision, so the check follows it
+    env.reset(seed=0)
+    turn = env.snapshot()
+    env.step(env.action_indices[(Action.FOREIGN_AID, None)])
+    env.restore(turn)
+    try:
+        env.step(env.action_indices[(Action.LET_FOREIGN_AID, None)])
+        assert False, "actions of the decision left by restore must raise"
+    except ValueError:
+        pass
+    env.step(env.action_indices[(Action.INCOME, None)])
+    assert env.status == AgentStatus.TURN and env.agent_selection == "1"
+
+    # the fast check stands in for env()'s out of bounds wrapper, but the order
+    # enforcing wrapper stays
+    fast_env = coup.env(player_count=3, fast=True)
+    assert isinstance(fast_env, wrappers.OrderEnforcingWrapper)
+    assert isinstance(fast_env.env, raw_env)
+    try:
+        fast_env.observe("0")
+        assert False, "observing before reset must raise"
+    except AssertionError as error:
+        assert "reset() needs to be called" in str(error)
+
+
+def test_ismcts_private_log():
+    env = raw_env(player_count=2, fixed_actions=True)
+    env.reset(seed=12)
+    rng = random.Random(12)
+    while len(env.events) < 30 and not env.done:
+        env.step(rng.choice(env.legal_actions(env.players[int(env.agent_selection)])))
+    assert not env.done
+
+    search = ISMCTSAgent(2, simulations=30, rollout_depth=1, seed=0)
+    search.choose(env)
+    # the private log holds the last short simulation only, not the real game's
+    # length of events left over from earlier simulations
+    assert len(search.env.events) < 20
+
+    def totals(game):
+        cards = game.counted_cards(state.CENTER) + game.counted_cards(state.DECK)
+        for p in range(2):
+            cards += game.hand(game.player(p) + state.HIDDEN)
+        return sorted(cards)
+
+    search.env.restore(env.snapshot(rng=False))
+    for _ in range(20):
+        search.determinize(0)
+        # the deal moves the unseen cards around without adding or losing any
+        assert totals(search.env.game) == totals(env.game)
+        assert search.env.players[0].hidden_cards == env.players[0].hidden_cards
+
+    def holds_view(game):
+        center = game.counts(state.CENTER)
+        for card in game.hand(state.VIEW):
+            center[card] -= 1
+        return min(center) >= 0
+
+    # another player's view is stale and dealt again from the new center, player's
+    # own view during an exchange stays as it is
+    data = search.env.game.data
+    for owner, status in [(1, core.TURN), (0, core.AMBASSADOR_EXCHANGE)]:
+        search.env.restore(env.snapshot(rng=False))
+        view = search.env.game.counted_cards(state.CENTER)[:2]
+        data[state.VIEW_OWNER] = owner
+        data[state.STATUS] = status
+        search.env.game.set_hand(state.VIEW, view)
+        for _ in range(20):
+            search.determinize(0)
+            assert totals(search.env.game) == totals(env.game)
+            assert holds_view(search.env.game)
+            if owner == 0:
+                assert search.env.game.hand(state.VIEW) == view
 
 
 test_steal_succeeds_challenge_fails()
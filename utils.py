@@ -1,8 +1,11 @@
-from dataclasses import dataclass
-from typing import Optional
+import functools
+import random
+from typing import Dict, List, Optional, Tuple, Union
 from enum import Enum
 from itertools import combinations
 
+import numpy as np
+
 
 class Action(Enum):
     # Coup card turn actions
@@ -67,13 +70,39 @@ SPECIFY_OPPONENT = {
 }
 
 
-@dataclass
 class ActionSpecification:
-    """specifies an action for a coup player - the name of action, and the player it is targeting if not fully specified"""
+    """specifies an action for a coup player - the name of action, and the player it is targeting if not fully specified
+
+    Specs are interned: constructing the same (name, target) pair again returns the
+    same immutable object, so equality is identity and specs can key dicts.
+    """
+
+    __slots__ = ("name", "target")
+    name: Action
+    target: Optional[int]  # if None, then the action is fully specified. target is between 0-5 for
+
+    def __new__(cls, name: Action, target: Optional[int] = None):
+        key = (name, target)
+        spec = _SPECS.get(key)
+        if spec is None:
+            spec = object.__new__(cls)
+            object.__setattr__(spec, "name", name)
+            object.__setattr__(spec, "target", None if target is None else int(target))
+            _SPECS[key] = spec
+        return spec
+
+    def __setattr__(self, attribute: str, value):
+        raise AttributeError("ActionSpecification is immutable")
+
+    def __reduce__(self):
+        # unpickling and copying construct the spec again, which finds the interned one
+        return ActionSpecification, (self.name, self.target)
+
+    def __repr__(self) -> str:
+        return f"ActionSpecification({self.name}, {self.target})"
+
 
-    def __init__(self, name: Action, target: Optional[int] = None):
-        self.name = name
-        self.target = target  # if None, then the action is fully specified. target is between 0-5 for
+_SPECS: Dict[Tuple[Action, Optional[int]], ActionSpecification] = {}
 
 
 class AgentStatus(Enum):
@@ -128,3 +157,79 @@ def map_combinations(n, r):
     numbers = range(n)
     combinations_list = list(combinations(numbers, r))
     return combinations_list
+
+
+@functools.lru_cache(maxsize=None)
+def action_table(player_count: int) -> Tuple[ActionSpecification, ...]:
+    """
+    Enumerates every (Action, target) pair of a game with player_count players, in
+    Action order and then target order. The position of a pair in this table is its
+    fixed action index.
+
+    Args:
+        player_count (int): The number of players.
+
+    Returns:
+        tuple: The ActionSpecification of every action index.
+    """
+    table = []
+    for action in Action:
+        if action == Action.AMBASSADOR_EXCHANGE_3:
+            targets = range(len(map_combinations(3, 1)))
+        elif action == Action.AMBASSADOR_EXCHANGE_4:
+            targets = range(len(map_combinations(4, 2)))
+        elif IS_FULLY_SPECIFIED[action]:
+            targets = [None]
+        elif SPECIFY_OPPONENT[action]:
+            targets = range(player_count)
+        else:
+            targets = range(2)  # index of the hidden card
+        for target in targets:
+            table.append(ActionSpecification(action, target))
+    return tuple(table)
+
+
+@functools.lru_cache(maxsize=None)
+def action_index_table(player_count: int) -> Dict[Tuple[Action, Optional[int]], int]:
+    """
+    Maps every (Action, target) pair to its index in action_table(player_count).
+    """
+    return {
+        (spec.name, spec.target): i for i, spec in enumerate(action_table(player_count))
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def action_columns(player_count: int) -> Dict[Action, Tuple[int, ...]]:
+    """
+    Maps every Action to the indices of its targets in action_table(player_count).
+    """
+    columns: Dict[Action, List[int]] = {action: [] for action in Action}
+    for i, spec in enumerate(action_table(player_count)):
+        columns[spec.name].append(i)
+    return {action: tuple(indices) for action, indices in columns.items()}
+
+
+# every spec of a six player game, which includes the specs of smaller games, so
+# the specs are allocated once at import
+ALL_ACTION_SPECS = action_table(6)
+
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+def seed_sequence(seed: Seed) -> np.random.SeedSequence:
+    """
+    Turns a seed into a SeedSequence, whose spawn() gives independent child streams
+    for the envs of a batch or the workers of a run. None draws fresh entropy.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def python_rng(sequence: np.random.SeedSequence) -> random.Random:
+    """
+    returns a random.Random seeded with 128 bits of the sequence
+    """
+    return random.Random(int.from_bytes(sequence.generate_state(4).tobytes(), "little"))